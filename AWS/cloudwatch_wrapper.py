@@ -1,22 +1,46 @@
-import os
-from dotenv import load_dotenv
 import boto3
-from mypy_boto3_cloudwatch import CloudWatchClient
+from typing import TYPE_CHECKING
 from datetime import datetime, timedelta
 
+from shared.config import get_config
+from AWS.instrumentation import instrument_client
+from shared.types.metric_point import (
+    Metric_Point,
+    METRICS,
+    CPU,
+    NETWORK_IN,
+    NETWORK_OUT,
+    DISK_READ,
+    DISK_WRITE,
+    CPU_CREDIT_BALANCE,
+)
 
-load_dotenv(override=True)
+if TYPE_CHECKING:
+    from mypy_boto3_cloudwatch import CloudWatchClient
+
+
+# shared metric name -> (CloudWatch metric name, statistic)
+CLOUDWATCH_METRICS = {
+    CPU: ("CPUUtilization", "Average"),
+    NETWORK_IN: ("NetworkIn", "Sum"),
+    NETWORK_OUT: ("NetworkOut", "Sum"),
+    DISK_READ: ("EBSReadBytes", "Sum"),
+    DISK_WRITE: ("EBSWriteBytes", "Sum"),
+    CPU_CREDIT_BALANCE: ("CPUCreditBalance", "Average"),
+}
+# GetMetricData accepts at most 500 queries per request.
+MAX_METRIC_DATA_QUERIES = 500
 
 
 class Cloudwatch_Wrapper:
-    def __init__(self, cloudwatch: CloudWatchClient):
+    def __init__(self, cloudwatch: "CloudWatchClient"):
         """
         Initializes the Cloudwatch wrapper.
 
         :param ce: A Boto3 Cloudwatch client. This client provides low-level
                     access to AWS Cloudwatch services.
         """
-        self.cloudwatch = cloudwatch
+        self.cloudwatch = instrument_client(cloudwatch)
 
     def get_metrics(
         self,
@@ -51,10 +75,85 @@ class Cloudwatch_Wrapper:
 
         return metrics_data
 
+    def get_metric_data(
+        self,
+        instance_ids: list[str],
+        start_time: datetime,
+        end_time: datetime,
+        metrics: list[str] = METRICS,
+        period: int = 300,
+    ) -> list[Metric_Point]:
+        """
+        Fetches many metrics for many EC2 instances with GetMetricData, which
+        takes up to 500 (instance, metric) queries per request instead of one
+        get_metric_statistics call per instance per metric.
+
+        :param instance_ids: the instance ids of the EC2 instances.
+        :param start_time: the start of the metrics.
+        :param end_time: the end of the metrics.
+        :param metrics: the shared metric names to fetch (see shared.types.metric_point).
+        :param period: the granularity of the datapoints in seconds.
+        :return: the datapoints of every instance and metric.
+        """
+        queries: dict[str, tuple[str, str]] = {}
+        metric_data_queries = []
+        for instance_id in instance_ids:
+            for metric in metrics:
+                metric_name, statistic = CLOUDWATCH_METRICS[metric]
+                # query ids must start with a lowercase letter.
+                query_id = f"m{len(metric_data_queries)}"
+                queries[query_id] = (instance_id, metric)
+                metric_data_queries.append(
+                    {
+                        "Id": query_id,
+                        "MetricStat": {
+                            "Metric": {
+                                "Namespace": "AWS/EC2",
+                                "MetricName": metric_name,
+                                "Dimensions": [
+                                    {"Name": "InstanceId", "Value": instance_id}
+                                ],
+                            },
+                            "Period": period,
+                            "Stat": statistic,
+                        },
+                        "ReturnData": True,
+                    }
+                )
+
+        metric_points: list[Metric_Point] = []
+        paginator = self.cloudwatch.get_paginator("get_metric_data")
+        for offset in range(0, len(metric_data_queries), MAX_METRIC_DATA_QUERIES):
+            for page in paginator.paginate(
+                MetricDataQueries=metric_data_queries[
+                    offset : offset + MAX_METRIC_DATA_QUERIES
+                ],  # type: ignore
+                StartTime=start_time,
+                EndTime=end_time,
+                ScanBy="TimestampAscending",
+            ):
+                for result in page.get("MetricDataResults", []):
+                    instance_id, metric = queries[result.get("Id", "")]
+                    for timestamp, value in zip(
+                        result.get("Timestamps", []), result.get("Values", [])
+                    ):
+                        metric_points.append(
+                            Metric_Point(
+                                provider="AWS",
+                                resource=instance_id,
+                                metric=metric,
+                                timestamp=timestamp,
+                                value=value,
+                            )
+                        )
+
+        return metric_points
+
 
 if __name__ == "__main__":
+    config = get_config()
     cloudwatch = Cloudwatch_Wrapper(boto3.client("cloudwatch"))
-    instance_id = os.getenv("aws_instance_id")
+    instance_id = config.aws_instance_id
 
     if instance_id:
         end_time = datetime.today().replace(hour=0, minute=0, second=0, microsecond=0)
@@ -1,5 +1,8 @@
 import boto3
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+
+from AWS.instrumentation import instrument_client
+from shared.types.cost_record import Cost_Record
 
 
 class Cost_Explorer_Wrapper:
@@ -10,7 +13,7 @@ class Cost_Explorer_Wrapper:
         :param ce: A Boto3 CE client. This client provides low-level
                     access to AWS CE services.
         """
-        self.ce = boto3.client("ce")
+        self.ce = instrument_client(boto3.client("ce"))
 
     def get_cost(
         self,
@@ -19,44 +22,79 @@ class Cost_Explorer_Wrapper:
         end_time: datetime,
     ) -> float:
         """
-        Fetches the cost and hourly usage of the EC2 instance.
-        Granularity is set daily.
+        Fetches the total cost of the EC2 instance over the whole time period.
 
         :param start_time: string format of the start date.
         :param end_time: string format of the end date.
 
-        :return: A dictionary with the total cost, total hourly usage, and cost/usasge by day
+        :return: the total cost of every hour and usage type in the time period.
         """
-        response = self.ce.get_cost_and_usage(
-            TimePeriod={
+        cost_records = self.get_hourly_costs(
+            instance_name=instance_name, start_time=start_time, end_time=end_time
+        )
+        return sum(record.amount for record in cost_records)
+
+    def get_hourly_costs(
+        self,
+        instance_name: str,
+        start_time: datetime,
+        end_time: datetime,
+    ) -> list[Cost_Record]:
+        """
+        Fetches the hourly cost of the EC2 instance per usage type. Pages
+        through every NextPageToken, since Cost Explorer splits long windows
+        across pages. Hourly data is only kept for the last 14 days.
+
+        :param instance_name: the NAME tag of the EC2 instance.
+        :param start_time: the start of the time period.
+        :param end_time: the end of the time period.
+
+        :return: the cost of every hour and usage type in the time period.
+        """
+        request = {
+            "TimePeriod": {
                 "Start": start_time.strftime("%Y-%m-%dT%H:%M:%SZ"),
                 "End": end_time.strftime("%Y-%m-%dT%H:%M:%SZ"),
             },
-            Granularity="HOURLY",
-            Metrics=["UnblendedCost"],
-            Filter={
+            "Granularity": "HOURLY",
+            "Metrics": ["UnblendedCost"],
+            "Filter": {
                 "Tags": {"Key": "NAME", "Values": [instance_name]},
             },
-            GroupBy=[{"Type": "DIMENSION", "Key": "USAGE_TYPE"}],
-        )
-
-        print(response)
+            "GroupBy": [{"Type": "DIMENSION", "Key": "USAGE_TYPE"}],
+        }
 
-        total_cost = 0
+        cost_records: list[Cost_Record] = []
+        while True:
+            response = self.ce.get_cost_and_usage(**request)  # type: ignore
 
-        for group in response["ResultsByTime"][0]["Groups"]:
-            usage_type = group["Keys"][0]
-            cost = group["Metrics"]["UnblendedCost"]["Amount"]
-            total_cost += float(cost)
+            for result in response["ResultsByTime"]:
+                hour = datetime.strptime(
+                    result["TimePeriod"]["Start"], "%Y-%m-%dT%H:%M:%SZ"
+                ).replace(tzinfo=timezone.utc)
+                for group in result.get("Groups", []):
+                    cost_records.append(
+                        Cost_Record(
+                            provider="AWS",
+                            resource=instance_name,
+                            usage_type=group["Keys"][0],
+                            hour=hour,
+                            amount=float(group["Metrics"]["UnblendedCost"]["Amount"]),
+                            estimated=result.get("Estimated", False),
+                        )
+                    )
 
-        return total_cost
+            next_page_token = response.get("NextPageToken")
+            if not next_page_token:
+                return cost_records
+            request["NextPageToken"] = next_page_token
 
 
 if __name__ == "__main__":
     ce = Cost_Explorer_Wrapper()
     print(
         ce.get_cost(
-            start_time=datetime.now() - timedelta(days=30),
+            start_time=datetime.now() - timedelta(days=14),
             end_time=datetime.now(),
             instance_name="COS IW Free Tier",
         )
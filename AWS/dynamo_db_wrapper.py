@@ -1,7 +1,13 @@
+import time
 import boto3
-from boto3.dynamodb.types import TypeSerializer
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
 from typing import Any
 
+from AWS.instrumentation import instrument_client
+
+# BatchGetItem reads at most 100 keys per request.
+MAX_BATCH_GET_KEYS = 100
+
 class DynamoDB_Wrapper:
     def __init__(self, table_name: str, partition_key: str):
         """
@@ -10,7 +16,7 @@ class DynamoDB_Wrapper:
         :param table_name: The name of the table to insert the item.
         :param partition_key: The partition key for the table.
         """
-        self.dynamo_db = boto3.client("dynamodb")
+        self.dynamo_db = instrument_client(boto3.client("dynamodb"))
         self.table_name = table_name
         self.partition_key = partition_key
 
@@ -39,25 +45,54 @@ class DynamoDB_Wrapper:
             if response["ResponseMetadata"].get("HTTPStatusCode") != 200:
                 raise Exception(f"Failed to upload item for ID {id}")
 
-            prev_id = self.get_latest_id()
-            if prev_id < int(item['id']):
-                # this makes it easier to keep track of the latest item
-                self.dynamo_db.put_item(
-                    TableName=self.table_name,
-                    Item={
-                        'id': {
-                            'S': 'latest_id',
-                        },
-                        'latest': {
-                            'S': item['id']
-                        }
-                    },
-                )
+            self.update_latest_id(int(item['id']))
             return response
         except Exception as ex:
             print(ex)
             raise ex
 
+    def update_latest_id(self, id: int):
+        """
+        Records id as the latest item if it is newer than the current one.
+
+        :param id: the value of the partition_key of the newest item.
+        """
+        prev_id = self.get_latest_id()
+        if prev_id < id:
+            # this makes it easier to keep track of the latest item
+            self.dynamo_db.put_item(
+                TableName=self.table_name,
+                Item={
+                    'id': {
+                        'S': 'latest_id',
+                    },
+                    'latest': {
+                        'S': str(id)
+                    }
+                },
+            )
+
+    def append_to_list(self, key: str, attribute: str, values: list[Any]):
+        """
+        Appends the values to a list attribute of an item in one UpdateItem,
+        creating the item or the list if they do not exist yet.
+
+        :param key: The key of the item to update.
+        :param attribute: The name of the list attribute.
+        :param values: The values to append.
+        """
+        serializer = TypeSerializer()
+        self.dynamo_db.update_item(
+            TableName=self.table_name,
+            Key={self.partition_key: {'S': key}},
+            UpdateExpression="SET #list = list_append(if_not_exists(#list, :empty), :values)",
+            ExpressionAttributeNames={"#list": attribute},
+            ExpressionAttributeValues={
+                ":empty": {"L": []},
+                ":values": serializer.serialize(values),
+            },
+        )
+
     def get_latest_id(self) -> int:
         try:
             response = self.get_item(key="latest_id")
@@ -89,6 +124,39 @@ class DynamoDB_Wrapper:
         """
         return self.dynamo_db.get_item(TableName=self.table_name, Key={self.partition_key: {'S': key}})
 
+    def get_items(self, keys: list[str]) -> list[dict[str, Any]]:
+        """
+        Retrieves many items with batched reads, retrying keys DynamoDB left
+        unprocessed. Missing keys are skipped.
+
+        :param keys: the keys of the items to retrieve.
+        :returns: the retrieved items, deserialized to plain Python values.
+        """
+        deserializer = TypeDeserializer()
+        items: list[dict[str, Any]] = []
+        for i in range(0, len(keys), MAX_BATCH_GET_KEYS):
+            request_items: Any = {
+                self.table_name: {
+                    "Keys": [
+                        {self.partition_key: {"S": key}}
+                        for key in keys[i : i + MAX_BATCH_GET_KEYS]
+                    ]
+                }
+            }
+            attempt = 0
+            while request_items:
+                if attempt:
+                    # unprocessed keys mean the table is throttled, back off.
+                    time.sleep(min(0.05 * 2**attempt, 2.0))
+                attempt += 1
+                response = self.dynamo_db.batch_get_item(RequestItems=request_items)
+                for item in response.get("Responses", {}).get(self.table_name, []):
+                    items.append(
+                        {key: deserializer.deserialize(val) for key, val in item.items()}
+                    )
+                request_items = response.get("UnprocessedKeys")
+        return items
+
 
 if __name__ == "__main__":
     dynamo_db = DynamoDB_Wrapper('wikipedia_table', 'id')
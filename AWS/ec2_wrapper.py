@@ -1,23 +1,33 @@
-import os
-from dotenv import load_dotenv
 import logging
 import boto3
+import threading
+from functools import cached_property
 from datetime import datetime, timezone
-from mypy_boto3_ec2.literals import InstanceTypeType
+from typing import TYPE_CHECKING
 from botocore.exceptions import ClientError
+from shared.config import get_config
+from AWS.instrumentation import instrument_client
 from AWS.ssm_wrapper import SSM_Wrapper
+from AWS.instance_metadata_cache import Instance_Metadata_Cache
+from AWS.spot_price_scanner import Spot_Price_Scanner, PRODUCT_DESCRIPTION
 
 from shared.virtual_machine import Virtual_Machine
 from shared.types.spot_price import Spot_Price
+from shared.types.instance_shape import Instance_Shape
+
+if TYPE_CHECKING:
+    from mypy_boto3_ec2.literals import InstanceTypeType
+    from shared.instance_catalog import Instance_Catalog
 
 
 logger = logging.getLogger(__name__)
-load_dotenv(override=True)
 
 MiB_MULTIPLIER = 1024
 
 
 class EC2_Wrapper(Virtual_Machine):
+    provider_name = "AWS"
+
     def __init__(self):
         """
         Initializes the EC2 instance.
@@ -25,7 +35,11 @@ class EC2_Wrapper(Virtual_Machine):
         :param ec2: A Boto3 EC2 client. This client provides low-level
                     access to AWS EC2 services.
         """
-        self.ec2 = boto3.client("ec2")
+        self.ec2 = instrument_client(boto3.client("ec2"))
+        self.spot_price_scanner = Spot_Price_Scanner()
+        self.instance_cache = Instance_Metadata_Cache(self.ec2)
+        # one shared SSM client, boto3 clients are thread safe but creating them is not.
+        self.ssm = SSM_Wrapper()
 
     def start_instance(self, instance_id: str):
         """
@@ -47,6 +61,8 @@ class EC2_Wrapper(Virtual_Machine):
             response = self.ec2.start_instances(InstanceIds=[instance_id], DryRun=False)
         except ClientError as e:
             print(e)
+        finally:
+            self.instance_cache.invalidate(instance_id)
 
     def stop_instance(self, instance_id: str):
         """
@@ -69,51 +85,105 @@ class EC2_Wrapper(Virtual_Machine):
             # print(response)
         except ClientError as e:
             print(e)
+        finally:
+            self.instance_cache.invalidate(instance_id)
 
     def get_instance_state(self, instance_id: str) -> str:
         response = self.ec2.describe_instances(InstanceIds=[instance_id])
         return response["Reservations"][0]["Instances"][0]["State"]["Name"]
 
-    def find_matching_instance_types(self, vcpus: int, memory: int) -> list[str]:
+    @cached_property
+    def instance_catalog(self) -> "Instance_Catalog":
+        """
+        The catalog of the EC2 instance types offered in the client's region,
+        persisted per provider and re-listed once it is older than its TTL.
+        """
+        from shared.instance_catalog import Instance_Catalog, get_catalog_path
+
+        return Instance_Catalog(
+            providers=[self], path=get_catalog_path(self.provider_name)
+        )
+
+    def find_matching_instance_types(
+        self, vcpus: int, memory: int, region: str | None = None
+    ) -> list[str]:
         """
         Finds all instance types that matches the vCPUS and memory.
 
         :param vcpus: the amount of vCPUs that each instance must match.
         :param memory: the amount of memory (GiB) that each instance must match
+        :param region: the region each instance must be offered in. Defaults
+            to the region of the client.
         :returns: list of all EC2 instance types that matches the vCPUs and memory.
         """
+        shapes = self.instance_catalog.find(
+            vcpus=vcpus,
+            memory=memory,
+            provider=self.provider_name,
+            region=region or self.ec2.meta.region_name,
+        )
+        return [shape.name for shape in shapes]
 
-        # Paginate through all instance types
-        paginator = self.ec2.get_paginator("describe_instance_types")
-        page_iterator = paginator.paginate()
-
-        matching_instance_types: list[str] = []
+    def list_instance_shapes(
+        self, regions: list[str] | None = None
+    ) -> list[Instance_Shape]:
+        """
+        Describes every EC2 instance type (vCPUs, memory, GPUs and spot support)
+        along with the regions that offer it. Used to fill the Instance_Catalog.
 
-        for page in page_iterator:
+        :param regions: the regions to check availability in. Defaults to the
+            region of the client.
+        :returns: list of all EC2 instance shapes.
+        """
+        if not regions:
+            regions = [self.ec2.meta.region_name]
+
+        offered_regions: dict[str, list[str]] = {}
+        for region in regions:
+            client = (
+                self.ec2
+                if region == self.ec2.meta.region_name
+                else instrument_client(boto3.client("ec2", region_name=region))
+            )
+            paginator = client.get_paginator("describe_instance_type_offerings")
+            for page in paginator.paginate(LocationType="region"):
+                for offering in page["InstanceTypeOfferings"]:
+                    instance_type = offering.get("InstanceType")
+                    if instance_type:
+                        offered_regions.setdefault(instance_type, []).append(region)
+
+        shapes: list[Instance_Shape] = []
+        paginator = self.ec2.get_paginator("describe_instance_types")
+        for page in paginator.paginate():
             for instance in page["InstanceTypes"]:
+                instance_type = instance.get("InstanceType")
                 instance_vcpus = instance.get("VCpuInfo", {}).get("DefaultVCpus")
-                if instance_vcpus is None:
+                memory_mib = instance.get("MemoryInfo", {}).get("SizeInMiB")
+                if not instance_type or instance_vcpus is None or memory_mib is None:
                     continue
-                memory_info = instance.get("MemoryInfo")
-                if memory_info and "SizeInMiB" in memory_info:
-                    memory_mib = memory_info["SizeInMiB"]
-
-                    if (
-                        instance_vcpus == vcpus
-                        and memory_mib == memory * MiB_MULTIPLIER
-                    ):
-                        instance_type = instance.get("InstanceType")
-                        supports_spot = "spot" in instance.get(
-                            "SupportedUsageClasses", []
-                        )
-                        if instance_type and supports_spot:
-                            matching_instance_types.append(instance_type)
-
-        return matching_instance_types
+
+                gpus = sum(
+                    gpu.get("Count", 0)
+                    for gpu in instance.get("GpuInfo", {}).get("Gpus", [])
+                )
+                shapes.append(
+                    Instance_Shape(
+                        provider=self.provider_name,
+                        name=instance_type,
+                        vcpus=instance_vcpus,
+                        memory_mib=memory_mib,
+                        gpus=gpus,
+                        supports_spot="spot"
+                        in instance.get("SupportedUsageClasses", []),
+                        regions=offered_regions.get(instance_type, []),
+                    )
+                )
+
+        return shapes
 
     def get_spot_price(
         self,
-        vm_type: str | InstanceTypeType | None = None,
+        vm_type: "str | InstanceTypeType | None" = None,
         vm_name: str | None = None,
         region: str | None = None,
     ) -> Spot_Price | None:
@@ -121,68 +191,70 @@ class EC2_Wrapper(Virtual_Machine):
         Describes the current spot price for the particular EC2 instance
 
         :param vm_type: The EC2 instance type to fetch the spot price.
-        :param region: the availability zone of the EC2 instance.
+        :param vm_name: the instance ID or Name tag of an instance, used to look up
+            its instance type and availability zone.
+        :param region: the availability zone of the EC2 instance. Defaults to
+            the cheapest availability zone in the client's region.
         :returns: current spot price of the EC2 instance for that particular region
         """
 
-        start_time = end_time = datetime.now()
-
-        response = None
+        start_time = end_time = datetime.now(timezone.utc)
 
         if vm_name:
-            instances = self.ec2.describe_instances(
-                Filters=[{"Name": "tag:Name", "Values": [vm_name]}]
-            )
+            # Get the instance type and AZ, pinning the price to the instance's AZ
+            instance_info = self.instance_cache.get(vm_name)
+            if instance_info is None:
+                raise ValueError(f"No instance found with ID or Name {vm_name}.")
+            vm_type = instance_info.instance_type
+            region = region or instance_info.availability_zone
 
-            # Get the instance type and AZ
-            reservations = instances.get("Reservations", [])
-            if not reservations or "Instances" not in reservations[0]:
-                raise ValueError("No instances found in the response.")
-            instance_info = reservations[0]["Instances"][0]
-            instance_type = instance_info.get("InstanceType")
-            response = self.ec2.describe_spot_price_history(
-                EndTime=end_time,
-                InstanceTypes=[instance_type],  # type: ignore
-                ProductDescriptions=[
-                    "Linux/UNIX (Amazon VPC)",
-                ],
-                AvailabilityZone=region if region else "",
-                StartTime=start_time,
-            )
-        else:
-            response = self.ec2.describe_spot_price_history(
-                EndTime=end_time,
-                InstanceTypes=[vm_type],  # type: ignore
-                ProductDescriptions=[
-                    "Linux/UNIX (Amazon VPC)",
-                ],
-                AvailabilityZone=region if region else "",
-                StartTime=start_time,
-            )
+        if not vm_type:
+            return None
 
-        spot_price_history = response.get("SpotPriceHistory", {})
-
-        # just selects the first one since it offers different
-        # availability zones within the same region.
-        instance_type = spot_price_history[0].get("InstanceType")
-        price = spot_price_history[0].get("SpotPrice")
-        timestamp = spot_price_history[0].get("Timestamp")
+        response = self.ec2.describe_spot_price_history(
+            EndTime=end_time,
+            InstanceTypes=[vm_type],  # type: ignore
+            ProductDescriptions=[
+                PRODUCT_DESCRIPTION,
+            ],
+            AvailabilityZone=region if region else "",
+            StartTime=start_time,
+        )
 
-        if timestamp:
-            timestamp = timestamp.now(timezone.utc)
+        # keeps the latest price of each availability zone.
+        latest_prices: dict[str, Spot_Price] = {}
+        for data in response.get("SpotPriceHistory", []):
+            availability_zone = data.get("AvailabilityZone", "")
+            instance_type = data.get("InstanceType")
+            price = data.get("SpotPrice")
+            timestamp = data.get("Timestamp")
 
-        if price:
-            price = float(price)
+            if instance_type and price and timestamp:
+                current = latest_prices.get(availability_zone)
+                if current is None or timestamp > current.timestamp:
+                    latest_prices[availability_zone] = Spot_Price(
+                        vm_type=instance_type, price=float(price), timestamp=timestamp
+                    )
+
+        if latest_prices:
+            return min(latest_prices.values())
+        return None
+
+    def get_cheapest_spot_placement(
+        self, vm_type: "str | InstanceTypeType"
+    ) -> tuple[str, str, Spot_Price] | None:
+        """
+        Finds the cheapest region and availability zone for the instance type
+        across every enabled region. Scans are cached briefly.
 
-        if instance_type and price and timestamp:
-            spot_price = Spot_Price(
-                vm_type=instance_type, price=price, timestamp=timestamp
-            )
-            return spot_price
+        :param vm_type: The EC2 instance type to fetch the spot prices.
+        :returns: the (region, availability zone, spot price) of the cheapest placement.
+        """
+        return self.spot_price_scanner.get_cheapest(vm_type)
 
     def get_spot_price_history(
         self,
-        vm_type: str | InstanceTypeType,
+        vm_type: "str | InstanceTypeType",
         start_time: datetime,
         end_time: datetime,
         region: str | None = None,
@@ -200,7 +272,7 @@ class EC2_Wrapper(Virtual_Machine):
             EndTime=end_time,
             InstanceTypes=[vm_type],  # type: ignore
             ProductDescriptions=[
-                "Linux/UNIX (Amazon VPC)",
+                PRODUCT_DESCRIPTION,
             ],
             AvailabilityZone=region if region else "",
             StartTime=start_time,
@@ -226,19 +298,23 @@ class EC2_Wrapper(Virtual_Machine):
 
         return spot_prices
 
-    def execute_commands(self, commands: list[str]):
-        ssm = SSM_Wrapper()
-        return ssm.execute_commands(
-            instance_id=os.getenv("aws_instance_id", ""), commands=commands
+    def execute_commands(
+        self, commands: list[str], interrupted: threading.Event | None = None
+    ):
+        return self.ssm.execute_commands(
+            instance_id=get_config().aws_instance_id or "",
+            commands=commands,
+            interrupted=interrupted,
         )
 
 
 if __name__ == "__main__":
+    config = get_config()
     ec2 = EC2_Wrapper()
 
     # print(ec2.find_matching_instance_types(vcpus=192, memory=2048))
 
-    instance_id = os.getenv("aws_instance_id")
+    instance_id = config.aws_instance_id
     if instance_id:
         print(ec2.get_instance_state(instance_id=instance_id))
     # end_time = datetime.now()
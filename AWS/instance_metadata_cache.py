@@ -0,0 +1,134 @@
+import threading
+from typing import TYPE_CHECKING
+from datetime import datetime, timedelta, timezone
+
+if TYPE_CHECKING:
+    from mypy_boto3_ec2 import EC2Client
+
+DEFAULT_TTL = timedelta(minutes=10)
+
+
+class Instance_Metadata:
+    def __init__(
+        self,
+        instance_id: str,
+        name: str | None,
+        instance_type: str,
+        availability_zone: str,
+        lifecycle: str,
+        launch_time: datetime | None,
+    ):
+        self.instance_id = instance_id
+        self.name = name
+        self.instance_type = instance_type
+        self.availability_zone = availability_zone
+        # spot or on-demand (describe_instances omits InstanceLifecycle for on-demand).
+        self.lifecycle = lifecycle
+        self.launch_time = launch_time
+
+    def __repr__(self):
+        return f"{self.instance_id} ({self.name}): {self.instance_type} in {self.availability_zone}, {self.lifecycle}, launched {self.launch_time}"
+
+
+class Instance_Metadata_Cache:
+    def __init__(self, ec2: "EC2Client", ttl: timedelta = DEFAULT_TTL):
+        """
+        Caches the metadata of every EC2 instance, keyed by instance ID and by
+        Name tag. The cache is filled in bulk from one paginated describe_instances
+        call instead of one tag-filter query per lookup.
+
+        :param ec2: A Boto3 EC2 client.
+        :param ttl: how long the cache is used before it is refilled.
+        """
+        self.ec2 = ec2
+        self.ttl = ttl
+        self.refreshed_at: datetime | None = None
+
+        self._by_id: dict[str, Instance_Metadata] = {}
+        self._by_name: dict[str, Instance_Metadata] = {}
+        self._lock = threading.Lock()
+
+    def get(self, instance: str) -> Instance_Metadata | None:
+        """
+        Looks up an instance by ID or Name tag. Refills the cache when it is
+        stale or the instance is unknown (e.g. it was invalidated or just launched).
+
+        :param instance: the instance ID or Name tag.
+        :returns: the instance metadata, or None if no such instance exists.
+        """
+        metadata = self._lookup(instance)
+        if metadata and not self.is_stale():
+            return metadata
+
+        self.refresh()
+        return self._lookup(instance)
+
+    def refresh(self):
+        """
+        Refills the cache from one paginated describe_instances call.
+        """
+        by_id: dict[str, Instance_Metadata] = {}
+        by_name: dict[str, Instance_Metadata] = {}
+
+        paginator = self.ec2.get_paginator("describe_instances")
+        for page in paginator.paginate():
+            for reservation in page.get("Reservations", []):
+                for instance in reservation.get("Instances", []):
+                    instance_id = instance.get("InstanceId")
+                    instance_type = instance.get("InstanceType")
+                    if not instance_id or not instance_type:
+                        continue
+                    name = next(
+                        (
+                            tag.get("Value")
+                            for tag in instance.get("Tags", [])
+                            if tag.get("Key") == "Name"
+                        ),
+                        None,
+                    )
+                    metadata = Instance_Metadata(
+                        instance_id=instance_id,
+                        name=name,
+                        instance_type=instance_type,
+                        availability_zone=instance.get("Placement", {}).get(
+                            "AvailabilityZone", ""
+                        ),
+                        lifecycle=instance.get("InstanceLifecycle", "on-demand"),
+                        launch_time=instance.get("LaunchTime"),
+                    )
+                    by_id[instance_id] = metadata
+                    if name:
+                        by_name[name] = metadata
+
+        with self._lock:
+            self._by_id = by_id
+            self._by_name = by_name
+            self.refreshed_at = datetime.now(timezone.utc)
+
+    def invalidate(self, instance_id: str | None = None):
+        """
+        Drops an instance from the cache, e.g. after it is started or stopped
+        (which can change its launch time and placement). Without an ID, the
+        whole cache is dropped.
+
+        :param instance_id: the instance ID to drop.
+        """
+        with self._lock:
+            if instance_id is None:
+                self._by_id = {}
+                self._by_name = {}
+                self.refreshed_at = None
+                return
+            metadata = self._by_id.pop(instance_id, None)
+            if metadata and metadata.name:
+                self._by_name.pop(metadata.name, None)
+
+    def is_stale(self) -> bool:
+        return (
+            self.refreshed_at is None
+            or datetime.now(timezone.utc) - self.refreshed_at > self.ttl
+        )
+
+    def _lookup(self, instance: str) -> Instance_Metadata | None:
+        with self._lock:
+            return self._by_id.get(instance) or self._by_name.get(instance)
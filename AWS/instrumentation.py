@@ -0,0 +1,106 @@
+import time
+from typing import Any, TypeVar
+
+from shared.call_metrics import Call_Metrics, call_metrics
+
+PROVIDER = "AWS"
+# error codes AWS services return when a request was throttled.
+THROTTLE_ERROR_CODES = {
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "RequestLimitExceeded",
+    "RequestThrottled",
+    "RequestThrottledException",
+    "TooManyRequestsException",
+    "ProvisionedThroughputExceededException",
+    "SlowDown",
+}
+# set on clients that already have the handlers registered.
+_INSTRUMENTED_ATTRIBUTE = "_call_metrics_instrumented"
+_START_KEY = "call_metrics_start"
+_OPERATION_KEY = "call_metrics_operation"
+_THROTTLED_KEY = "call_metrics_throttled"
+
+Client = TypeVar("Client")
+
+
+def instrument_client(client: Client, metrics: Call_Metrics = call_metrics) -> Client:
+    """
+    Records the latency, errors, throttles and retries of every call made
+    through the boto3 client. The handlers hook into botocore's event system,
+    so they cover paginators and the S3 transfer manager too, and the latency
+    spans every retry botocore makes. A call counts as throttled when any of
+    its attempts was. Instrumenting a client twice is a no-op.
+
+    :param client: a boto3 client.
+    :param metrics: the registry the calls are recorded to.
+    :returns: the same client.
+    """
+    if getattr(client, _INSTRUMENTED_ATTRIBUTE, False):
+        return client
+
+    service = client.meta.service_model.service_name
+    # botocore names its events after the hyphenized service id, e.g. cost-explorer for ce.
+    event_suffix = client.meta.service_model.service_id.hyphenize()
+    events = client.meta.events
+
+    # before-parameter-build fires ahead of before-call, whose handlers can
+    # short-circuit the call (e.g. botocore's Stubber).
+    def before_call(model, context: dict[str, Any], **kwargs):
+        context[_START_KEY] = time.perf_counter()
+        context[_OPERATION_KEY] = f"{service}.{model.name}"
+
+    def needs_retry(response, request_dict: dict[str, Any], **kwargs):
+        if response is None:
+            return None
+        http_response, parsed = response
+        if (
+            parsed.get("Error", {}).get("Code") in THROTTLE_ERROR_CODES
+            or http_response.status_code == 429
+        ):
+            request_dict["context"][_THROTTLED_KEY] = True
+        # returning None leaves the retry decision to botocore.
+        return None
+
+    def after_call(http_response, parsed: dict[str, Any], context: dict[str, Any], **kwargs):
+        start = context.pop(_START_KEY, None)
+        if start is None:
+            return
+        metadata = parsed.get("ResponseMetadata", {})
+        status_code = getattr(http_response, "status_code", None) or metadata.get(
+            "HTTPStatusCode", 200
+        )
+        error_code = parsed.get("Error", {}).get("Code")
+        metrics.record(
+            PROVIDER,
+            context.pop(_OPERATION_KEY),
+            time.perf_counter() - start,
+            error=status_code >= 300,
+            throttled=error_code in THROTTLE_ERROR_CODES
+            or status_code == 429
+            or context.pop(_THROTTLED_KEY, False),
+            retries=metadata.get("RetryAttempts", 0),
+        )
+
+    def after_call_error(context: dict[str, Any], **kwargs):
+        # the request never got a response, e.g. a connection error after
+        # botocore ran out of retries.
+        start = context.pop(_START_KEY, None)
+        if start is None:
+            return
+        metrics.record(
+            PROVIDER,
+            context.pop(_OPERATION_KEY),
+            time.perf_counter() - start,
+            error=True,
+            throttled=context.pop(_THROTTLED_KEY, False),
+        )
+
+    events.register(f"before-parameter-build.{event_suffix}", before_call)
+    # registered first, the retry handler stops the event once it schedules a retry.
+    events.register_first(f"needs-retry.{event_suffix}", needs_retry)
+    events.register(f"after-call.{event_suffix}", after_call)
+    events.register(f"after-call-error.{event_suffix}", after_call_error)
+    setattr(client, _INSTRUMENTED_ATTRIBUTE, True)
+    return client
@@ -1,26 +1,84 @@
 import boto3
-from mypy_boto3_s3.client import S3Client
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+from typing import TYPE_CHECKING
+
+from AWS.instrumentation import instrument_client
+
+if TYPE_CHECKING:
+    from mypy_boto3_s3.client import S3Client
+
+# the object metadata key holding the SHA-256 of the uploaded content.
+DIGEST_METADATA_KEY = "sha256"
+MiB = 1024 * 1024
 
 
 class S3_Wrapper:
-    def __init__(self, s3: S3Client):
+    def __init__(
+        self,
+        s3: "S3Client",
+        multipart_threshold: int = 8 * MiB,
+        multipart_chunksize: int = 8 * MiB,
+        max_concurrency: int = 10,
+    ):
         """
         Initializes the S3 client.
 
         :param ssm: A Boto3 SSM client. This client allows user to upload
                         files to an S3 bucket for storage.
+        :param multipart_threshold: files at least this large are uploaded in parts.
+        :param multipart_chunksize: the size of each part.
+        :param max_concurrency: the number of parts uploaded in parallel per file.
         """
-        self.s3 = s3
+        self.s3 = instrument_client(s3)
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency,
+        )
 
-    def upload_file(self, filepath: str, bucket: str, key: str):
+    def upload_file(
+        self, filepath: str, bucket: str, key: str, digest: str | None = None
+    ):
         """
-        Uploads the file to the s3 storage.
+        Uploads the file to the s3 storage, in parallel parts when it is large.
 
         :param filenmae: The name of the file to be uploaded.
         :param bucket: The name of the bucket to store the file.
         :param key: The unique name to identify the file in the bucket.
+        :param digest: the SHA-256 of the file, stored in the object metadata.
+        """
+        extra_args = {"Metadata": {DIGEST_METADATA_KEY: digest}} if digest else None
+        self.s3.upload_file(
+            filepath, bucket, key, ExtraArgs=extra_args, Config=self.transfer_config
+        )
+
+    def download_file(self, bucket: str, key: str, filepath: str):
+        """
+        Downloads the object to a local file, in parallel parts when it is large.
+
+        :param bucket: The name of the bucket.
+        :param key: The key of the object.
+        :param filepath: The local path to write the object to.
+        """
+        self.s3.download_file(bucket, key, filepath, Config=self.transfer_config)
+
+    def get_digest(self, bucket: str, key: str) -> str | None:
+        """
+        Gets the SHA-256 stored with the object. The ETag cannot be used since
+        it is not a content hash for multipart uploads.
+
+        :param bucket: The name of the bucket.
+        :param key: The key of the object.
+        :returns: the digest, or None if the object or its digest does not exist.
         """
-        self.s3.upload_file(filepath, bucket, key)
+        try:
+            response = self.s3.head_object(Bucket=bucket, Key=key)
+        except ClientError as ex:
+            if ex.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                return None
+            raise ex
+        return response.get("Metadata", {}).get(DIGEST_METADATA_KEY)
 
 
 if __name__ == "__main__":
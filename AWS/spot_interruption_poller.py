@@ -0,0 +1,85 @@
+import requests
+from datetime import datetime, timedelta
+
+from shared.call_metrics import instrument_session
+from shared.types.interruption_notice import Interruption_Notice
+
+INSTANCE_METADATA_URL = "http://169.254.169.254"
+TOKEN_PATH = "/latest/api/token"
+INSTANCE_ACTION_PATH = "/latest/meta-data/spot/instance-action"
+TOKEN_TTL = timedelta(hours=6)
+
+
+class Spot_Interruption_Poller:
+    def __init__(
+        self,
+        base_url: str = INSTANCE_METADATA_URL,
+        timeout: float = 1.0,
+        token_ttl: timedelta = TOKEN_TTL,
+    ):
+        """
+        Polls the instance metadata service of an EC2 spot instance for its
+        interruption notice, which AWS posts two minutes before reclaiming it.
+        Uses IMDSv2, the session token is reused until it expires.
+
+        :param base_url: the instance metadata endpoint. Can point to a local
+            stand-in server, or a forward of the instance's endpoint.
+        :param timeout: the timeout (seconds) of each request.
+        :param token_ttl: how long a session token is requested for.
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.token_ttl = token_ttl
+        self.session = instrument_session(requests.Session(), "AWS", "imds")
+
+        self._token: str | None = None
+        self._token_expires_at: datetime | None = None
+
+    def poll(self) -> Interruption_Notice | None:
+        """
+        Reads the interruption notice of the instance.
+
+        :returns: the notice, or None if the instance is not being interrupted.
+        """
+        response = self._get_instance_action()
+        if response.status_code == 401:
+            # the token expired early, e.g. the stand-in server restarted.
+            self._token = None
+            response = self._get_instance_action()
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+
+        instance_action = response.json()
+        time = instance_action.get("time")
+        return Interruption_Notice(
+            provider="AWS",
+            action=instance_action.get("action", "terminate"),
+            time=datetime.fromisoformat(time.replace("Z", "+00:00")) if time else None,
+        )
+
+    def _get_instance_action(self) -> requests.Response:
+        return self.session.get(
+            self.base_url + INSTANCE_ACTION_PATH,
+            headers={"X-aws-ec2-metadata-token": self._get_token()},
+            timeout=self.timeout,
+        )
+
+    def _get_token(self) -> str:
+        now = datetime.now()
+        if self._token and self._token_expires_at and now < self._token_expires_at:
+            return self._token
+        response = self.session.put(
+            self.base_url + TOKEN_PATH,
+            headers={
+                "X-aws-ec2-metadata-token-ttl-seconds": str(
+                    int(self.token_ttl.total_seconds())
+                )
+            },
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        self._token = response.text
+        # renewed a minute early so a request never carries an expired token.
+        self._token_expires_at = now + self.token_ttl - timedelta(minutes=1)
+        return self._token
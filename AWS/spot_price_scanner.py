@@ -0,0 +1,158 @@
+import threading
+import boto3
+from typing import TYPE_CHECKING
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from AWS.instrumentation import instrument_client
+from shared.types.spot_price import Spot_Price
+
+if TYPE_CHECKING:
+    from mypy_boto3_ec2 import EC2Client
+    from mypy_boto3_ec2.literals import InstanceTypeType
+
+PRODUCT_DESCRIPTION = "Linux/UNIX (Amazon VPC)"
+# spot prices change at most every few minutes, a short TTL lets the
+# scheduler call scan every loop iteration without being throttled.
+DEFAULT_CACHE_TTL = timedelta(minutes=1)
+
+
+class Spot_Price_Scanner:
+    def __init__(
+        self,
+        regions: list[str] | None = None,
+        max_workers: int = 16,
+        cache_ttl: timedelta = DEFAULT_CACHE_TTL,
+    ):
+        """
+        Scans the current spot price of an instance type across every enabled
+        region and availability zone in parallel, with one EC2 client per region.
+
+        :param regions: the regions to scan. Defaults to every enabled region.
+        :param max_workers: the number of regions queried concurrently.
+        :param cache_ttl: how long a scan is reused before the regions are queried again.
+        """
+        self.regions = regions
+        self.max_workers = max_workers
+        self.cache_ttl = cache_ttl
+
+        self._clients: "dict[str, EC2Client]" = {}
+        self._cache: dict[str, tuple[datetime, dict[str, dict[str, Spot_Price]]]] = {}
+        self._lock = threading.Lock()
+
+    def get_regions(self) -> list[str]:
+        """
+        Lists the regions enabled for the account. describe_regions only returns
+        enabled regions unless AllRegions is set.
+        """
+        if self.regions is None:
+            response = instrument_client(boto3.client("ec2")).describe_regions()
+            self.regions = sorted(
+                region["RegionName"]
+                for region in response.get("Regions", [])
+                if "RegionName" in region
+            )
+        return self.regions
+
+    def scan(
+        self, instance_type: "str | InstanceTypeType"
+    ) -> dict[str, dict[str, Spot_Price]]:
+        """
+        Fetches the current spot price of the instance type in every region and AZ.
+
+        :param instance_type: the EC2 instance type.
+        :returns: the price matrix, region -> availability zone -> spot price.
+        """
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            cached = self._cache.get(instance_type)
+        if cached and now - cached[0] < self.cache_ttl:
+            return cached[1]
+
+        regions = self.get_regions()
+        clients = [self._get_client(region) for region in regions]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = executor.map(
+                lambda client: self._scan_region(client, instance_type, now), clients
+            )
+            matrix = {
+                region: prices for region, prices in zip(regions, results) if prices
+            }
+
+        with self._lock:
+            self._cache[instance_type] = (now, matrix)
+        return matrix
+
+    def get_cheapest(
+        self, instance_type: "str | InstanceTypeType"
+    ) -> tuple[str, str, Spot_Price] | None:
+        """
+        Finds the cheapest placement of the instance type.
+
+        :param instance_type: the EC2 instance type.
+        :returns: the (region, availability zone, spot price) of the cheapest placement.
+        """
+        placements = [
+            (region, availability_zone, spot_price)
+            for region, prices in self.scan(instance_type).items()
+            for availability_zone, spot_price in prices.items()
+        ]
+        if not placements:
+            return None
+        return min(placements, key=lambda placement: placement[2].price)
+
+    def _get_client(self, region: str) -> "EC2Client":
+        # boto3 client creation is not thread safe, clients themselves are.
+        with self._lock:
+            if region not in self._clients:
+                self._clients[region] = instrument_client(
+                    boto3.client("ec2", region_name=region)
+                )
+            return self._clients[region]
+
+    def _scan_region(
+        self,
+        client: "EC2Client",
+        instance_type: "str | InstanceTypeType",
+        now: datetime,
+    ) -> dict[str, Spot_Price]:
+        """
+        Fetches the latest spot price of every AZ in one region.
+
+        :param client: the EC2 client of the region.
+        :param instance_type: the EC2 instance type.
+        :param now: the time of the scan.
+        :returns: availability zone -> latest spot price.
+        """
+        prices: dict[str, Spot_Price] = {}
+        try:
+            paginator = client.get_paginator("describe_spot_price_history")
+            # a StartTime of now returns the price in effect in every AZ.
+            for page in paginator.paginate(
+                InstanceTypes=[instance_type],  # type: ignore
+                ProductDescriptions=[PRODUCT_DESCRIPTION],
+                StartTime=now,
+                EndTime=now,
+            ):
+                for data in page.get("SpotPriceHistory", []):
+                    availability_zone = data.get("AvailabilityZone")
+                    price = data.get("SpotPrice")
+                    timestamp = data.get("Timestamp")
+                    if not availability_zone or not price or not timestamp:
+                        continue
+                    current = prices.get(availability_zone)
+                    if current is None or timestamp > current.timestamp:
+                        prices[availability_zone] = Spot_Price(
+                            vm_type=instance_type,
+                            price=float(price),
+                            timestamp=timestamp,
+                        )
+        except Exception as ex:
+            # one unavailable region should not fail the whole scan.
+            print(f"Failed to scan spot prices in {client.meta.region_name}", ex)
+        return prices
+
+
+if __name__ == "__main__":
+    scanner = Spot_Price_Scanner()
+    print(scanner.get_cheapest("m4.large"))
@@ -1,11 +1,11 @@
-import os
 import time
-from dotenv import load_dotenv
 import boto3
-from mypy_boto3_ssm.client import SSMClient
+import threading
 
-
-load_dotenv(override=True)
+from shared.config import get_config
+from AWS.instrumentation import instrument_client
+from shared.types.interruption_notice import VMInterruptedException
+from shared.types.remote_command_exception import RemoteCommandException
 
 
 class SSM_Wrapper:
@@ -16,15 +16,24 @@ class SSM_Wrapper:
         :param ssm: A Boto3 SSM client. This client allows user to execute
                         commands on EC2 instances.
         """
-        self.ssm = boto3.client('ssm')
+        self.ssm = instrument_client(boto3.client('ssm'))
 
-    def execute_commands(self, instance_id: str, commands: list[str]):
+    def execute_commands(
+        self,
+        instance_id: str,
+        commands: list[str],
+        interrupted: threading.Event | None = None,
+    ):
         """
         Executes a series of commands on the ec2 instance. Prints out
         the standard output and standard error.
 
         :param instance_id: The instance id of the EC2 instance to start.
         :param commands: The list of commands to execute sequentially on the EC2 instance.
+        :param interrupted: when set, e.g. by an interruption notice, the command
+            is cancelled and VMInterruptedException raised instead of waiting for it.
+        :returns: the standard output of the command.
+        :raises RemoteCommandException: if the command failed, timed out or was cancelled.
         """
         print("EXECUTING COMMAND")
         response = self.ssm.send_command(
@@ -38,19 +47,37 @@ class SSM_Wrapper:
             print("SSM command sent. Command ID:", command_id)
 
             while True:
-                time.sleep(3)
+                if interrupted is None:
+                    time.sleep(3)
+                elif interrupted.wait(3):
+                    try:
+                        self.ssm.cancel_command(
+                            CommandId=command_id, InstanceIds=[instance_id]
+                        )
+                    except Exception:
+                        # the instance may already be gone.
+                        pass
+                    raise VMInterruptedException(
+                        f"Command {command_id} on {instance_id} was interrupted."
+                    )
 
                 output = self.ssm.get_command_invocation(
                     CommandId=command_id, InstanceId=instance_id
                 )
 
-                if output["Status"] in ["Success", "Failed"]:
+                if output["Status"] == "Success":
                     return output.get("StandardOutputContent")
+                if output["Status"] in ["Failed", "TimedOut", "Cancelled"]:
+                    raise RemoteCommandException(
+                        f"Command {command_id} on {instance_id}: {output['Status']}",
+                        stderr=output.get("StandardErrorContent", ""),
+                    )
 
 
 if __name__ == "__main__":
+    config = get_config()
     ssm = SSM_Wrapper()
-    instance_id = os.getenv("aws_instance_id")
+    instance_id = config.aws_instance_id
     if instance_id:
         command = f"python3 /home/ec2-user/web_scraper.py 10"
         print(ssm.execute_commands(instance_id, [command]))
@@ -0,0 +1,83 @@
+import asyncio
+from datetime import datetime
+
+from Azure.cloudprice_cache import Cloudprice_Cache
+from shared.types.spot_price import Spot_Price
+
+
+class Cloudprice_Fetcher:
+    def __init__(self, cache: Cloudprice_Cache, max_concurrency: int = 8):
+        """
+        Fetches the price histories of many VM types and regions concurrently.
+        Every request goes through the same Cloudprice_Cache, so they share one
+        keep-alive session, its rate limiter and its cached responses.
+
+        :param cache: the cloudprice.net cache to fetch through.
+        :param max_concurrency: the maximum number of requests in flight.
+        """
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+
+    async def fetch(
+        self,
+        vm_types: list[str],
+        regions: list[str | None],
+        start_time: datetime,
+        end_time: datetime,
+    ) -> dict[tuple[str, str | None], list[Spot_Price] | None]:
+        """
+        Fetches the spot price history of every (VM type, region) combination.
+
+        :param vm_types: the VM names.
+        :param regions: the regions, or [None] for every region.
+        :param start_time: the starting time for the spot price history.
+        :param end_time: the ending time for the spot price history.
+        :returns: a mapping of (VM type, region) to its spot prices, or None
+            if the history is unavailable.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def fetch_one(vm_type: str, region: str | None):
+            async with semaphore:
+                # the cache is blocking, run it on the default thread pool.
+                return await asyncio.to_thread(
+                    self.cache.get_spot_price_history,
+                    vm_type=vm_type,
+                    start_time=start_time,
+                    end_time=end_time,
+                    region=region,
+                )
+
+        keys = [(vm_type, region) for vm_type in vm_types for region in regions]
+        results = await asyncio.gather(
+            *(fetch_one(vm_type, region) for vm_type, region in keys),
+            return_exceptions=True,
+        )
+
+        histories: dict[tuple[str, str | None], list[Spot_Price] | None] = {}
+        for key, result in zip(keys, results):
+            if isinstance(result, BaseException):
+                print(f"Failed to fetch price history for {key}", result)
+                histories[key] = None
+            else:
+                histories[key] = result
+        return histories
+
+    def fetch_all(
+        self,
+        vm_types: list[str],
+        regions: list[str | None],
+        start_time: datetime,
+        end_time: datetime,
+    ) -> dict[tuple[str, str | None], list[Spot_Price] | None]:
+        """
+        Blocking version of fetch for callers outside an event loop.
+        """
+        return asyncio.run(
+            self.fetch(
+                vm_types=vm_types,
+                regions=regions,
+                start_time=start_time,
+                end_time=end_time,
+            )
+        )
@@ -1,11 +1,14 @@
-import os
-from dotenv import load_dotenv
-from datetime import datetime, timedelta, UTC, date
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.costmanagement import CostManagementClient
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone, UTC
+from functools import cached_property
+from urllib.parse import parse_qs, urlparse
+from azure.core.exceptions import HttpResponseError
 
-load_dotenv(override=True)
+from shared.config import get_config
+from Azure.credential_cache import get_credential
+from shared.types.cost_record import Cost_Record
+
+# Azure cost data can keep changing for up to 72 hours after usage.
+COST_FINALIZATION_DELAY = timedelta(hours=72)
 
 
 class Cost_Management_Wrapper:
@@ -20,18 +23,83 @@ class Cost_Management_Wrapper:
         """
         self.subscription_id = subscription_id
         self.resource_group_name = resource_group_name
-        credential = DefaultAzureCredential()
-        self.cost_management_client = CostManagementClient(credential)
+        # scopes that rejected hourly granularity, queried daily from then on.
+        self._daily_scopes: set[str] = set()
+
+    @cached_property
+    def cost_management_client(self):
+        from azure.mgmt.costmanagement import CostManagementClient
+        from Azure.instrumentation import get_client_kwargs
+
+        return CostManagementClient(get_credential(), **get_client_kwargs())
+
+    @cached_property
+    def resource_client(self):
+        from azure.mgmt.resource import ResourceManagementClient
+        from Azure.instrumentation import get_client_kwargs
+
+        return ResourceManagementClient(
+            get_credential(), self.subscription_id, **get_client_kwargs()
+        )
 
     def get_cost(self, start_time: datetime, end_time: datetime, vm_name: str):
         """
-        Gets the daily financial cost of the VM instance usage.
+        Gets the financial cost of the VM instance usage, hourly where available.
 
         :params start_time: the start time for measuring the VM cost.
         :params end_time: the end time for measuring the VM cost.
         :params vm_name: the name of the virtual machine to measure cost.
         :returns: list of time period and their cost.
         """
+        vm_resource_id = (
+            "/subscriptions/{}/resourceGroups/{}/"
+            "providers/Microsoft.Compute/virtualMachines/{}"
+        ).format(self.subscription_id, self.resource_group_name, vm_name)
+
+        cost_records = self.get_resource_costs(
+            start_time=start_time, end_time=end_time, resource_id=vm_resource_id
+        )
+        return [
+            {"time_period": record.hour, "cost": record.amount}
+            for record in cost_records
+        ]
+
+    def get_resource_costs(
+        self,
+        start_time: datetime,
+        end_time: datetime,
+        resource_group_name: str | None = None,
+        resource_id: str | None = None,
+    ) -> list[Cost_Record]:
+        """
+        Gets the cost of every resource in the resource group, grouped by
+        resource id and meter category. Queries hourly granularity and falls
+        back to daily where the scope does not support it.
+
+        :params start_time: the start time for measuring the cost.
+        :params end_time: the end time for measuring the cost.
+        :params resource_group_name: the resource group to query. Defaults to the wrapper's.
+        :params resource_id: only return the cost of this resource.
+        :returns: the cost of every resource and meter category per hour (or day).
+        """
+        scope = self._get_scope(resource_group_name)
+
+        dataset: dict = {
+            "granularity": "Daily" if scope in self._daily_scopes else "Hourly",
+            "aggregation": {"totalCost": {"name": "Cost", "function": "Sum"}},
+            "grouping": [
+                {"type": "Dimension", "name": "ResourceId"},
+                {"type": "Dimension", "name": "MeterCategory"},
+            ],
+        }
+        if resource_id:
+            dataset["filter"] = {
+                "dimensions": {
+                    "name": "ResourceId",
+                    "operator": "In",
+                    "values": [resource_id.lower()],
+                }
+            }
         query = {
             "type": "ActualCost",
             "timeframe": "Custom",
@@ -39,33 +107,118 @@ class Cost_Management_Wrapper:
                 "from": start_time.isoformat(),
                 "to": end_time.isoformat(),
             },
-            "dataset": {
-                "granularity": "Daily",
-                "aggregation": {"totalCost": {"name": "Cost", "function": "Sum"}},
-            },
+            "dataset": dataset,
         }
 
-        resource_id = ("subscriptions/{}/" "resourceGroups/{}/").format(
-            self.subscription_id, self.resource_group_name
+        try:
+            response = self.cost_management_client.query.usage(
+                scope=scope, parameters=query
+            )
+        except HttpResponseError as ex:
+            if dataset["granularity"] != "Hourly" or not _is_granularity_unsupported(ex):
+                raise ex
+            self._daily_scopes.add(scope)
+            dataset["granularity"] = "Daily"
+            response = self.cost_management_client.query.usage(
+                scope=scope, parameters=query
+            )
+        if response is None:
+            return []
+
+        columns = [column.name for column in response.columns or []]
+        rows = list(response.rows or [])
+        # a busy resource group spans several pages, the same query is
+        # repeated with the skiptoken of each next link.
+        while response and response.next_link:
+            skiptoken = parse_qs(urlparse(response.next_link).query).get("$skiptoken")
+            if not skiptoken:
+                raise ValueError(f"No skiptoken in next link {response.next_link}")
+            response = self.cost_management_client.query.usage(
+                scope=scope, parameters=query, params={"$skiptoken": skiptoken[0]}
+            )
+            if response:
+                rows.extend(response.rows or [])
+
+        cost_column = columns.index("Cost") if "Cost" in columns else 0
+        resource_column = columns.index("ResourceId")
+        meter_column = columns.index("MeterCategory")
+        date_column = next(
+            columns.index(name)
+            for name in ("UsageDateTime", "UsageDate")
+            if name in columns
         )
 
-        print("Resource ID", resource_id)
+        settled_before = datetime.now(timezone.utc) - COST_FINALIZATION_DELAY
+        cost_records: list[Cost_Record] = []
+        for row in rows:
+            hour = _parse_usage_date(row[date_column])
+            cost_records.append(
+                Cost_Record(
+                    provider="Azure",
+                    resource=str(row[resource_column]).lower(),
+                    usage_type=str(row[meter_column]),
+                    hour=hour,
+                    amount=float(row[cost_column]),
+                    estimated=hour >= settled_before,
+                )
+            )
+
+        return cost_records
+
+    def is_daily(self, resource_group_name: str | None = None) -> bool:
+        """
+        Whether the resource group's costs are queried daily, since its scope
+        does not support hourly granularity.
+
+        :params resource_group_name: the resource group. Defaults to the wrapper's.
+        """
+        return self._get_scope(resource_group_name) in self._daily_scopes
+
+    def list_resource_groups(self) -> list[str]:
+        """
+        Lists the names of every resource group in the subscription.
+        """
+        return [
+            group.name
+            for group in self.resource_client.resource_groups.list()
+            if group.name
+        ]
 
-        cost: list[dict[str, float | dict[str, str]]] = []
-        response = self.cost_management_client.query.usage(
-            scope=resource_id, parameters=query
+    def _get_scope(self, resource_group_name: str | None = None) -> str:
+        return ("subscriptions/{}/" "resourceGroups/{}/").format(
+            self.subscription_id, resource_group_name or self.resource_group_name
         )
-        for row in response.rows:
-            print(row)
-            cost.append({"time_period": row[0], "cost": row[1]})
 
-        return cost
+
+def _is_granularity_unsupported(ex: HttpResponseError) -> bool:
+    """
+    Whether the query was rejected since the scope does not support its
+    granularity, as opposed to e.g. throttling, auth or server errors.
+    """
+    if ex.status_code != 400:
+        return False
+    code = ex.error.code if ex.error and ex.error.code else ""
+    return "granularity" in f"{code} {ex.message or ''}".lower()
+
+
+def _parse_usage_date(value: int | str) -> datetime:
+    """
+    Parses the usage date column, an integer such as 20250101 for daily
+    granularity or an ISO timestamp for hourly granularity.
+    """
+    if isinstance(value, (int, float)):
+        return datetime.strptime(str(int(value)), "%Y%m%d").replace(tzinfo=timezone.utc)
+    timestamp = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc)
 
 
 if __name__ == "__main__":
-    subscription_id = os.getenv("azure_subscription_id")
-    resource_group_name = os.getenv("azure_resource_group_name")
-    vm_name = os.getenv("azure_vm_name")
+    config = get_config()
+    subscription_id = config.azure_subscription_id
+    resource_group_name = config.azure_resource_group_name
+    vm_name = config.azure_vm_name
     if subscription_id and resource_group_name and vm_name:
         cost = Cost_Management_Wrapper(
             subscription_id=subscription_id, resource_group_name=resource_group_name
@@ -73,7 +226,7 @@ if __name__ == "__main__":
         end_time = datetime.now(UTC)
         start_time = end_time - timedelta(days=30)
 
-        response = cost.get_cost_and_usage(
+        response = cost.get_cost(
             start_time=start_time, end_time=end_time, vm_name=vm_name
         )
         print(response)
@@ -0,0 +1,139 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Callable
+
+if TYPE_CHECKING:
+    from azure.identity import DefaultAzureCredential
+
+DEFAULT_KEY_TTL = timedelta(hours=1)
+DEFAULT_SAS_LIFETIME = timedelta(hours=1)
+# SAS URLs are re-minted this long before they expire, so a VM that starts a
+# download right after getting the URL still has time to finish it.
+DEFAULT_SAS_REFRESH_MARGIN = timedelta(minutes=10)
+
+_credential: "DefaultAzureCredential | None" = None
+_credential_lock = threading.Lock()
+
+
+def get_credential() -> "DefaultAzureCredential":
+    """
+    Gets the credential shared by every Azure wrapper in the process.
+    DefaultAzureCredential walks its whole credential chain the first time it
+    is used and caches the tokens it gets, so sharing one instance pays for
+    that once instead of once per wrapper.
+    """
+    global _credential
+    with _credential_lock:
+        if _credential is None:
+            from azure.identity import DefaultAzureCredential
+
+            _credential = DefaultAzureCredential()
+        return _credential
+
+
+class Account_Key_Cache:
+    def __init__(self, ttl: timedelta = DEFAULT_KEY_TTL):
+        """
+        Caches storage account keys, so minting SAS tokens does not call
+        storage_accounts.list_keys every time.
+
+        :param ttl: how long a key is reused before it is fetched again.
+        """
+        self.ttl = ttl
+        self._keys: dict[tuple[str, str, str], tuple[str, datetime]] = {}
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        subscription_id: str,
+        resource_group_name: str,
+        storage_account_name: str,
+        fetch: Callable[[], str | None],
+    ) -> str | None:
+        """
+        Gets the account key, fetching it only when it is missing or expired.
+
+        :param subscription_id: the subscription of the storage account.
+        :param resource_group_name: the resource group of the storage account.
+        :param storage_account_name: the name of the storage account.
+        :param fetch: retrieves the key from the management plane.
+        """
+        cache_key = (subscription_id, resource_group_name, storage_account_name)
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            cached = self._keys.get(cache_key)
+            if cached and cached[1] > now:
+                return cached[0]
+
+            account_key = fetch()
+            if account_key:
+                self._keys[cache_key] = (account_key, now + self.ttl)
+            return account_key
+
+    def invalidate(
+        self,
+        subscription_id: str,
+        resource_group_name: str,
+        storage_account_name: str,
+    ):
+        """
+        Drops a cached key, e.g. after the keys were rotated.
+        """
+        with self._lock:
+            self._keys.pop(
+                (subscription_id, resource_group_name, storage_account_name), None
+            )
+
+
+class Sas_Url_Cache:
+    def __init__(
+        self,
+        lifetime: timedelta = DEFAULT_SAS_LIFETIME,
+        refresh_margin: timedelta = DEFAULT_SAS_REFRESH_MARGIN,
+    ):
+        """
+        Reuses SAS URLs until shortly before they expire.
+
+        :param lifetime: how long each minted SAS URL is valid.
+        :param refresh_margin: how long before expiry a URL is re-minted.
+        """
+        self.lifetime = lifetime
+        self.refresh_margin = refresh_margin
+        self._urls: dict[tuple[str, ...], tuple[str, datetime]] = {}
+        self._lock = threading.Lock()
+
+    def get(
+        self, key: tuple[str, ...], mint: Callable[[datetime], str | None]
+    ) -> str | None:
+        """
+        Gets the SAS URL, minting a new one only when the cached one is about to expire.
+
+        :param key: identifies the blob and permissions, e.g. (account, container, blob).
+        :param mint: creates a SAS URL that expires at the given time.
+        """
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            cached = self._urls.get(key)
+            if cached and cached[1] - self.refresh_margin > now:
+                return cached[0]
+
+            expiry = now + self.lifetime
+            sas_url = mint(expiry)
+            if sas_url:
+                self._urls[key] = (sas_url, expiry)
+            return sas_url
+
+    def invalidate(self, key: tuple[str, ...] | None = None):
+        """
+        Drops one cached URL, or every URL if key is None.
+        """
+        with self._lock:
+            if key is None:
+                self._urls.clear()
+            else:
+                self._urls.pop(key, None)
+
+
+# shared by every Storage_Wrapper in the process.
+account_key_cache = Account_Key_Cache()
+sas_url_cache = Sas_Url_Cache()
@@ -0,0 +1,133 @@
+import time
+from typing import Any
+from urllib.parse import parse_qs, urlparse
+
+from azure.core.pipeline import PipelineRequest, PipelineResponse
+from azure.core.pipeline.policies import HTTPPolicy, SansIOHTTPPolicy
+
+from shared.call_metrics import Call_Metrics, call_metrics
+
+PROVIDER = "Azure"
+# ARM and storage answer 429 when throttled, storage also sends 503 ServerBusy.
+THROTTLE_STATUS_CODES = {429, 503}
+_ATTEMPTS_KEY = "call_metrics_attempts"
+_THROTTLED_KEY = "call_metrics_throttled"
+
+
+class Call_Metrics_Policy(HTTPPolicy):
+    def __init__(self, metrics: Call_Metrics = call_metrics, per_attempt: bool = False):
+        """
+        Records the latency, errors, throttles and retries of every request
+        sent through an azure-core pipeline.
+
+        As a per-call policy it sits in front of the RetryPolicy, so it times
+        the whole call and reads the attempts and throttles noted by
+        Attempt_Counter_Policy. Pipelines that only accept policies after
+        their RetryPolicy (the blob client) use per_attempt instead: every
+        attempt is recorded as its own call and every attempt after the first
+        counts as a retry.
+
+        :param metrics: the registry the calls are recorded to.
+        :param per_attempt: whether the policy runs once per attempt.
+        """
+        super().__init__()
+        self.metrics = metrics
+        self.per_attempt = per_attempt
+
+    def send(self, request: PipelineRequest) -> PipelineResponse:
+        http_request = request.http_request
+        operation = get_operation(http_request.method, http_request.url)
+        if self.per_attempt:
+            attempts = request.context.get(_ATTEMPTS_KEY, 0) + 1
+            request.context[_ATTEMPTS_KEY] = attempts
+
+        start = time.perf_counter()
+        try:
+            response = self.next.send(request)
+        except Exception:
+            self.metrics.record(
+                PROVIDER,
+                operation,
+                time.perf_counter() - start,
+                error=True,
+                throttled=request.context.get(_THROTTLED_KEY, False),
+                retries=self._get_retries(request),
+            )
+            raise
+
+        status_code = response.http_response.status_code
+        self.metrics.record(
+            PROVIDER,
+            operation,
+            time.perf_counter() - start,
+            error=status_code >= 400,
+            throttled=status_code in THROTTLE_STATUS_CODES
+            or request.context.get(_THROTTLED_KEY, False),
+            retries=self._get_retries(request),
+        )
+        return response
+
+    def _get_retries(self, request: PipelineRequest) -> int:
+        attempts = request.context.get(_ATTEMPTS_KEY, 1)
+        if self.per_attempt:
+            return 1 if attempts > 1 else 0
+        return max(attempts - 1, 0)
+
+
+class Attempt_Counter_Policy(SansIOHTTPPolicy):
+    """
+    Counts the attempts of a call in its pipeline context and notes whether
+    any of them was throttled. Runs once per attempt as a per-retry policy.
+    """
+
+    def on_request(self, request: PipelineRequest):
+        request.context[_ATTEMPTS_KEY] = request.context.get(_ATTEMPTS_KEY, 0) + 1
+
+    def on_response(self, request: PipelineRequest, response: PipelineResponse):
+        if response.http_response.status_code in THROTTLE_STATUS_CODES:
+            request.context[_THROTTLED_KEY] = True
+
+
+def get_client_kwargs(metrics: Call_Metrics = call_metrics) -> dict[str, Any]:
+    """
+    Gets the keyword arguments that instrument an Azure SDK client, e.g.
+    ComputeManagementClient(credential, subscription_id, **get_client_kwargs()).
+    """
+    return {
+        "per_call_policies": [Call_Metrics_Policy(metrics)],
+        "per_retry_policies": [Attempt_Counter_Policy()],
+    }
+
+
+def get_blob_client_kwargs(metrics: Call_Metrics = call_metrics) -> dict[str, Any]:
+    """
+    Gets the keyword arguments that instrument a BlobServiceClient. The
+    storage SDKs build their own pipeline and only append extra policies
+    after their RetryPolicy, so the calls are recorded per attempt.
+    """
+    return {"_additional_pipeline_policies": [Call_Metrics_Policy(metrics, per_attempt=True)]}
+
+
+def get_operation(method: str, url: str) -> str:
+    """
+    Names a request after what it operates on rather than which resource,
+    so the operations of every VM share one series, e.g.
+    GET Microsoft.Compute/virtualMachines/instanceView.
+
+    :param method: the HTTP method.
+    :param url: the request URL.
+    """
+    parsed = urlparse(url)
+    segments = [segment for segment in parsed.path.split("/") if segment]
+    lowered = [segment.lower() for segment in segments]
+
+    if "providers" in lowered:
+        # .../providers/{namespace}/{type}/{name}/{type}/{name}.../{action}
+        start = len(lowered) - lowered[::-1].index("providers")
+        rest = segments[start:]
+        return f"{method} " + "/".join(rest[:1] + rest[1::2])
+    if parsed.netloc.endswith(".blob.core.windows.net"):
+        comp = parse_qs(parsed.query).get("comp")
+        return f"{method} blob" + (f" {comp[0]}" if comp else "")
+    # /subscriptions/{id}/resourcegroups/{name}...: keep the collection names.
+    return f"{method} " + "/".join(segments[0::2])
@@ -1,11 +1,36 @@
-import os
 import datetime
 from datetime import datetime, timedelta, UTC
-from dotenv import load_dotenv
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.monitor import MonitorManagementClient
+from functools import cached_property
+from typing import TYPE_CHECKING
+from azure.core.exceptions import HttpResponseError
 
-load_dotenv(override=True)
+from shared.config import get_config
+from Azure.credential_cache import get_credential
+from shared.types.metric_point import (
+    Metric_Point,
+    METRICS,
+    CPU,
+    NETWORK_IN,
+    NETWORK_OUT,
+    DISK_READ,
+    DISK_WRITE,
+    CPU_CREDIT_BALANCE,
+)
+
+if TYPE_CHECKING:
+    from azure.monitor.query import MetricsClient
+
+# shared metric name -> (Azure Monitor metric name, aggregation)
+AZURE_METRICS = {
+    CPU: ("Percentage CPU", "Average"),
+    NETWORK_IN: ("Network In Total", "Total"),
+    NETWORK_OUT: ("Network Out Total", "Total"),
+    DISK_READ: ("Disk Read Bytes", "Total"),
+    DISK_WRITE: ("Disk Write Bytes", "Total"),
+    CPU_CREDIT_BALANCE: ("CPU Credits Remaining", "Average"),
+}
+# the metrics batch API accepts at most 50 resources per request.
+MAX_BATCH_RESOURCES = 50
 
 
 class Monitor_Wrapper:
@@ -20,8 +45,19 @@ class Monitor_Wrapper:
         """
         self.subscription_id = subscription_id
         self.resource_group_name = resource_group_name
-        credential = DefaultAzureCredential()
-        self.monitor_client = MonitorManagementClient(credential, subscription_id)
+
+    @cached_property
+    def credential(self):
+        return get_credential()
+
+    @cached_property
+    def monitor_client(self):
+        from azure.mgmt.monitor import MonitorManagementClient
+        from Azure.instrumentation import get_client_kwargs
+
+        return MonitorManagementClient(
+            self.credential, self.subscription_id, **get_client_kwargs()
+        )
 
     def get_metrics(
         self, vm_name: str, start_time: datetime, end_time: datetime
@@ -34,11 +70,7 @@ class Monitor_Wrapper:
         :param end_time: the end time for the metric analysis.
         :return:  A dictionary with the time period and CPU usage for each hour in the given time period.
         """
-        resource_id = (
-            "subscriptions/{}/"
-            "resourceGroups/{}/"
-            "providers/Microsoft.Compute/virtualMachines/{}"
-        ).format(self.subscription_id, self.resource_group_name, vm_name)
+        resource_id = self._get_resource_id(vm_name)
 
         response_data = self.monitor_client.metrics.list(
             resource_id,
@@ -64,11 +96,126 @@ class Monitor_Wrapper:
 
         return metrics_data
 
+    def get_metrics_batch(
+        self,
+        vm_names: list[str],
+        start_time: datetime,
+        end_time: datetime,
+        region: str = "eastus",
+        metrics: list[str] = METRICS,
+        interval: timedelta = timedelta(minutes=5),
+    ) -> list[Metric_Point]:
+        """
+        Fetches many metrics for many virtual machines with the Azure Monitor
+        metrics batch API, which takes up to 50 VMs of one region per request.
+
+        :param vm_names: the names of the virtual machines.
+        :param start_time: the start time for the metric analysis.
+        :param end_time: the end time for the metric analysis.
+        :param region: the region of the virtual machines.
+        :param metrics: the shared metric names to fetch (see shared.types.metric_point).
+        :param interval: the granularity of the datapoints.
+        :return: the datapoints of every virtual machine and metric.
+        """
+        from azure.monitor.query import MetricsClient
+        from Azure.instrumentation import get_client_kwargs
+
+        metrics_client = MetricsClient(
+            f"https://{region}.metrics.monitor.azure.com",
+            self.credential,
+            **get_client_kwargs(),
+        )
+        # Azure metric name -> shared metric name
+        metric_names = {AZURE_METRICS[metric][0]: metric for metric in metrics}
+        resource_ids = {
+            self._get_resource_id(vm_name).lower(): vm_name for vm_name in vm_names
+        }
+
+        metric_points: list[Metric_Point] = []
+        ids = list(resource_ids)
+        for offset in range(0, len(ids), MAX_BATCH_RESOURCES):
+            batch = ids[offset : offset + MAX_BATCH_RESOURCES]
+            try:
+                results = self._query_batch(
+                    metrics_client, batch, list(metric_names), start_time, end_time, interval
+                )
+            except HttpResponseError as ex:
+                # CPU credits only exist on burstable sizes and fail the whole batch otherwise.
+                if CPU_CREDIT_BALANCE not in metrics:
+                    raise ex
+                print("Retrying metrics batch without CPU credits", ex)
+                results = self._query_batch(
+                    metrics_client,
+                    batch,
+                    [
+                        name
+                        for name, metric in metric_names.items()
+                        if metric != CPU_CREDIT_BALANCE
+                    ],
+                    start_time,
+                    end_time,
+                    interval,
+                )
+
+            for result in results:
+                for item in result.metrics:
+                    # the metric id is <resource id>/providers/Microsoft.Insights/metrics/<name>
+                    resource_id = item.id.lower().split("/providers/microsoft.insights/")[0]
+                    vm_name = resource_ids.get(resource_id.lstrip("/"))
+                    metric = metric_names.get(item.name)
+                    if vm_name is None or metric is None:
+                        continue
+                    aggregation = AZURE_METRICS[metric][1]
+                    for timeserie in item.timeseries:
+                        for data in timeserie.data:
+                            value = (
+                                data.average if aggregation == "Average" else data.total
+                            )
+                            if value is None:
+                                continue
+                            metric_points.append(
+                                Metric_Point(
+                                    provider="Azure",
+                                    resource=vm_name,
+                                    metric=metric,
+                                    timestamp=data.timestamp,
+                                    value=value,
+                                )
+                            )
+
+        return metric_points
+
+    def _query_batch(
+        self,
+        metrics_client: "MetricsClient",
+        resource_ids: list[str],
+        metric_names: list[str],
+        start_time: datetime,
+        end_time: datetime,
+        interval: timedelta,
+    ):
+        return metrics_client.query_resources(
+            resource_ids=[f"/{resource_id}" for resource_id in resource_ids],
+            metric_namespace="Microsoft.Compute/virtualMachines",
+            metric_names=metric_names,
+            timespan=(start_time, end_time),
+            granularity=interval,
+            aggregations=["Average", "Total"],
+        )
+
+    def _get_resource_id(self, vm_name: str) -> str:
+        return (
+            "subscriptions/{}/"
+            "resourceGroups/{}/"
+            "providers/Microsoft.Compute/virtualMachines/{}"
+        ).format(self.subscription_id, self.resource_group_name, vm_name)
+
 
 if __name__ == "__main__":
-    subscription_id = os.getenv("azure_subscription_id")
-    resource_group_name = os.getenv("azure_resource_group_name")
-    vm_name = os.getenv("azure_vm_name")
+    config = get_config()
+    subscription_id = config.azure_subscription_id
+    resource_group_name = config.azure_resource_group_name
+    vm_name = config.azure_vm_name
     if subscription_id and resource_group_name and vm_name:
         monitor = Monitor_Wrapper(
             subscription_id=subscription_id, resource_group_name=resource_group_name
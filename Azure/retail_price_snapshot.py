@@ -0,0 +1,194 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from shared.call_metrics import instrument_session
+from shared.types.spot_price import Spot_Price
+
+RETAIL_PRICES_URL = "https://prices.azure.com/api/retail/prices"
+SPOT_METER_FILTER = (
+    "serviceName eq 'Virtual Machines' "
+    "and priceType eq 'Consumption' "
+    "and contains(meterName, 'Spot')"
+)
+DEFAULT_REFRESH_INTERVAL = timedelta(hours=6)
+
+
+class Retail_Price_Snapshot:
+    def __init__(
+        self,
+        base_url: str = RETAIL_PRICES_URL,
+        max_workers: int = 8,
+        refresh_interval: timedelta = DEFAULT_REFRESH_INTERVAL,
+        timeout: float = 30,
+    ):
+        """
+        Initializes a local snapshot of every Azure spot VM meter from the
+        retail prices API. Prices are indexed by (sku, region) so lookups are
+        a dictionary access instead of one OData query per call.
+
+        :param base_url: the retail prices endpoint. Can point to a local stand-in server.
+        :param max_workers: the number of pages downloaded concurrently.
+        :param refresh_interval: how often the background refresh re-downloads the snapshot.
+        :param timeout: the timeout (seconds) of each page request.
+        """
+        self.base_url = base_url
+        self.max_workers = max_workers
+        self.refresh_interval = refresh_interval
+        self.timeout = timeout
+        self.downloaded_at: datetime | None = None
+
+        self.session = instrument_session(requests.Session(), "Azure", "retail_prices")
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._prices: dict[tuple[str, str], Spot_Price] = {}
+        self._lock = threading.Lock()
+        # serializes the first download and starting the refresh thread.
+        self._start_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._refresh_thread: threading.Thread | None = None
+
+    def download(self) -> int:
+        """
+        Downloads every page of spot meters and swaps in the new index.
+        The first page reveals the page size, after which the remaining pages
+        are requested concurrently by their $skip offset instead of following
+        NextPageLink one page at a time.
+
+        :returns: the number of spot meters in the snapshot.
+        """
+        first_page = self._fetch_page(skip=0)
+        items = list(first_page.get("Items", []))
+        page_size = len(items)
+        done = not first_page.get("NextPageLink") or page_size == 0
+        next_skip = page_size
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while not done:
+                skips = [next_skip + i * page_size for i in range(self.max_workers)]
+                for page in executor.map(self._fetch_page, skips):
+                    page_items = page.get("Items", [])
+                    items.extend(page_items)
+                    if not page.get("NextPageLink") or len(page_items) < page_size:
+                        # the last page, anything after it in this wave is empty.
+                        done = True
+                        break
+                next_skip += self.max_workers * page_size
+
+        prices = self._index(items)
+        with self._lock:
+            self._prices = prices
+            self.downloaded_at = datetime.now(timezone.utc)
+        return len(items)
+
+    def ensure_downloaded(self):
+        """
+        Downloads the snapshot unless it was downloaded already. Concurrent
+        first callers wait for a single download instead of each running one.
+        """
+        if self.downloaded_at is not None:
+            return
+        with self._start_lock:
+            if self.downloaded_at is None:
+                self.download()
+
+    def get_spot_price(self, vm_type: str, region: str | None = None) -> Spot_Price | None:
+        """
+        Looks up the spot price of a VM type in the snapshot. Downloads the
+        snapshot on first use.
+
+        :param vm_type: the ARM sku name (Standard_D2_v4) or retail sku name (D2 v4 Spot).
+        :param region: the ARM region name (eastus). Defaults to the cheapest region.
+        :returns: the spot price, or None if the VM type is not offered as spot.
+        """
+        self.ensure_downloaded()
+
+        with self._lock:
+            if region:
+                return self._prices.get((vm_type, region))
+            prices = [
+                spot_price
+                for (sku, _), spot_price in self._prices.items()
+                if sku == vm_type
+            ]
+        return min(prices) if prices else None
+
+    def start_background_refresh(self):
+        """
+        Starts a daemon thread that re-downloads the snapshot every refresh interval.
+        A failed refresh keeps serving the previous snapshot.
+        """
+        with self._start_lock:
+            if self._refresh_thread and self._refresh_thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._refresh_thread = threading.Thread(
+                target=self._refresh_loop, name="retail-price-refresh", daemon=True
+            )
+            self._refresh_thread.start()
+
+    def stop_background_refresh(self):
+        self._stop_event.set()
+        if self._refresh_thread:
+            self._refresh_thread.join()
+            self._refresh_thread = None
+
+    def _refresh_loop(self):
+        while not self._stop_event.wait(self.refresh_interval.total_seconds()):
+            try:
+                self.download()
+            except Exception as ex:
+                print("Failed to refresh retail price snapshot", ex)
+
+    def _fetch_page(self, skip: int) -> dict:
+        params: dict[str, str | int] = {"$filter": SPOT_METER_FILTER}
+        if skip:
+            params["$skip"] = skip
+        response = self.session.get(self.base_url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def _index(self, items: list[dict]) -> dict[tuple[str, str], Spot_Price]:
+        """
+        Indexes the Linux spot meters by both the ARM sku name and the retail
+        sku name, keeping the cheapest meter per key.
+
+        :param items: the retail price items.
+        """
+        prices: dict[tuple[str, str], Spot_Price] = {}
+        for item in items:
+            region = item.get("armRegionName")
+            price = item.get("retailPrice")
+            if not region or price is None or "Windows" in item.get("productName", ""):
+                continue
+
+            effective_date = item.get("effectiveStartDate")
+            timestamp = (
+                datetime.fromisoformat(effective_date.replace("Z", "+00:00"))
+                if effective_date
+                else datetime.now(timezone.utc)
+            )
+
+            for sku in (item.get("armSkuName"), item.get("skuName")):
+                if not sku:
+                    continue
+                spot_price = Spot_Price(
+                    vm_type=sku, price=float(price), timestamp=timestamp
+                )
+                current = prices.get((sku, region))
+                if current is None or spot_price < current:
+                    prices[(sku, region)] = spot_price
+        return prices
+
+    def __len__(self):
+        return len(self._prices)
+
+
+if __name__ == "__main__":
+    snapshot = Retail_Price_Snapshot()
+    print("Spot meters", snapshot.download())
+    print(snapshot.get_spot_price("Standard_D2_v4", "eastus"))
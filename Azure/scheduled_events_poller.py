@@ -0,0 +1,76 @@
+import requests
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+from shared.call_metrics import instrument_session
+from shared.types.interruption_notice import Interruption_Notice
+
+INSTANCE_METADATA_URL = "http://169.254.169.254"
+SCHEDULED_EVENTS_PATH = "/metadata/scheduledevents"
+SCHEDULED_EVENTS_API_VERSION = "2020-07-01"
+# the events that take the VM away, as opposed to e.g. a Freeze of a few seconds.
+INTERRUPTION_EVENT_TYPES = ("Preempt", "Terminate")
+
+
+class Scheduled_Events_Poller:
+    def __init__(
+        self,
+        vm_name: str | None = None,
+        base_url: str = INSTANCE_METADATA_URL,
+        timeout: float = 1.0,
+    ):
+        """
+        Polls the Scheduled Events of an Azure VM for an eviction (Preempt)
+        or termination, which Azure posts at least 30 seconds before it
+        happens for spot VMs.
+
+        :param vm_name: the VM the events must affect, any VM if None.
+        :param base_url: the instance metadata endpoint. Can point to a local
+            stand-in server, or a forward of the VM's endpoint.
+        :param timeout: the timeout (seconds) of each request.
+        """
+        self.vm_name = vm_name
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = instrument_session(
+            requests.Session(), "Azure", "scheduled_events"
+        )
+
+    def poll(self) -> Interruption_Notice | None:
+        """
+        Reads the scheduled events of the VM.
+
+        :returns: the first eviction or termination of the VM, or None if there is none.
+        """
+        response = self.session.get(
+            self.base_url + SCHEDULED_EVENTS_PATH,
+            params={"api-version": SCHEDULED_EVENTS_API_VERSION},
+            headers={"Metadata": "true"},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+
+        for event in response.json().get("Events", []):
+            if event.get("EventType") not in INTERRUPTION_EVENT_TYPES:
+                continue
+            resources = event.get("Resources", [])
+            if self.vm_name and resources and self.vm_name not in resources:
+                continue
+            return Interruption_Notice(
+                provider="Azure",
+                action=event["EventType"],
+                time=_parse_not_before(event.get("NotBefore")),
+                resource=self.vm_name or (resources[0] if resources else None),
+                event_id=event.get("EventId"),
+            )
+        return None
+
+
+def _parse_not_before(not_before: str | None) -> datetime | None:
+    # e.g. Mon, 19 Sep 2016 18:29:47 GMT, empty once the event has started.
+    if not not_before:
+        return None
+    try:
+        return parsedate_to_datetime(not_before)
+    except (TypeError, ValueError):
+        return None
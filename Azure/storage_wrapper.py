@@ -1,11 +1,13 @@
-import os
-from dotenv import load_dotenv
-from datetime import datetime, timedelta, timezone
-from azure.identity import DefaultAzureCredential
-from azure.storage.blob import BlobServiceClient, generate_blob_sas, BlobSasPermissions
-from azure.mgmt.storage import StorageManagementClient
+from datetime import datetime
+from functools import cached_property
+from azure.core.exceptions import ResourceNotFoundError
 
-load_dotenv(override=True)
+from shared.config import get_config
+from Azure.credential_cache import account_key_cache, get_credential, sas_url_cache
+
+# the blob metadata key holding the SHA-256 of the uploaded content.
+DIGEST_METADATA_KEY = "sha256"
+MiB = 1024 * 1024
 
 
 class Storage_Wrapper:
@@ -14,6 +16,9 @@ class Storage_Wrapper:
         storage_account_name: str,
         subscription_id: str,
         resource_group_name: str,
+        max_block_size: int = 4 * MiB,
+        max_single_put_size: int = 8 * MiB,
+        max_concurrency: int = 8,
     ):
         """
         Initializes the Azure VM Wrapper with the necessary credentials and subscriptions.
@@ -22,28 +27,59 @@ class Storage_Wrapper:
 
         :param subscription_id: the subscription id for the virtual machines.
         :param resource_group_name: the resource group name attached to the subscription.
+        :param max_block_size: the size of each block of a chunked upload.
+        :param max_single_put_size: files larger than this are uploaded in blocks.
+        :param max_concurrency: the number of blocks uploaded in parallel per file.
         """
-        try:
-            account_url = f"https://{storage_account_name}.blob.core.windows.net"
-            credential = DefaultAzureCredential()
-            self.blob_service_client = BlobServiceClient(
-                account_url, credential=credential
-            )
-            self.storage_client = StorageManagementClient(
-                credential, subscription_id=subscription_id
-            )
-            self.storage_account_name = storage_account_name
-            self.resource_group_name = resource_group_name
-        except Exception as ex:
-            print("Failed to initialize Blob client", ex)
+        self.max_block_size = max_block_size
+        self.max_single_put_size = max_single_put_size
+        self.max_concurrency = max_concurrency
+        self.subscription_id = subscription_id
+        self.storage_account_name = storage_account_name
+        self.resource_group_name = resource_group_name
 
-    def upload_file(self, filepath: str, container_name: str, blob_name: str):
+    @cached_property
+    def blob_service_client(self):
+        # the storage SDKs are imported on first use to keep startup fast.
+        from azure.storage.blob import BlobServiceClient
+        from Azure.instrumentation import get_blob_client_kwargs
+
+        account_url = f"https://{self.storage_account_name}.blob.core.windows.net"
+        return BlobServiceClient(
+            account_url,
+            credential=get_credential(),
+            max_block_size=self.max_block_size,
+            max_single_put_size=self.max_single_put_size,
+            **get_blob_client_kwargs(),
+        )
+
+    @cached_property
+    def storage_client(self):
+        from azure.mgmt.storage import StorageManagementClient
+        from Azure.instrumentation import get_client_kwargs
+
+        return StorageManagementClient(
+            get_credential(),
+            subscription_id=self.subscription_id,
+            **get_client_kwargs(),
+        )
+
+    def upload_file(
+        self,
+        filepath: str,
+        container_name: str,
+        blob_name: str,
+        overwrite: bool = False,
+        digest: str | None = None,
+    ):
         """
-        Uploads a file as a blob to Azure Blob
+        Uploads a file as a blob to Azure Blob, in parallel blocks when it is large.
 
         :param filepath: the local path of the file to be uploaded.
         :param container_name: the name of the container to upload the file to.
         :param blob: the name of the blob (file) that will appear when uploaded to the container.
+        :param overwrite: replace the blob if it exists already.
+        :param digest: the SHA-256 of the file, stored in the blob metadata.
         """
         try:
             blob_client = self.blob_service_client.get_blob_client(
@@ -51,21 +87,71 @@ class Storage_Wrapper:
             )
             print("Uploading to Azure Storage as blob:\n\t" + blob_name)
             with open(file=filepath, mode="rb") as data:
-                blob_client.upload_blob(data)
+                blob_client.upload_blob(
+                    data,
+                    overwrite=overwrite,
+                    metadata={DIGEST_METADATA_KEY: digest} if digest else None,
+                    max_concurrency=self.max_concurrency,
+                )
                 print(f"Blob upload {blob_name} succeeded.")
         except Exception as ex:
             print("Failed to upload blob", ex)
+            raise ex
+
+    def download_file(self, container_name: str, blob_name: str, filepath: str):
+        """
+        Downloads a blob to a local file, in parallel blocks when it is large.
+
+        :param container_name: the name of the container that holds the blob.
+        :param blob: the name of the blob that is stored in the container.
+        :param filepath: the local path to write the blob to.
+        """
+        blob_client = self.blob_service_client.get_blob_client(
+            container=container_name, blob=blob_name
+        )
+        with open(file=filepath, mode="wb") as data:
+            blob_client.download_blob(max_concurrency=self.max_concurrency).readinto(
+                data
+            )
+
+    def get_digest(self, container_name: str, blob_name: str) -> str | None:
+        """
+        Gets the SHA-256 stored with the blob.
+
+        :param container_name: the name of the container that holds the blob.
+        :param blob: the name of the blob that is stored in the container.
+        :returns: the digest, or None if the blob or its digest does not exist.
+        """
+        blob_client = self.blob_service_client.get_blob_client(
+            container=container_name, blob=blob_name
+        )
+        try:
+            properties = blob_client.get_blob_properties()
+        except ResourceNotFoundError:
+            return None
+        return (properties.metadata or {}).get(DIGEST_METADATA_KEY)
 
     def get_blob_url(self, container_name: str, blob_name: str) -> str | None:
         """
         Gets the blob url for the particular blob on the container.
-        First retrieves the account key (refreshes periodically),
+        First retrieves the account key (cached for an hour),
         and then generates the blob sas (shared access signature)
-        to produce the url for retrieving the blob.
+        to produce the url for retrieving the blob. The url is reused
+        until shortly before it expires.
 
         :param container_name: the name of the container that holds the blob.
         :param blob: the name of the blob that is stored in the container.
         """
+        return sas_url_cache.get(
+            (self.storage_account_name, container_name, blob_name, "r"),
+            lambda expiry: self._generate_blob_url(container_name, blob_name, expiry),
+        )
+
+    def _generate_blob_url(
+        self, container_name: str, blob_name: str, expiry: datetime
+    ) -> str | None:
+        from azure.storage.blob import BlobSasPermissions, generate_blob_sas
+
         account_key = self._get_account_key()
         if account_key:
             sas_token = generate_blob_sas(
@@ -74,7 +160,7 @@ class Storage_Wrapper:
                 blob_name=blob_name,
                 account_key=account_key,
                 permission=BlobSasPermissions(read=True),
-                expiry=(datetime.now(timezone.utc) + timedelta(hours=1)),
+                expiry=expiry,
             )
 
             sas_url = f"https://{self.storage_account_name}.blob.core.windows.net/{container_name}/{blob_name}?{sas_token}"
@@ -101,8 +187,17 @@ class Storage_Wrapper:
         """
         Gets the first account key for the storage account.
         Two account keys for the storage account exists.
-        This method retrieves the first account key.
+        This method retrieves the first account key, shared through
+        account_key_cache with every wrapper of the same account.
         """
+        return account_key_cache.get(
+            self.subscription_id,
+            self.resource_group_name,
+            self.storage_account_name,
+            self._list_account_key,
+        )
+
+    def _list_account_key(self) -> str | None:
         keys = self.storage_client.storage_accounts.list_keys(
             self.resource_group_name, self.storage_account_name
         )
@@ -112,10 +207,11 @@ class Storage_Wrapper:
 
 
 if __name__ == "__main__":
-    storage_account_name = os.getenv("azure_storage_name")
-    container_name = os.getenv("azure_container_name")
-    subscription_id = os.getenv("azure_subscription_id")
-    resource_group_name = os.getenv("azure_resource_group_name")
+    config = get_config()
+    storage_account_name = config.azure_storage_name
+    container_name = config.azure_container_name
+    subscription_id = config.azure_subscription_id
+    resource_group_name = config.azure_resource_group_name
     if (
         storage_account_name
         and container_name
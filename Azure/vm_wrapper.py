@@ -1,25 +1,41 @@
 import os
 import re
 import json
-import paramiko
+import threading
+from functools import cached_property
+from typing import TYPE_CHECKING
 import requests
-from dotenv import load_dotenv
 from datetime import datetime, timedelta, timezone
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.compute import ComputeManagementClient
-from azure.mgmt.compute.models import RunCommandInput, RunCommandResult
 
-from Azure.storage_wrapper import Storage_Wrapper
+from shared.config import get_config
+from Azure.credential_cache import get_credential
+from Azure.cloudprice_cache import Cloudprice_Cache
+from Azure.cloudprice_fetcher import Cloudprice_Fetcher
+from Azure.retail_price_snapshot import Retail_Price_Snapshot, DEFAULT_REFRESH_INTERVAL
+from shared.rate_limiter import Rate_Limiter
 from shared.virtual_machine import Virtual_Machine
 from shared.types.spot_price import Spot_Price
+from shared.types.instance_shape import Instance_Shape
+from shared.types.interruption_notice import VMInterruptedException
+from shared.types.remote_command_exception import RemoteCommandException
 
-load_dotenv(override=True)
+if TYPE_CHECKING:
+    from shared.instance_catalog import Instance_Catalog
 
 MiB_MULTIPLIER = 1024
+CLOUDPRICE_MAX_CONCURRENCY = 8
+CLOUDPRICE_REQUESTS_PER_SECOND = 4
 
 
 class Azure_VM_Wrapper(Virtual_Machine):
-    def __init__(self, subscription_id: str, resource_group_name: str):
+    provider_name = "Azure"
+
+    def __init__(
+        self,
+        subscription_id: str,
+        resource_group_name: str,
+        price_refresh_interval: timedelta = DEFAULT_REFRESH_INTERVAL,
+    ):
         """
         Initializes the Azure VM Wrapper with the necessary credentials and subscriptions.
         Authenticates to the Azure account and creates a ComputeManageClient that provides
@@ -27,11 +43,30 @@ class Azure_VM_Wrapper(Virtual_Machine):
 
         :param subscription_id: the subscription id for the virtual machines.
         :param resource_group_name: the resource group name attached to the subscription.
+        :param price_refresh_interval: how often the retail spot price snapshot is refreshed.
         """
         self.subscription_id = subscription_id
         self.resource_group_name = resource_group_name
-        credential = DefaultAzureCredential()
-        self.compute_client = ComputeManagementClient(credential, subscription_id)
+        self.price_snapshot = Retail_Price_Snapshot(
+            refresh_interval=price_refresh_interval
+        )
+        self.price_history_cache = Cloudprice_Cache(
+            subscription_key=get_config().cloudnet_subscription_primary_key,
+            rate_limiter=Rate_Limiter(
+                rate=CLOUDPRICE_REQUESTS_PER_SECOND, burst=CLOUDPRICE_MAX_CONCURRENCY
+            ),
+            pool_size=CLOUDPRICE_MAX_CONCURRENCY,
+        )
+
+    @cached_property
+    def compute_client(self):
+        # the compute SDK is imported on first use, it dominates import time.
+        from azure.mgmt.compute import ComputeManagementClient
+        from Azure.instrumentation import get_client_kwargs
+
+        return ComputeManagementClient(
+            get_credential(), self.subscription_id, **get_client_kwargs()
+        )
 
     def describe_vms(self):
         """
@@ -83,7 +118,21 @@ class Azure_VM_Wrapper(Virtual_Machine):
             if status.code.startswith("PowerState/"):
                 return status.display_status
 
-    def execute_commands(self, commands: list[str]):
+    def execute_commands(
+        self, commands: list[str], interrupted: threading.Event | None = None
+    ):
+        """
+        Executes a command on the VM over SSH.
+
+        :param commands: the commands, only the first one is executed.
+        :param interrupted: when set, e.g. by an interruption notice, the
+            connection is closed and VMInterruptedException raised instead of
+            waiting for the command.
+        :returns: the standard output of the command.
+        :raises RemoteCommandException: if the command exited with an error.
+        """
+        import paramiko
+
         host = "9.169.218.248"
         username = "azureuser"
         key_file_path = "Azure/Azure_key-2.pem"
@@ -99,12 +148,25 @@ class Azure_VM_Wrapper(Virtual_Machine):
         # Execute the command
         _, stdout, stderr = ssh.exec_command(commands[0])
 
+        if interrupted is not None:
+            while not stdout.channel.exit_status_ready():
+                if interrupted.wait(0.5):
+                    ssh.close()
+                    raise VMInterruptedException(
+                        f"Command on {host} was interrupted."
+                    )
+
         # Read output
         output = stdout.read().decode()
-        _ = stderr.read().decode()
+        error = stderr.read().decode()
+        exit_status = stdout.channel.recv_exit_status()
 
         ssh.close()
 
+        if exit_status != 0:
+            raise RemoteCommandException(
+                f"Command on {host} exited with {exit_status}", stderr=error
+            )
         return output
 
     # def execute_commands(self, commands: list[str]):
@@ -146,7 +208,8 @@ class Azure_VM_Wrapper(Virtual_Machine):
     ) -> list[Spot_Price] | None:
         """
         Fetches the spot price history for a particular Azure virtual machine.
-        Uses the cloudprice API to fetch the prices from the past 30 days.
+        Uses the cloudprice API to fetch the prices from the past 30 days,
+        answered from the local cache when the history was recently fetched.
 
         :param vm_type: the VM name.
         :param start_time: the starting time for the spot price history.
@@ -154,123 +217,167 @@ class Azure_VM_Wrapper(Virtual_Machine):
         :param region: the region of the VM.
         :returns: a list of spot prices for the date range (max 30-days).
         """
-        url = f"https://data.cloudprice.net/api/v1/price_history_vm"
-        params = {
-            "vmname": vm_type,
-            "currency": "USD",
-            "timerange": "allAvailableTime",
-            "tier": "spot",
-            "payment": "payasyougo",
-        }
-
-        if region:
-            params["regions"] = region
-
-        headers = {
-            # Request headers
-            "Cache-Control": "no-cache",
-            "subscription-key": os.getenv("cloudnet_subscription_primary_key", ""),
-            "allowed-origins": "*",
-        }
-
-        spot_prices: list[Spot_Price] = []
-
-        response = requests.get(url=url, params=params, headers=headers)
-        if response.status_code == 200:
-            data = response.json()
-            history_price_values = data.get("listHistoryPriceValues", {})
-            for data in history_price_values:
-                timestamp = datetime.strptime(
-                    data.get("modifiedDate"), "%Y-%m-%d %H:%M:%S"
-                )
-                if timestamp < start_time or timestamp > end_time:
-                    # filter out timestamps that do not fit within the bounds.
-                    continue
-
-                vm = data.get("name")
-                price = data.get("linuxPrice")
-
-                if price:
-                    price = float(price)
-
-                if timestamp:
-                    timestamp = timestamp.replace(tzinfo=timezone.utc)
-
-                if vm and price and timestamp:
-                    spot_price = Spot_Price(
-                        vm_type=vm, price=price, timestamp=timestamp
-                    )
+        return self.price_history_cache.get_spot_price_history(
+            vm_type=vm_type, start_time=start_time, end_time=end_time, region=region
+        )
 
-                    spot_prices.append(spot_price)
-            return spot_prices
+    def get_spot_price_histories(
+        self,
+        vm_types: list[str],
+        start_time: datetime,
+        end_time: datetime,
+        regions: list[str | None] | None = None,
+    ) -> dict[tuple[str, str | None], list[Spot_Price] | None]:
+        """
+        Fetches the spot price histories of many VM types and regions
+        concurrently, e.g. every Azure candidate for a shape.
+
+        :param vm_types: the VM names.
+        :param start_time: the starting time for the spot price histories.
+        :param end_time: the ending time for the spot price histories.
+        :param regions: the regions of the VMs. Defaults to every region.
+        :returns: a mapping of (VM type, region) to its spot prices.
+        """
+        fetcher = Cloudprice_Fetcher(
+            cache=self.price_history_cache, max_concurrency=CLOUDPRICE_MAX_CONCURRENCY
+        )
+        return fetcher.fetch_all(
+            vm_types=vm_types,
+            regions=regions or [None],
+            start_time=start_time,
+            end_time=end_time,
+        )
 
     def get_spot_price(
-        self, vm_type: str, region: str | None = None
+        self,
+        vm_type: str | None = None,
+        vm_name: str | None = None,
+        region: str | None = None,
     ) -> Spot_Price | None:
         """
-        Fetches the current spot price for a particular Azure instance.
-        Since the spot prices update periodically, fetching the most recent
-        posted spot price will be used as the 'current' spot price.
+        Fetches the current spot price for a particular Azure instance from the
+        local retail price snapshot. The snapshot is downloaded on first use
+        and refreshed in the background.
 
         :param vm_type: the VM type to fetch the price for.
-        :param region: the region of the VM.
-        :returns: the most recently posted Spot Price.
+        :param vm_name: the name of a virtual machine, used to look up its VM type and region.
+        :param region: the region of the VM. Defaults to the cheapest region.
+        :returns: the current spot price.
         """
+        if vm_name:
+            vm = self.compute_client.virtual_machines.get(
+                self.resource_group_name, vm_name
+            )
+            if vm.hardware_profile and vm.hardware_profile.vm_size:
+                vm_type = vm.hardware_profile.vm_size
+            region = region or vm.location
 
-        # end_time = datetime.now()
-        # start_time = end_time - timedelta(days=30)
+        if not vm_type:
+            return None
 
-        # spot_prices = self.get_spot_price_history(
-        #     vm_type=vm_type, start_time=start_time, end_time=end_time, region=region
-        # )
+        self.price_snapshot.ensure_downloaded()
+        self.price_snapshot.start_background_refresh()
 
-        # if spot_prices:
-        #     # return the  most recent spot price
-        #     return spot_prices[0]
+        return self.price_snapshot.get_spot_price(vm_type=vm_type, region=region)
 
-        api_url = "https://prices.azure.com/api/retail/prices"
-        query = f"contains(meterName, 'Spot') and skuName eq '{vm_type}'"
-        if region:
-            query += f" and armRegionName eq '{region}'"
-        response = requests.get(api_url, params={"$filter": query})
+    @cached_property
+    def instance_catalog(self) -> "Instance_Catalog":
+        """
+        The catalog of the Azure VM sizes of every region, persisted per
+        provider and re-listed once it is older than its TTL.
+        """
+        from shared.instance_catalog import Instance_Catalog, get_catalog_path
 
-        if response.status_code == 200:
-            data = response.json()
-            items = data.get("Items", {})
+        return Instance_Catalog(
+            providers=[self], path=get_catalog_path(self.provider_name)
+        )
 
-            if items:
-                for item in items:
-                    print(
-                        f"{item['productName']}: ${item['retailPrice']} per hour in location {item['location']}"
-                    )
-            else:
-                print("No spot pricing data found for the specified instance.")
-        else:
-            print("Failed to fetch pricing data:", response.status_code)
-            print(response.text)
+    def find_matching_vm_types(
+        self, vcpus: int, memory: int, region: str | None = None
+    ) -> list[str]:
+        """
+        Finds all VM sizes that match the vCPUs and memory.
 
-    def find_matching_vm_types(self, vcpus: int, memory: int):
-        # List VM sizes in the specified region
-        vm_sizes = self.compute_client.virtual_machine_sizes.list("eastus")
+        :param vcpus: the amount of vCPUs that each VM size must match.
+        :param memory: the amount of memory (GiB) that each VM size must match.
+        :param region: the region each VM size must be offered in, e.g. eastus.
+            Defaults to any region.
+        :returns: list of all Azure VM sizes that match the vCPUs and memory.
+        """
+        shapes = self.instance_catalog.find(
+            vcpus=vcpus,
+            memory=memory,
+            provider=self.provider_name,
+            region=region,
+            spot_only=False,
+        )
+        return [shape.name for shape in shapes]
 
-        # Filter for 16 vCPUs and 64 GB RAM
-        matching_vms = [
-            size.name
-            for size in vm_sizes
-            if size.number_of_cores == vcpus
-            and size.memory_in_mb == memory * MiB_MULTIPLIER
-            and size.name
-        ]
+    def list_instance_shapes(
+        self, regions: list[str] | None = None
+    ) -> list[Instance_Shape]:
+        """
+        Describes every Azure VM size (vCPUs, memory, GPUs and spot support)
+        along with the regions that offer it. A single resource SKU listing
+        covers every region, unlike virtual_machine_sizes which is per region.
 
-        return matching_vms
+        :param regions: the regions to keep. Defaults to every region.
+        :returns: list of all Azure VM shapes.
+        """
+        shapes: dict[str, Instance_Shape] = {}
+
+        for sku in self.compute_client.resource_skus.list():
+            if sku.resource_type != "virtualMachines" or not sku.name:
+                continue
+
+            # locations where the size is restricted for this subscription.
+            restricted = {
+                location.lower()
+                for restriction in sku.restrictions or []
+                if restriction.type == "Location"
+                for location in restriction.values or []
+            }
+            locations = [
+                location.lower()
+                for location in sku.locations or []
+                if location.lower() not in restricted
+                and (not regions or location.lower() in regions)
+            ]
+
+            if sku.name in shapes:
+                # the SKU list has one entry per location.
+                for location in locations:
+                    if location not in shapes[sku.name].regions:
+                        shapes[sku.name].regions.append(location)
+                continue
+
+            capabilities = {
+                capability.name: capability.value
+                for capability in sku.capabilities or []
+            }
+            if "vCPUs" not in capabilities or "MemoryGB" not in capabilities:
+                continue
+
+            shapes[sku.name] = Instance_Shape(
+                provider=self.provider_name,
+                name=sku.name,
+                vcpus=int(capabilities["vCPUs"]),
+                memory_mib=int(float(capabilities["MemoryGB"]) * MiB_MULTIPLIER),
+                gpus=int(capabilities.get("GPUs", 0)),
+                supports_spot=capabilities.get("LowPriorityCapable") == "True",
+                regions=locations,
+            )
+
+        return list(shapes.values())
 
 
 if __name__ == "__main__":
-    subscription_id = os.getenv("azure_subscription_id")
-    resource_group_name = os.getenv("azure_resource_group_name")
-    vm_name = os.getenv("azure_vm_name")
-    container_name = os.getenv("azure_container_name")
-    storage_name = os.getenv("azure_storage_name")
+    config = get_config()
+    subscription_id = config.azure_subscription_id
+    resource_group_name = config.azure_resource_group_name
+    vm_name = config.azure_vm_name
+    container_name = config.azure_container_name
+    storage_name = config.azure_storage_name
     if (
         subscription_id
         and resource_group_name
@@ -1,31 +1,92 @@
-import os
 import ast
-import time
-from dotenv import load_dotenv
+import threading
 from datetime import datetime, timedelta
 from botocore.exceptions import ClientError
-from paramiko.ssh_exception import NoValidConnectionsError
 from decimal import Decimal
+from shared.config import get_config
 from AWS.ec2_wrapper import EC2_Wrapper
 from Azure.vm_wrapper import Azure_VM_Wrapper
 from AWS.dynamo_db_wrapper import DynamoDB_Wrapper
-from analyzer.web_scraper import Web_Scraper, WebsiteNotFoundException
+from analyzer.web_scraper import Web_Scraper
+from analyzer.article_archive import Article_Archive
+from analyzer.concurrency_controller import Concurrency_Controller
+from analyzer.spot_forecaster import Spot_Forecaster, DEFAULT_PREWARM_THRESHOLD
+from analyzer.interruption_watcher import Interruption_Watcher
+from analyzer.retry_queue import (
+    Retry_Queue,
+    DEFAULT_DEAD_LETTER_PATH,
+    NOT_FOUND,
+    classify_error,
+)
 from shared.log import Log
+from shared.types.interruption_notice import VMInterruptedException
+from shared.clock import Clock
+from shared.call_metrics import call_metrics
+from shared.phase_tracer import Phase_Tracer
+from shared.metrics_store import Metrics_Store
+from shared.types.metric_point import CPU
+from shared.id_status_index import Id_Status_Index, STORED, MISSING, FAILED
 
-load_dotenv(override=True)
+# how long the loop waits before checking a booting VM again.
+BOOT_POLL_INTERVAL = 5
 
 
 class Analyzer:
-    def __init__(self, ec2: EC2_Wrapper, azure: Azure_VM_Wrapper):
+    def __init__(
+        self,
+        ec2: EC2_Wrapper,
+        azure: Azure_VM_Wrapper,
+        controller: Concurrency_Controller | None = None,
+        metrics_store: Metrics_Store | None = None,
+        archive: Article_Archive | None = None,
+        tracer: Phase_Tracer | None = None,
+        clock: Clock | None = None,
+        wiki_db: DynamoDB_Wrapper | None = None,
+        log_db: DynamoDB_Wrapper | None = None,
+        forecaster: Spot_Forecaster | None = None,
+        prewarm_threshold: float = DEFAULT_PREWARM_THRESHOLD,
+        watcher: Interruption_Watcher | None = None,
+        retry_queue: Retry_Queue | None = None,
+        id_index: Id_Status_Index | None = None,
+    ):
         self.ec2 = ec2
         self.azure = azure
-        self.wiki_db = DynamoDB_Wrapper(
+        self.wiki_db = wiki_db or DynamoDB_Wrapper(
             table_name="wikipedia_table", partition_key="id"
         )
-        self.log_db = DynamoDB_Wrapper(table_name="log_table", partition_key="id")
+        self.log_db = log_db or DynamoDB_Wrapper(
+            table_name="log_table", partition_key="id"
+        )
+        # every read of the time and every sleep goes through the clock, so
+        # a backtest can drive the loop from a Virtual_Clock.
+        self.clock = clock or Clock()
         self.web_scraper = Web_Scraper()
         # start with ec2, switch over to azure
         self.vm: EC2_Wrapper | Azure_VM_Wrapper = ec2
+        # sizes the number of tasks dispatched to each VM at once.
+        self.controller = controller or Concurrency_Controller()
+        # CPU utilization ingested by Metrics_Ingestor, fed to the controller.
+        self.metrics_store = metrics_store
+        # DynamoDB_Wrapper.put_item reads then writes latest_id, so concurrent
+        # tasks write to the table one at a time.
+        self._db_lock = threading.Lock()
+        # when set, articles are archived in compressed segments instead of
+        # one wiki_db item each.
+        self.archive = archive
+        # times the phases of run_simulation, disabled unless one is passed.
+        self.tracer = tracer or Phase_Tracer(sample_rate=0)
+        # when set, the loop follows the cheaper cloud instead of alternating
+        # and keeps the other VM warm while a flip is likely.
+        self.forecaster = forecaster
+        self.prewarm_threshold = prewarm_threshold
+        # whether the VM not in use was started ahead of a forecast flip.
+        self.prewarmed = False
+        # when set, work moves off a VM as soon as it gets an interruption notice.
+        self.watcher = watcher
+        # failed ids waiting for their retry, dispatched before new ones once due.
+        self.retry_queue = retry_queue or Retry_Queue(clock=self.clock)
+        # when set, ids already stored or known to be missing are never dispatched.
+        self.id_index = id_index
 
     def get_last_id(self) -> int:
         return self.wiki_db.get_latest_id()
@@ -36,14 +97,15 @@ class Analyzer:
         end_time: datetime,
         vm_name: str,
         num_uploads: int,
+        instance: str | None = None,
     ):
         prev_log = None
         log_id = self.log_db.get_latest_id()
         if log_id == 0:
             prev_log = Log(
                 id=0,
-                start_time=start_time.strftime("%Y-%m-%dT%H:%M:%SZ"),
-                end_time=end_time.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                start_time=self._format_log_time(start_time),
+                end_time=self._format_log_time(end_time),
                 virtual_machine=vm_name,
                 num_uploads=0,
                 total_uploads=0,
@@ -54,9 +116,9 @@ class Analyzer:
             prev_log = self.log_db.get_item(key=str(log_id))
 
         if vm_name == "AWS":
-            spot_price = self.ec2.get_spot_price(vm_name=vm_name)
+            spot_price = self.ec2.get_spot_price(vm_name=instance)
         else:
-            spot_price = self.azure.get_spot_price(vm_type=vm_name)
+            spot_price = self.azure.get_spot_price(vm_name=instance)
 
         cost = Decimal(str(spot_price.price)) if spot_price else Decimal(0)
         total_uploads = (
@@ -72,8 +134,8 @@ class Analyzer:
 
         new_log = Log(
             id=log_id + 1,
-            start_time=start_time.strftime("%Y-%m-%dT%H:%M:%SZ"),
-            end_time=end_time.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            start_time=self._format_log_time(start_time),
+            end_time=self._format_log_time(end_time),
             virtual_machine=vm_name,
             num_uploads=num_uploads,
             total_uploads=total_uploads,
@@ -82,25 +144,221 @@ class Analyzer:
         )
         self.log_db.put_item(id=new_log.id, item=new_log.to_dict())
 
-    def execute_task(self, id: int, is_aws: bool) -> bool:
-        # uses a web scraper to scrape a Wikipedia article
-        # and store its content to a database.
+    def _format_log_time(self, time: datetime) -> str:
+        # log times are read as UTC by Cost_Reconciler and Log_Store.
+        return self.clock.to_utc(time).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def execute_task(self, id: int, is_aws: bool) -> tuple[bool, bool]:
+        """
+        Uses a web scraper on the VM to scrape a Wikipedia article and stores
+        its content to a database.
+
+        :param id: the Wikipedia article id.
+        :param is_aws: whether the current VM is the EC2 instance.
+        :returns: whether the article was uploaded, and whether the VM handled
+            the task, i.e. it did not fail for a reason other than the article
+            being missing, stored already or the VM being reclaimed.
+        """
+        vm = self.vm
+        # the VM the command runs on, which lags is_aws while the new VM boots.
+        interrupted = self.watcher.get_event(vm.provider_name) if self.watcher else None
         try:
             user = "ec2-user" if is_aws else "azureuser"
 
-            response = self.vm.execute_commands(
-                commands=[f"python3 /home/{user}/web_scraper.py {id}"]
-            )
+            if interrupted is not None and interrupted.is_set():
+                raise VMInterruptedException(
+                    f"{vm.provider_name} has an interruption notice."
+                )
+            with self.tracer.phase(
+                "remote_exec", id=id, vm="AWS" if is_aws else "Azure"
+            ):
+                response = vm.execute_commands(
+                    commands=[f"python3 /home/{user}/web_scraper.py {id}"],
+                    interrupted=interrupted,
+                )
             print("RESPONSE", response)
             if response:
-                response = ast.literal_eval(response)
-                self.wiki_db.put_item(id=id, item=response)
-            return True
-        except (WebsiteNotFoundException, ClientError):
-            return False
-        except (NoValidConnectionsError, Exception):
-            time.sleep(5)
-            return False
+                with self.tracer.phase("parse", id=id):
+                    response = ast.literal_eval(response)
+                with self.tracer.phase("db_write", id=id):
+                    if self.archive:
+                        self.archive.add(id=id, item=response)
+                    else:
+                        with self._db_lock:
+                            self.wiki_db.put_item(id=id, item=response)
+                if self.id_index:
+                    self.id_index.set(id, STORED)
+            self.retry_queue.succeeded(id)
+            return True, True
+        except Exception as ex:
+            if isinstance(ex, VMInterruptedException) or (
+                interrupted is not None and interrupted.is_set()
+            ):
+                # the VM is being reclaimed, the task is retried on the other one.
+                self.retry_queue.requeue(id)
+                return False, True
+            elif (
+                isinstance(ex, ClientError)
+                and ex.response.get("Error", {}).get("Code")
+                == "ConditionalCheckFailedException"
+            ):
+                # the article is stored already.
+                self.retry_queue.succeeded(id)
+                if self.id_index:
+                    self.id_index.set(id, STORED)
+                return False, True
+            else:
+                # e.g. paramiko's NoValidConnectionsError, retried after a backoff.
+                dead_letter = self.retry_queue.schedule(id, ex)
+                if dead_letter and self.id_index:
+                    self.id_index.set(
+                        id, MISSING if dead_letter.reason == NOT_FOUND else FAILED
+                    )
+                # a missing article is an answer from a healthy VM.
+                return False, classify_error(ex) == NOT_FOUND
+
+    def execute_batch(self, ids: list[int], is_aws: bool) -> int:
+        """
+        Executes the tasks concurrently on the current VM and reports their
+        latency and outcome to the concurrency controller.
+
+        :param ids: the Wikipedia article ids to scrape.
+        :param is_aws: whether the current VM is the EC2 instance.
+        :returns: the number of successful tasks.
+        """
+        vm_label = "AWS" if is_aws else "Azure"
+
+        def timed_task(id: int) -> bool:
+            task_start = self.clock.monotonic()
+            uploaded, healthy = self.execute_task(id=id, is_aws=is_aws)
+            self.controller.record(
+                vm_label, latency=self.clock.monotonic() - task_start, success=healthy
+            )
+            return uploaded
+
+        num_successes = sum(
+            self.clock.map(timed_task, ids, max_workers=max(len(ids), 1))
+        )
+
+        self.controller.update(vm_label)
+        return num_successes
+
+    def record_utilization(self, aws_instance: str, azure_vm: str):
+        """
+        Feeds the latest stored CPU utilization of both VMs to the controller.
+
+        :param aws_instance: the EC2 instance id.
+        :param azure_vm: the Azure VM name.
+        """
+        if not self.metrics_store:
+            return
+        for vm_label, provider, resource in (
+            ("AWS", "AWS", aws_instance),
+            ("Azure", "Azure", azure_vm),
+        ):
+            metric_points = self.metrics_store.query(
+                provider=provider,
+                resource=resource,
+                metric=CPU,
+                start_time=self.clock.to_utc(self.clock.now()) - timedelta(minutes=15),
+            )
+            if metric_points:
+                self.controller.record_cpu(vm_label, metric_points[-1].value)
+
+    def follow_prices(self, aws_instance: str, azure_vm: str, is_aws: bool) -> bool:
+        """
+        Feeds the current spot prices to the forecaster and picks the cheaper
+        VM. The other VM is started early while the forecaster expects the
+        cheaper cloud to flip within its horizon, and stopped once it no
+        longer does, so a switch does not wait for the VM to boot.
+
+        :param aws_instance: the EC2 instance id.
+        :param azure_vm: the Azure VM name.
+        :param is_aws: whether the EC2 instance is the VM in use.
+        :returns: whether the EC2 instance is the VM to use next.
+        """
+        if not self.forecaster:
+            return is_aws
+        aws_price = self.ec2.get_spot_price(vm_name=aws_instance)
+        azure_price = self.azure.get_spot_price(vm_name=azure_vm)
+        if not aws_price or not azure_price:
+            return is_aws
+
+        now = self.clock.now()
+        self.forecaster.observe(now, aws_price.price, azure_price.price)
+        use_aws = aws_price.price <= azure_price.price
+        probability = self.forecaster.predict(now) or 0.0
+        prewarm = probability >= self.prewarm_threshold
+
+        if use_aws != is_aws:
+            if self.prewarmed and not prewarm:
+                # the warm VM takes over, so run_simulation will not stop the previous one.
+                self._stop_vm(is_aws=is_aws, aws_instance=aws_instance, azure_vm=azure_vm)
+                self.prewarmed = False
+            # otherwise the previous VM either stays warm for a flip back, or
+            # is stopped by run_simulation when it starts the new one.
+        elif prewarm and not self.prewarmed:
+            self._start_vm(is_aws=not use_aws, aws_instance=aws_instance, azure_vm=azure_vm)
+            self.prewarmed = True
+        elif not prewarm and self.prewarmed:
+            self._stop_vm(is_aws=not use_aws, aws_instance=aws_instance, azure_vm=azure_vm)
+            self.prewarmed = False
+        return use_aws
+
+    def reroute(self, aws_instance: str, azure_vm: str, is_aws: bool) -> bool:
+        """
+        Moves work off the VM in use as soon as it has an interruption notice,
+        unless the other VM has one too.
+
+        :param aws_instance: the EC2 instance id.
+        :param azure_vm: the Azure VM name.
+        :param is_aws: whether the EC2 instance is the VM in use.
+        :returns: whether the EC2 instance is the VM to use next.
+        """
+        if not self.watcher:
+            return is_aws
+        vm_label, other_label = ("AWS", "Azure") if is_aws else ("Azure", "AWS")
+        if not self.watcher.is_interrupted(vm_label) or self.watcher.is_interrupted(
+            other_label
+        ):
+            return is_aws
+        if self.prewarmed:
+            # the warm VM takes over, so run_simulation will not stop the interrupted one.
+            self._stop_vm(is_aws=is_aws, aws_instance=aws_instance, azure_vm=azure_vm)
+            self.prewarmed = False
+        return not is_aws
+
+    def take_ids(self, curr_id: int, batch_size: int) -> tuple[list[int], int]:
+        """
+        Takes the ids of the next batch, the retries that are due first.
+
+        Ids the id index knows the outcome of are skipped.
+
+        :param curr_id: the next id never dispatched.
+        :param batch_size: the number of ids to take.
+        :returns: the ids and the next id never dispatched after them.
+        """
+        ids = self.retry_queue.take(batch_size)
+        num_new = batch_size - len(ids)
+        if self.id_index:
+            new_ids, curr_id = self.id_index.take(start=curr_id, count=num_new)
+            return ids + new_ids, curr_id
+        ids.extend(range(curr_id, curr_id + num_new))
+        return ids, curr_id + num_new
+
+    def _start_vm(self, is_aws: bool, aws_instance: str, azure_vm: str):
+        with self.tracer.phase("start_vm", vm="AWS" if is_aws else "Azure", prewarm=True):
+            if is_aws:
+                self.ec2.start_instance(instance_id=aws_instance)
+            else:
+                self.azure.start_vm(vm_name=azure_vm)
+
+    def _stop_vm(self, is_aws: bool, aws_instance: str, azure_vm: str):
+        with self.tracer.phase("stop_vm", vm="AWS" if is_aws else "Azure"):
+            if is_aws:
+                self.ec2.stop_instance(instance_id=aws_instance)
+            else:
+                self.azure.stop_vm(vm_name=azure_vm)
 
     def run_simulation(
         self,
@@ -114,57 +372,151 @@ class Analyzer:
         curr_id = prev_id
         num_uploads = 0
         is_aws = True
+        if self.id_index and not self.id_index.skip_failed:
+            # ids that failed in earlier runs lie before prev_id, so they are
+            # retried through the retry queue, ahead of new ids.
+            for id in self.id_index.get_ids(FAILED):
+                self.retry_queue.requeue(id)
 
-        while datetime.now() > start_time and datetime.now() < end_time:
-            if prev_log_time == None:
-                prev_log_time = datetime.now()
-
-            # updates every 5 minutes, continues processing until termination.
-            curr_time = datetime.now()
-            if curr_time - timedelta(minutes=5) >= prev_log_time:
-                self.log_data(
-                    start_time=prev_log_time,
-                    end_time=curr_time,
-                    vm_name="AWS" if is_aws else "Azure",
-                    num_uploads=num_uploads,
-                )
-                prev_log_time = curr_time
-                num_uploads = 0
-                is_aws = not is_aws
-            if is_aws and self.ec2.get_instance_state(instance_id=aws_instance) != "running":
-                self.ec2.start_instance(instance_id=aws_instance)
-                self.azure.stop_vm(vm_name=azure_vm)
-            if not is_aws and self.azure.get_vm_state(vm_name=azure_vm) != "VM running":
-                self.azure.start_vm(vm_name=azure_vm)
-                self.ec2.stop_instance(instance_id=aws_instance)
+        while self.clock.now() > start_time and self.clock.now() < end_time:
+            with self.tracer.iteration(vm="AWS" if is_aws else "Azure", id=curr_id):
+                if prev_log_time == None:
+                    prev_log_time = self.clock.now()
+
+                # updates every 5 minutes, continues processing until termination.
+                curr_time = self.clock.now()
+                if curr_time - timedelta(minutes=5) >= prev_log_time:
+                    with self.tracer.phase("log_data"):
+                        self.log_data(
+                            start_time=prev_log_time,
+                            end_time=curr_time,
+                            vm_name="AWS" if is_aws else "Azure",
+                            num_uploads=num_uploads,
+                            instance=aws_instance if is_aws else azure_vm,
+                        )
+                    prev_log_time = curr_time
+                    num_uploads = 0
+                    if self.forecaster:
+                        with self.tracer.phase("forecast"):
+                            is_aws = self.follow_prices(
+                                aws_instance=aws_instance,
+                                azure_vm=azure_vm,
+                                is_aws=is_aws,
+                            )
+                    else:
+                        is_aws = not is_aws
+                    with self.tracer.phase("record_utilization"):
+                        self.record_utilization(
+                            aws_instance=aws_instance, azure_vm=azure_vm
+                        )
+                    if self.archive:
+                        with self.tracer.phase("db_write", flush=True):
+                            # a failed flush keeps the articles for the next one.
+                            self.archive.flush(raise_errors=False)
+                    if self.id_index:
+                        with self.tracer.phase("save_index"):
+                            self.id_index.save()
+                if self.watcher:
+                    is_aws = self.reroute(
+                        aws_instance=aws_instance, azure_vm=azure_vm, is_aws=is_aws
+                    )
+                with self.tracer.phase("state_check"):
+                    running = (
+                        self.ec2.get_instance_state(instance_id=aws_instance) == "running"
+                        if is_aws
+                        else self.azure.get_vm_state(vm_name=azure_vm) == "VM running"
+                    )
+                if is_aws and not running:
+                    with self.tracer.phase("start_vm", vm="AWS"):
+                        self.ec2.start_instance(instance_id=aws_instance)
+                    if self.watcher:
+                        # a notice from before the instance was reclaimed is stale.
+                        self.watcher.clear("AWS")
+                    with self.tracer.phase("stop_vm", vm="Azure"):
+                        self.azure.stop_vm(vm_name=azure_vm)
+                    self.prewarmed = False
+                if not is_aws and not running:
+                    with self.tracer.phase("start_vm", vm="Azure"):
+                        self.azure.start_vm(vm_name=azure_vm)
+                    if self.watcher:
+                        self.watcher.clear("Azure")
+                    with self.tracer.phase("stop_vm", vm="AWS"):
+                        self.ec2.stop_instance(instance_id=aws_instance)
+                    self.prewarmed = False
 
-            if is_aws and self.ec2.get_instance_state(instance_id=aws_instance) == "running":
-                self.vm = self.ec2
-            if not is_aws and self.azure.get_vm_state(vm_name=azure_vm) == "VM running":
-                self.vm = self.azure
+                if not running:
+                    with self.tracer.phase("state_check"):
+                        running = (
+                            self.ec2.get_instance_state(instance_id=aws_instance)
+                            == "running"
+                            if is_aws
+                            else self.azure.get_vm_state(vm_name=azure_vm)
+                            == "VM running"
+                        )
+                if not running:
+                    # the VM is still booting, tasks dispatched now would only fail.
+                    self.clock.sleep(BOOT_POLL_INTERVAL)
+                    continue
+                self.vm = self.ec2 if is_aws else self.azure
 
-            success = self.execute_task(id=curr_id, is_aws=is_aws)
-            if success:
-                num_uploads += 1
-            curr_id += 1
+                batch_size = self.controller.get_limit("AWS" if is_aws else "Azure")
+                ids, curr_id = self.take_ids(curr_id=curr_id, batch_size=batch_size)
+                with self.tracer.phase("execute_batch", size=batch_size):
+                    num_uploads += self.execute_batch(ids=ids, is_aws=is_aws)
+
+        if self.archive:
+            self.archive.flush()
+        if self.id_index:
+            self.id_index.save()
 
 
 if __name__ == "__main__":
-    instance_id = os.getenv("aws_instance_id")
-    subscription_id = os.getenv("azure_subscription_id")
-    resource_group_name = os.getenv("azure_resource_group_name")
-    azure_vm_name = os.getenv("azure_vm_name")
+    config = get_config()
+    instance_id = config.aws_instance_id
+    subscription_id = config.azure_subscription_id
+    resource_group_name = config.azure_resource_group_name
+    azure_vm_name = config.azure_vm_name
     if subscription_id and resource_group_name and instance_id and azure_vm_name:
         ec2 = EC2_Wrapper()
         azure = Azure_VM_Wrapper(
             subscription_id=subscription_id, resource_group_name=resource_group_name
         )
-        analyzer = Analyzer(ec2=ec2, azure=azure)
-        id = analyzer.get_last_id()
-        analyzer.run_simulation(
-            aws_instance=instance_id,
-            azure_vm=azure_vm_name,
-            start_time=datetime.now(),
-            end_time=datetime.now() + timedelta(hours=6),
-            prev_id=analyzer.get_last_id(),
+        # traces every 10th iteration of the loop.
+        tracer = Phase_Tracer(sample_rate=0.1)
+        # polls the metadata endpoints in the config for interruption notices.
+        # They are only reachable from inside each VM, so aws_metadata_url and
+        # azure_metadata_url must point to a forward of them (or a stub). A VM
+        # without one is not watched, and without either nothing is.
+        watcher = Interruption_Watcher.from_config(azure_vm=azure_vm_name)
+        if not watcher.pollers:
+            watcher = None
+        # failed ids are retried with backoff, exhausted ones are recorded on disk.
+        retry_queue = Retry_Queue(dead_letter_path=DEFAULT_DEAD_LETTER_PATH)
+        analyzer = Analyzer(
+            ec2=ec2,
+            azure=azure,
+            tracer=tracer,
+            watcher=watcher,
+            retry_queue=retry_queue,
+            # skips ids stored or found missing by earlier runs.
+            id_index=Id_Status_Index(),
         )
+        id = analyzer.get_last_id()
+        # scrape http://127.0.0.1:9464/metrics while the simulation runs.
+        call_metrics.serve()
+        if watcher:
+            watcher.start()
+        try:
+            analyzer.run_simulation(
+                aws_instance=instance_id,
+                azure_vm=azure_vm_name,
+                start_time=datetime.now(),
+                end_time=datetime.now() + timedelta(hours=6),
+                prev_id=analyzer.get_last_id(),
+            )
+        finally:
+            if watcher:
+                watcher.stop()
+            call_metrics.write_prometheus()
+            call_metrics.write_json()
+            tracer.write()
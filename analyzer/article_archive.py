@@ -0,0 +1,277 @@
+import os
+import gzip
+import json
+import boto3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any
+
+from shared.config import get_config
+from AWS.dynamo_db_wrapper import DynamoDB_Wrapper
+from AWS.s3_wrapper import S3_Wrapper
+from Azure.storage_wrapper import Storage_Wrapper
+from shared.output_writer import Output_Writer
+
+ARTICLE_FIELDS = ["id", "url", "content"]
+ARTICLE_TYPES = {"id": "int64", "url": "string", "content": "string"}
+SEGMENT_EXTENSIONS = {"jsonl": "jsonl.gz", "parquet": "parquet"}
+DEFAULT_SEGMENT_SIZE = 1000
+# ids are indexed in blocks of this size, one DynamoDB item per block.
+DEFAULT_INDEX_BLOCK_SIZE = 10000
+DEFAULT_CACHE_DIR = os.path.join(".cache", "segments")
+
+
+class Article_Archive:
+    def __init__(
+        self,
+        index_db: DynamoDB_Wrapper,
+        s3: S3_Wrapper | None = None,
+        bucket: str | None = None,
+        storage: Storage_Wrapper | None = None,
+        container_name: str | None = None,
+        segment_size: int = DEFAULT_SEGMENT_SIZE,
+        format: str = "jsonl",
+        prefix: str = "articles/",
+        cache_dir: str = DEFAULT_CACHE_DIR,
+        index_block_size: int = DEFAULT_INDEX_BLOCK_SIZE,
+        max_loaded_segments: int = 8,
+    ):
+        """
+        Archives scraped articles in compressed segments on S3 or Azure Blob
+        instead of one DynamoDB item per article. Articles are buffered until
+        a segment is full, and the segment is then uploaded as one gzipped
+        JSONL or zstd Parquet object. DynamoDB only keeps a small index: one
+        item per block of ids, listing the id range of each segment in the
+        block.
+
+        Point reads look up the index and read the segment from a local
+        cache, so only the first read of a segment downloads it.
+
+        :param index_db: the table holding the id -> segment index and latest_id.
+        :param s3: the S3 wrapper the segments are uploaded through.
+        :param bucket: the S3 bucket of the segments.
+        :param storage: the Azure storage wrapper, used when S3 is not configured.
+        :param container_name: the blob container of the segments.
+        :param segment_size: the number of articles per segment.
+        :param format: jsonl or parquet.
+        :param prefix: prepended to every segment key.
+        :param cache_dir: the directory segments are cached in.
+        :param index_block_size: the number of ids covered by each index item.
+        :param max_loaded_segments: the number of parsed segments kept in memory.
+        """
+        if format not in SEGMENT_EXTENSIONS:
+            raise ValueError(f"Unsupported segment format {format}")
+        if not (s3 and bucket) and not (storage and container_name):
+            raise ValueError("Either an S3 bucket or a blob container is required")
+
+        self.index_db = index_db
+        self.s3 = s3
+        self.bucket = bucket
+        self.storage = storage
+        self.container_name = container_name
+        self.segment_size = segment_size
+        self.format = format
+        self.prefix = prefix
+        self.cache_dir = cache_dir
+        self.index_block_size = index_block_size
+        self.max_loaded_segments = max_loaded_segments
+
+        self._buffer: list[dict[str, Any]] = []
+        self._buffer_lock = threading.Lock()
+        # serializes flushes so segments are uploaded and indexed in id order.
+        self._flush_lock = threading.Lock()
+        self._segments: OrderedDict[str, dict[int, dict[str, Any]]] = OrderedDict()
+        self._segments_lock = threading.Lock()
+
+    def add(self, id: int, item: dict[str, Any]):
+        """
+        Buffers a scraped article, uploading a segment once the buffer is full.
+
+        :param id: the Wikipedia article id.
+        :param item: the scraped article, e.g. {"url": ..., "content": ...}.
+        """
+        with self._buffer_lock:
+            self._buffer.append({**item, "id": int(id)})
+            full = len(self._buffer) >= self.segment_size
+        if full:
+            # a failed segment is not the fault of this article, it stays buffered.
+            self.flush(raise_errors=False)
+
+    def flush(self, raise_errors: bool = True) -> str | None:
+        """
+        Uploads the buffered articles as one segment and indexes it. If the
+        upload or the index fails, the articles are put back into the buffer
+        so the next flush retries them.
+
+        :param raise_errors: whether a failure is raised or only logged.
+        :returns: the key of the uploaded segment, or None if the buffer was
+            empty or the flush failed.
+        """
+        try:
+            return self._flush()
+        except Exception as ex:
+            if raise_errors:
+                raise ex
+            print("Failed to flush archive segment", ex)
+            return None
+
+    def _flush(self) -> str | None:
+        with self._flush_lock:
+            with self._buffer_lock:
+                articles, self._buffer = self._buffer, []
+            if not articles:
+                return None
+
+            articles.sort(key=lambda article: article["id"])
+            first_id, last_id = articles[0]["id"], articles[-1]["id"]
+            content_hash = hashlib.sha256(
+                json.dumps(articles, sort_keys=True).encode()
+            ).hexdigest()[:12]
+            segment = "{}{:012d}-{:012d}-{}.{}".format(
+                self.prefix,
+                first_id,
+                last_id,
+                content_hash,
+                SEGMENT_EXTENSIONS[self.format],
+            )
+
+            filepath = self._get_cache_path(segment)
+            self._write_segment(filepath, articles)
+            try:
+                self._upload(filepath, segment)
+                self._index(segment, articles)
+            except Exception as ex:
+                # put the articles back so the next flush retries them.
+                with self._buffer_lock:
+                    self._buffer = articles + self._buffer
+                raise ex
+            return segment
+
+    def get(self, id: int) -> dict[str, Any] | None:
+        """
+        Reads one archived article.
+
+        :param id: the Wikipedia article id.
+        :returns: the article, or None if it is not archived.
+        """
+        segment = self.find_segment(id)
+        if not segment:
+            return None
+        return self._load_segment(segment).get(int(id))
+
+    def find_segment(self, id: int) -> str | None:
+        """
+        Finds the key of the segment holding the article through the index.
+        The id ranges of segments overlap, e.g. a flush in the middle of a
+        batch splits it across two segments and retried ids land in later
+        ones, so every segment whose range covers the id is checked, the
+        latest first.
+
+        :param id: the Wikipedia article id.
+        """
+        response = self.index_db.get_item(key=self._get_block_key(int(id)))
+        entries = response.get("Item", {}).get("segments", {}).get("L", [])
+        for entry in reversed(entries):
+            entry = entry["M"]
+            if int(entry["first"]["N"]) <= int(id) <= int(entry["last"]["N"]):
+                segment = entry["segment"]["S"]
+                if int(id) in self._load_segment(segment):
+                    return segment
+        return None
+
+    def _index(self, segment: str, articles: list[dict[str, Any]]):
+        """
+        Adds the segment to the index item of every id block it covers,
+        then advances latest_id so the crawl resumes after the segment.
+        """
+        blocks: dict[int, tuple[int, int]] = {}
+        for article in articles:
+            block = article["id"] // self.index_block_size
+            first, last = blocks.get(block, (article["id"], article["id"]))
+            blocks[block] = (min(first, article["id"]), max(last, article["id"]))
+
+        for block, (first, last) in blocks.items():
+            self.index_db.append_to_list(
+                key=f"archive_{block}",
+                attribute="segments",
+                values=[{"segment": segment, "first": first, "last": last}],
+            )
+        self.index_db.update_latest_id(articles[-1]["id"])
+
+    def _get_block_key(self, id: int) -> str:
+        return f"archive_{id // self.index_block_size}"
+
+    def _get_cache_path(self, segment: str) -> str:
+        filepath = os.path.join(self.cache_dir, *segment.split("/"))
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        return filepath
+
+    def _write_segment(self, filepath: str, articles: list[dict[str, Any]]):
+        if self.format == "parquet":
+            Output_Writer(
+                fieldnames=ARTICLE_FIELDS, field_types=ARTICLE_TYPES
+            ).write_parquet(filepath, articles)
+            return
+        with gzip.open(filepath, "wt", encoding="utf-8") as file:
+            for article in articles:
+                file.write(json.dumps(article) + "\n")
+
+    def _read_segment(self, filepath: str) -> list[dict[str, Any]]:
+        if filepath.endswith(".parquet"):
+            import pyarrow.parquet as pq
+
+            return pq.read_table(filepath).to_pylist()
+        with gzip.open(filepath, "rt", encoding="utf-8") as file:
+            return [json.loads(line) for line in file]
+
+    def _upload(self, filepath: str, segment: str):
+        if self.s3 and self.bucket:
+            self.s3.upload_file(filepath, self.bucket, segment)
+        else:
+            self.storage.upload_file(filepath, self.container_name, segment)
+
+    def _download(self, segment: str, filepath: str):
+        # download next to the final path so a partial file is never cached.
+        temp_path = f"{filepath}.tmp"
+        if self.s3 and self.bucket:
+            self.s3.download_file(self.bucket, segment, temp_path)
+        else:
+            self.storage.download_file(self.container_name, segment, temp_path)
+        os.replace(temp_path, filepath)
+
+    def _load_segment(self, segment: str) -> dict[int, dict[str, Any]]:
+        """
+        Gets the parsed segment from memory, the local cache or the bucket.
+        """
+        with self._segments_lock:
+            if segment in self._segments:
+                self._segments.move_to_end(segment)
+                return self._segments[segment]
+
+        filepath = self._get_cache_path(segment)
+        if not os.path.exists(filepath):
+            self._download(segment, filepath)
+        articles = {
+            int(article["id"]): article for article in self._read_segment(filepath)
+        }
+
+        with self._segments_lock:
+            self._segments[segment] = articles
+            while len(self._segments) > self.max_loaded_segments:
+                self._segments.popitem(last=False)
+        return articles
+
+
+if __name__ == "__main__":
+    config = get_config()
+    bucket = config.aws_bucket_name
+    archive = Article_Archive(
+        index_db=DynamoDB_Wrapper(table_name="wikipedia_table", partition_key="id"),
+        s3=S3_Wrapper(boto3.client("s3")),
+        bucket=bucket,
+        segment_size=2,
+    )
+    archive.add(1, {"url": "https://en.wikipedia.org/?curid=1", "content": "a"})
+    archive.add(2, {"url": "https://en.wikipedia.org/?curid=2", "content": "b"})
+    print(archive.get(1))
@@ -0,0 +1,181 @@
+import os
+import json
+import boto3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from shared.config import get_config
+from AWS.s3_wrapper import S3_Wrapper
+from Azure.storage_wrapper import Storage_Wrapper
+
+DEFAULT_MANIFEST_PATH = os.path.join(".cache", "artifact_digests.json")
+HASH_CHUNK_SIZE = 1024 * 1024
+
+UPLOADED = "uploaded"
+SKIPPED = "skipped"
+FAILED = "failed"
+
+
+class Artifact_Sync:
+    def __init__(
+        self,
+        s3: S3_Wrapper | None = None,
+        bucket: str | None = None,
+        storage: Storage_Wrapper | None = None,
+        container_name: str | None = None,
+        max_workers: int = 8,
+        manifest_path: str = DEFAULT_MANIFEST_PATH,
+    ):
+        """
+        Pushes the worker artifacts (e.g. web_scraper.py) to S3 and Azure Blob
+        at once. Every upload is tagged with the SHA-256 of its content, and
+        artifacts whose remote copy already has the same digest are skipped,
+        so a redeploy only uploads what changed.
+
+        Local digests are kept in a manifest keyed by (size, mtime), so
+        unchanged files are not hashed again either.
+
+        :param s3: the S3 wrapper, or None to skip S3.
+        :param bucket: the S3 bucket the artifacts are pushed to.
+        :param storage: the Azure storage wrapper, or None to skip Azure Blob.
+        :param container_name: the blob container the artifacts are pushed to.
+        :param max_workers: the number of artifacts uploaded concurrently.
+        :param manifest_path: the JSON file the local digests are cached in.
+        """
+        self.s3 = s3
+        self.bucket = bucket
+        self.storage = storage
+        self.container_name = container_name
+        self.max_workers = max_workers
+        self.manifest_path = manifest_path
+        self._manifest: dict[str, dict] = self._load_manifest()
+        self._lock = threading.Lock()
+
+    def sync(self, filepaths: list[str], prefix: str = "") -> dict[tuple[str, str], str]:
+        """
+        Uploads every artifact to every configured cloud unless the remote
+        copy already has the same digest.
+
+        :param filepaths: the local artifacts.
+        :param prefix: prepended to the file name to form the key or blob name.
+        :returns: uploaded, skipped or failed for every (cloud, name).
+        """
+        artifacts = [
+            (filepath, prefix + os.path.basename(filepath)) for filepath in filepaths
+        ]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            digests = dict(
+                zip(filepaths, executor.map(self.get_digest, filepaths))
+            )
+            self._save_manifest()
+
+            tasks = [
+                (cloud, filepath, name)
+                for filepath, name in artifacts
+                for cloud in self._get_clouds()
+            ]
+            results = executor.map(
+                lambda task: self._sync_artifact(
+                    task[0], task[1], task[2], digests[task[1]]
+                ),
+                tasks,
+            )
+            return {
+                (cloud, name): result
+                for (cloud, _, name), result in zip(tasks, results)
+            }
+
+    def get_digest(self, filepath: str) -> str:
+        """
+        Gets the SHA-256 of the file, hashing it only if it changed since the
+        last sync.
+
+        :param filepath: the local artifact.
+        """
+        stat = os.stat(filepath)
+        key = os.path.abspath(filepath)
+        with self._lock:
+            entry = self._manifest.get(key)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry["digest"]
+
+        sha256 = hashlib.sha256()
+        with open(filepath, "rb") as file:
+            while chunk := file.read(HASH_CHUNK_SIZE):
+                sha256.update(chunk)
+        digest = sha256.hexdigest()
+
+        with self._lock:
+            self._manifest[key] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "digest": digest,
+            }
+        return digest
+
+    def _get_clouds(self) -> list[str]:
+        clouds = []
+        if self.s3 and self.bucket:
+            clouds.append("AWS")
+        if self.storage and self.container_name:
+            clouds.append("Azure")
+        return clouds
+
+    def _sync_artifact(self, cloud: str, filepath: str, name: str, digest: str) -> str:
+        """
+        Uploads one artifact to one cloud if its remote digest differs.
+        """
+        try:
+            if cloud == "AWS" and self.s3 and self.bucket:
+                if self.s3.get_digest(self.bucket, name) == digest:
+                    return SKIPPED
+                self.s3.upload_file(filepath, self.bucket, name, digest=digest)
+            elif cloud == "Azure" and self.storage and self.container_name:
+                if self.storage.get_digest(self.container_name, name) == digest:
+                    return SKIPPED
+                self.storage.upload_file(
+                    filepath, self.container_name, name, overwrite=True, digest=digest
+                )
+            return UPLOADED
+        except Exception as ex:
+            print(f"Failed to sync {name} to {cloud}", ex)
+            return FAILED
+
+    def _load_manifest(self) -> dict[str, dict]:
+        try:
+            with open(self.manifest_path) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self):
+        directory = os.path.dirname(self.manifest_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.manifest_path}.tmp"
+        with self._lock:
+            with open(temp_path, "w") as file:
+                json.dump(self._manifest, file)
+        os.replace(temp_path, self.manifest_path)
+
+
+if __name__ == "__main__":
+    config = get_config()
+    bucket = config.aws_bucket_name
+    storage_account_name = config.azure_storage_name
+    container_name = config.azure_container_name
+    subscription_id = config.azure_subscription_id
+    resource_group_name = config.azure_resource_group_name
+    storage = (
+        Storage_Wrapper(storage_account_name, subscription_id, resource_group_name)
+        if storage_account_name and subscription_id and resource_group_name
+        else None
+    )
+    artifact_sync = Artifact_Sync(
+        s3=S3_Wrapper(boto3.client("s3")),
+        bucket=bucket,
+        storage=storage,
+        container_name=container_name,
+    )
+    print(artifact_sync.sync(["analyzer/web_scraper.py"]))
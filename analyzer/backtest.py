@@ -0,0 +1,480 @@
+import json
+import bisect
+import random
+import threading
+import contextlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Sequence
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
+
+from shared.clock import Virtual_Clock
+from shared.config import get_config
+from shared.virtual_machine import Virtual_Machine
+from shared.timestamps import to_naive_utc
+from shared.types.spot_price import Spot_Price
+from shared.types.instance_shape import Instance_Shape
+from shared.types.interruption_notice import VMInterruptedException
+from analyzer.analyzer import Analyzer
+from analyzer.concurrency_controller import Concurrency_Controller
+from analyzer.retry_queue import Retry_Queue
+from analyzer.spot_forecaster import Spot_Forecaster, DEFAULT_PREWARM_THRESHOLD
+
+DEFAULT_AWS_BOOT_TIME = timedelta(seconds=60)
+DEFAULT_AZURE_BOOT_TIME = timedelta(seconds=120)
+# what simulated tasks return, an empty article so that parsing it does not
+# dominate the cost of each simulated task.
+SIMULATED_RESPONSE = "{}"
+
+STOPPED = "stopped"
+STARTING = "starting"
+RUNNING = "running"
+
+
+class Replayed_Prices:
+    def __init__(self, spot_prices: list[Spot_Price]):
+        """
+        A recorded spot price series. The price at a time is the latest one
+        recorded at or before it, the way spot prices are billed.
+
+        :param spot_prices: the recorded prices, e.g. from get_spot_price_history.
+        """
+        self.spot_prices = sorted(
+            spot_prices, key=lambda spot_price: to_naive_utc(spot_price.timestamp)
+        )
+        self.timestamps = [
+            to_naive_utc(spot_price.timestamp) for spot_price in self.spot_prices
+        ]
+
+    def get(self, time: datetime) -> Spot_Price | None:
+        """
+        Gets the price in effect at the time, or the first price before the series starts.
+        """
+        if not self.spot_prices:
+            return None
+        index = bisect.bisect_right(self.timestamps, to_naive_utc(time)) - 1
+        return self.spot_prices[max(index, 0)]
+
+    def window(self, start_time: datetime, end_time: datetime) -> list[Spot_Price]:
+        start = bisect.bisect_left(self.timestamps, to_naive_utc(start_time))
+        end = bisect.bisect_right(self.timestamps, to_naive_utc(end_time))
+        return self.spot_prices[start:end]
+
+    def get_cost(self, start_time: datetime, end_time: datetime) -> float:
+        """
+        Integrates the hourly price over the interval.
+
+        :returns: the cost of running from start_time to end_time.
+        """
+        start_time, end_time = to_naive_utc(start_time), to_naive_utc(end_time)
+        if not self.spot_prices or end_time <= start_time:
+            return 0.0
+
+        cost = 0.0
+        index = max(bisect.bisect_right(self.timestamps, start_time) - 1, 0)
+        segment_start = start_time
+        while segment_start < end_time:
+            # the price at index holds until the next change, the last one until end_time.
+            segment_end = (
+                min(max(self.timestamps[index + 1], segment_start), end_time)
+                if index + 1 < len(self.timestamps)
+                else end_time
+            )
+            hours = (segment_end - segment_start).total_seconds() / 3600
+            cost += self.spot_prices[index].price * hours
+            segment_start = segment_end
+            index += 1
+        return cost
+
+
+class Simulated_VM(Virtual_Machine):
+    def __init__(
+        self,
+        clock: Virtual_Clock,
+        prices: Replayed_Prices,
+        task_latencies: Sequence[float],
+        boot_time: timedelta,
+        failure_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        """
+        A VM driven by a virtual clock. Starting it takes boot_time, tasks
+        take a latency drawn from the recorded ones, and it is billed at the
+        replayed spot price from the moment it is started until it is stopped.
+
+        :param clock: the clock of the backtest.
+        :param prices: the replayed spot prices of the VM.
+        :param task_latencies: the recorded task latencies in seconds.
+        :param boot_time: how long the VM takes from start to running.
+        :param failure_rate: the fraction of tasks that fail on a running VM.
+        :param seed: seeds the latency and failure draws.
+        """
+        if not task_latencies:
+            raise ValueError("At least one task latency is required")
+        self.clock = clock
+        self.prices = prices
+        self.task_latencies = list(task_latencies)
+        self.boot_time = boot_time
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+
+        self.state = STOPPED
+        self.ready_at: datetime | None = None
+        self.billed_since: datetime | None = None
+        self.cost = 0.0
+        self.starts = 0
+        self.tasks = 0
+        self.failed_tasks = 0
+
+    def execute_commands(
+        self, commands: list[str], interrupted: threading.Event | None = None
+    ) -> str:
+        self.tasks += 1
+        if interrupted is not None and interrupted.is_set():
+            raise VMInterruptedException("The VM has an interruption notice")
+        if self._get_state() != RUNNING:
+            self.failed_tasks += 1
+            raise ConnectionError("The VM is not running")
+        self.clock.sleep(self.random.choice(self.task_latencies))
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            self.failed_tasks += 1
+            raise RuntimeError("The simulated task failed")
+        return SIMULATED_RESPONSE
+
+    def get_cost(self) -> float:
+        """
+        Gets the cost so far, including the running interval that is still open.
+        """
+        if self.billed_since is None:
+            return self.cost
+        return self.cost + self.prices.get_cost(self.billed_since, self.clock.now())
+
+    def get_spot_price(
+        self,
+        vm_type: str | None = None,
+        vm_name: str | None = None,
+        region: str | None = None,
+    ) -> Spot_Price | None:
+        return self.prices.get(self.clock.now())
+
+    def get_spot_price_history(
+        self,
+        vm_type: str,
+        start_time: datetime,
+        end_time: datetime,
+        region: str | None = None,
+    ) -> list[Spot_Price] | None:
+        return self.prices.window(start_time, end_time)
+
+    def list_instance_shapes(self, regions: list[str] | None = None) -> list[Instance_Shape]:
+        return []
+
+    def _start(self):
+        if self.state != STOPPED:
+            return
+        self.state = STARTING
+        self.ready_at = self.clock.now() + self.boot_time
+        self.billed_since = self.clock.now()
+        self.starts += 1
+
+    def _stop(self):
+        if self.state == STOPPED:
+            return
+        self.cost = self.get_cost()
+        self.state = STOPPED
+        self.ready_at = self.billed_since = None
+
+    def _get_state(self) -> str:
+        if self.state == STARTING and self.ready_at and self.clock.now() >= self.ready_at:
+            self.state = RUNNING
+        return self.state
+
+
+class Simulated_EC2(Simulated_VM):
+    provider_name = "AWS"
+    STATES = {STOPPED: "stopped", STARTING: "pending", RUNNING: "running"}
+
+    def get_instance_state(self, instance_id: str) -> str:
+        return self.STATES[self._get_state()]
+
+    def start_instance(self, instance_id: str):
+        self._start()
+
+    def stop_instance(self, instance_id: str):
+        self._stop()
+
+
+class Simulated_Azure_VM(Simulated_VM):
+    provider_name = "Azure"
+    STATES = {STOPPED: "VM deallocated", STARTING: "VM starting", RUNNING: "VM running"}
+
+    def get_vm_state(self, vm_name: str) -> str:
+        return self.STATES[self._get_state()]
+
+    def start_vm(self, vm_name: str):
+        self._start()
+
+    def stop_vm(self, vm_name: str):
+        self._stop()
+
+
+class Memory_Table:
+    def __init__(self, partition_key: str = "id"):
+        """
+        An in-memory stand-in for the DynamoDB_Wrapper methods Analyzer
+        uses. Items are kept as plain values and only converted to DynamoDB's
+        attribute value format when read, so reads look like the real table's
+        while writes stay cheap.
+
+        :param partition_key: the partition key of the table.
+        """
+        self.partition_key = partition_key
+        self.items: dict[str, dict[str, Any]] = {}
+        self.latest_id = 0
+        self._serializer = TypeSerializer()
+
+    def put_item(self, id: int, item: dict[str, Any]):
+        item[self.partition_key] = str(id)
+        if str(id) in self.items:
+            raise ClientError(
+                {"Error": {"Code": "ConditionalCheckFailedException"}}, "PutItem"
+            )
+        self.items[str(id)] = item
+        self.update_latest_id(int(id))
+
+    def update_latest_id(self, id: int):
+        self.latest_id = max(self.latest_id, id)
+
+    def get_latest_id(self) -> int:
+        return self.latest_id
+
+    def get_item(self, key: str) -> dict[str, Any]:
+        if key == "latest_id":
+            return {"Item": {"latest": {"S": str(self.latest_id)}}}
+        item = self.items.get(key)
+        if not item:
+            return {}
+        return {
+            "Item": {
+                name: self._serializer.serialize(value) for name, value in item.items()
+            }
+        }
+
+
+class Backtest_Result:
+    def __init__(
+        self,
+        start_time: datetime,
+        end_time: datetime,
+        uploads: int,
+        tasks: int,
+        failed_tasks: int,
+        switches: int,
+        cost: dict[str, float],
+        forecast: dict[str, Any] | None = None,
+        retries: dict[str, Any] | None = None,
+    ):
+        """
+        The outcome of a backtest.
+
+        :param uploads: the number of articles stored.
+        :param tasks: the number of tasks dispatched.
+        :param failed_tasks: the number of tasks that failed, e.g. on a booting VM.
+        :param switches: the number of times a VM was started after the first.
+        :param cost: the cost of each provider.
+        :param forecast: the accuracy of the flip forecasts, if a forecaster was used.
+        :param retries: the retries and dead letters of failed tasks.
+        """
+        self.start_time = start_time
+        self.end_time = end_time
+        self.uploads = uploads
+        self.tasks = tasks
+        self.failed_tasks = failed_tasks
+        self.switches = switches
+        self.cost = cost
+        self.forecast = forecast
+        self.retries = retries
+
+    @property
+    def total_cost(self) -> float:
+        return sum(self.cost.values())
+
+    @property
+    def throughput(self) -> float:
+        """
+        The number of articles stored per hour.
+        """
+        hours = (self.end_time - self.start_time).total_seconds() / 3600
+        return self.uploads / hours if hours > 0 else 0.0
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "start_time": self.start_time.isoformat(),
+            "end_time": self.end_time.isoformat(),
+            "uploads": self.uploads,
+            "tasks": self.tasks,
+            "failed_tasks": self.failed_tasks,
+            "switches": self.switches,
+            "cost": self.cost,
+            "total_cost": self.total_cost,
+            "throughput": self.throughput,
+            "cost_per_upload": self.total_cost / self.uploads if self.uploads else None,
+            "forecast": self.forecast,
+            "retries": self.retries,
+        }
+
+    def __repr__(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+
+class Backtest:
+    def __init__(
+        self,
+        aws_prices: list[Spot_Price],
+        azure_prices: list[Spot_Price],
+        aws_latencies: Sequence[float],
+        azure_latencies: Sequence[float],
+        start_time: datetime,
+        end_time: datetime,
+        aws_boot_time: timedelta = DEFAULT_AWS_BOOT_TIME,
+        azure_boot_time: timedelta = DEFAULT_AZURE_BOOT_TIME,
+        failure_rate: float = 0.0,
+        controller: Concurrency_Controller | None = None,
+        forecaster: Spot_Forecaster | None = None,
+        prewarm_threshold: float = DEFAULT_PREWARM_THRESHOLD,
+        seed: int = 0,
+    ):
+        """
+        Replays recorded spot prices and task latencies through the
+        unchanged Analyzer.run_simulation, on a virtual clock with simulated
+        VMs and in-memory tables, so a week of operation runs in seconds.
+
+        Times are naive UTC, matching the timestamps of the price series.
+
+        :param aws_prices: the recorded spot prices of the EC2 instance.
+        :param azure_prices: the recorded spot prices of the Azure VM.
+        :param aws_latencies: the recorded task latencies on the EC2 instance.
+        :param azure_latencies: the recorded task latencies on the Azure VM.
+        :param start_time: the start of the simulated period.
+        :param end_time: the end of the simulated period.
+        :param aws_boot_time: how long the EC2 instance takes to start.
+        :param azure_boot_time: how long the Azure VM takes to start.
+        :param failure_rate: the fraction of tasks that fail on a running VM.
+        :param controller: the concurrency controller, a fresh one by default.
+        :param forecaster: when set, the loop follows the cheaper cloud and
+            pre-warms the other VM, and the forecasts are scored.
+        :param prewarm_threshold: the flip probability the other VM is started at.
+        :param seed: seeds the latency and failure draws.
+        """
+        self.start_time = to_naive_utc(start_time)
+        self.end_time = to_naive_utc(end_time)
+        self.clock = Virtual_Clock(self.start_time)
+        self.ec2 = Simulated_EC2(
+            self.clock,
+            Replayed_Prices(aws_prices),
+            aws_latencies,
+            aws_boot_time,
+            failure_rate=failure_rate,
+            seed=seed,
+        )
+        self.azure = Simulated_Azure_VM(
+            self.clock,
+            Replayed_Prices(azure_prices),
+            azure_latencies,
+            azure_boot_time,
+            failure_rate=failure_rate,
+            seed=seed + 1,
+        )
+        self.wiki_db = Memory_Table()
+        self.log_db = Memory_Table()
+        self.analyzer = Analyzer(
+            ec2=self.ec2,  # type: ignore[arg-type]
+            azure=self.azure,  # type: ignore[arg-type]
+            controller=controller,
+            clock=self.clock,
+            wiki_db=self.wiki_db,  # type: ignore[arg-type]
+            log_db=self.log_db,  # type: ignore[arg-type]
+            forecaster=forecaster,
+            prewarm_threshold=prewarm_threshold,
+            retry_queue=Retry_Queue(clock=self.clock, seed=seed),
+        )
+        self.forecaster = forecaster
+
+    def run(self) -> Backtest_Result:
+        """
+        Runs the simulation from start_time to end_time.
+        """
+        # run_simulation only loops once the clock is past start_time.
+        loop_start = self.start_time - timedelta(microseconds=1)
+        # execute_task prints every response, print is a no-op without stdout.
+        with contextlib.redirect_stdout(None):
+            self.analyzer.run_simulation(
+                aws_instance="simulated-ec2",
+                azure_vm="simulated-azure-vm",
+                start_time=loop_start,
+                end_time=self.end_time,
+            )
+        self.ec2.stop_instance(instance_id="simulated-ec2")
+        self.azure.stop_vm(vm_name="simulated-azure-vm")
+
+        return Backtest_Result(
+            start_time=self.start_time,
+            end_time=self.clock.now(),
+            uploads=len(self.wiki_db.items),
+            tasks=self.ec2.tasks + self.azure.tasks,
+            failed_tasks=self.ec2.failed_tasks + self.azure.failed_tasks,
+            switches=max(self.ec2.starts + self.azure.starts - 1, 0),
+            cost={"AWS": self.ec2.get_cost(), "Azure": self.azure.get_cost()},
+            forecast=self.forecaster.get_accuracy() if self.forecaster else None,
+            retries=self.analyzer.retry_queue.get_summary(),
+        )
+
+
+def load_task_latencies(trace_path: str) -> dict[str, list[float]]:
+    """
+    Reads the recorded task latencies of each VM from a run_simulation trace
+    written by Phase_Tracer.
+
+    :param trace_path: the Chrome trace JSON file.
+    :returns: the remote execution latencies in seconds, keyed by AWS or Azure.
+    """
+    with open(trace_path) as file:
+        events = json.load(file)["traceEvents"]
+    latencies: dict[str, list[float]] = {}
+    for event in events:
+        if event.get("name") == "remote_exec" and "vm" in event.get("args", {}):
+            latencies.setdefault(event["args"]["vm"], []).append(event["dur"] / 1e6)
+    return latencies
+
+
+
+if __name__ == "__main__":
+    from AWS.ec2_wrapper import EC2_Wrapper
+    from Azure.vm_wrapper import Azure_VM_Wrapper
+    from shared.phase_tracer import DEFAULT_TRACE_PATH
+
+    config = get_config()
+    subscription_id = config.azure_subscription_id
+    resource_group_name = config.azure_resource_group_name
+    end_time = datetime.now(timezone.utc).replace(tzinfo=None)
+    start_time = end_time - timedelta(days=7)
+    if subscription_id and resource_group_name:
+        azure = Azure_VM_Wrapper(subscription_id, resource_group_name)
+        latencies = load_task_latencies(DEFAULT_TRACE_PATH)
+        backtest = Backtest(
+            # Azure: D2 v4, AWS: m4.large, both 2vCPU and 8GiB.
+            aws_prices=EC2_Wrapper().get_spot_price_history(
+                "m4.large", start_time, end_time
+            )
+            or [],
+            azure_prices=azure.get_spot_price_history(
+                "Standard_D2_v4", start_time, end_time
+            )
+            or [],
+            aws_latencies=latencies.get("AWS", [10.0]),
+            azure_latencies=latencies.get("Azure", [10.0]),
+            start_time=start_time,
+            end_time=end_time,
+            forecaster=Spot_Forecaster(),
+        )
+        print(backtest.run())
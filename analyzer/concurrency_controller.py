@@ -0,0 +1,160 @@
+import threading
+from collections import deque
+
+
+class VM_Target:
+    def __init__(
+        self,
+        target_latency: float = 30.0,
+        max_error_rate: float = 0.1,
+        target_cpu: float = 80.0,
+        min_limit: int = 1,
+        max_limit: int = 32,
+        additive_increase: float = 1.0,
+        multiplicative_decrease: float = 0.5,
+    ):
+        """
+        The tuning targets of one VM for the concurrency controller.
+
+        :param target_latency: the task latency (seconds) the VM should stay under.
+        :param max_error_rate: the fraction of failed tasks tolerated per window.
+        :param target_cpu: the CPU utilization (percent) the VM should stay under.
+        :param min_limit: the fewest tasks kept in flight.
+        :param max_limit: the most tasks kept in flight.
+        :param additive_increase: how many tasks are added after a healthy window.
+        :param multiplicative_decrease: the factor the limit is cut by after an unhealthy window.
+        """
+        self.target_latency = target_latency
+        self.max_error_rate = max_error_rate
+        self.target_cpu = target_cpu
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.additive_increase = additive_increase
+        self.multiplicative_decrease = multiplicative_decrease
+
+
+class VM_State:
+    def __init__(self, limit: float, window: int):
+        self.limit = limit
+        # (latency, success) of the most recent tasks.
+        self.results: deque[tuple[float, bool]] = deque(maxlen=window)
+        self.cpu: float | None = None
+
+
+class Concurrency_Controller:
+    def __init__(
+        self,
+        targets: dict[str, VM_Target] | None = None,
+        default_target: VM_Target | None = None,
+        window: int = 20,
+    ):
+        """
+        Sizes the number of in-flight tasks of each VM with AIMD control.
+        After every batch the limit grows additively while latency, error
+        rate and CPU stay within the VM's targets. It is cut multiplicatively
+        as soon as one of them is exceeded. Each VM then runs close to
+        saturation without tasks timing out.
+
+        :param targets: the tuning targets of each VM, keyed by VM label (e.g. AWS, Azure).
+        :param default_target: the targets of VMs without their own.
+        :param window: the number of recent tasks the latency and error rate are computed over.
+        """
+        self.targets = targets or {}
+        self.default_target = default_target or VM_Target()
+        self.window = window
+        self._states: dict[str, VM_State] = {}
+        self._lock = threading.Lock()
+
+    def get_target(self, vm: str) -> VM_Target:
+        return self.targets.get(vm, self.default_target)
+
+    def set_target(self, vm: str, target: VM_Target):
+        """
+        Replaces the tuning targets of a VM. The current limit is clamped to the new bounds.
+
+        :param vm: the VM label.
+        :param target: the new targets.
+        """
+        with self._lock:
+            self.targets[vm] = target
+            state = self._states.get(vm)
+            if state:
+                state.limit = min(max(state.limit, target.min_limit), target.max_limit)
+
+    def get_limit(self, vm: str) -> int:
+        """
+        Gets the number of tasks to keep in flight on the VM.
+
+        :param vm: the VM label.
+        """
+        with self._lock:
+            return int(self._get_state(vm).limit)
+
+    def get_limits(self) -> dict[str, int]:
+        with self._lock:
+            return {vm: int(state.limit) for vm, state in self._states.items()}
+
+    def record(self, vm: str, latency: float, success: bool):
+        """
+        Records the outcome of one task.
+
+        :param vm: the VM label.
+        :param latency: how long the task took in seconds.
+        :param success: whether the task succeeded.
+        """
+        with self._lock:
+            self._get_state(vm).results.append((latency, success))
+
+    def record_cpu(self, vm: str, cpu: float | None):
+        """
+        Records the latest CPU utilization of the VM, e.g. from Metrics_Store.
+
+        :param vm: the VM label.
+        :param cpu: the CPU utilization in percent.
+        """
+        with self._lock:
+            self._get_state(vm).cpu = cpu
+
+    def update(self, vm: str) -> int:
+        """
+        Applies one AIMD step to the VM's limit, typically after each batch.
+
+        :param vm: the VM label.
+        :returns: the new limit.
+        """
+        with self._lock:
+            target = self.get_target(vm)
+            state = self._get_state(vm)
+            if not state.results:
+                return int(state.limit)
+
+            latencies = sorted(latency for latency, success in state.results if success)
+            error_rate = sum(1 for _, success in state.results if not success) / len(
+                state.results
+            )
+            # the 90th percentile, so a few slow tasks already signal saturation.
+            latency = latencies[int(0.9 * (len(latencies) - 1))] if latencies else 0.0
+
+            overloaded = (
+                error_rate > target.max_error_rate
+                or latency > target.target_latency
+                or (state.cpu is not None and state.cpu > target.target_cpu)
+            )
+            if overloaded:
+                state.limit = max(
+                    target.min_limit, state.limit * target.multiplicative_decrease
+                )
+                # start the next window fresh so one bad window is not counted twice.
+                state.results.clear()
+            else:
+                state.limit = min(
+                    target.max_limit, state.limit + target.additive_increase
+                )
+            return int(state.limit)
+
+    def _get_state(self, vm: str) -> VM_State:
+        state = self._states.get(vm)
+        if state is None:
+            state = VM_State(limit=self.get_target(vm).min_limit, window=self.window)
+            self._states[vm] = state
+        return state
@@ -0,0 +1,220 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from shared.config import get_config
+from AWS.cost_explorer_wrapper import Cost_Explorer_Wrapper
+from Azure.cost_management_wrapper import Cost_Management_Wrapper
+from shared.cost_store import Cost_Store
+
+# Cost Explorer only keeps hourly granularity for the last 14 days.
+AWS_HOURLY_RETENTION = timedelta(days=14)
+# how far back the first Azure sync of a resource group goes.
+AZURE_INITIAL_LOOKBACK = timedelta(days=30)
+# Azure cost queries are split into windows of this size to stay within one
+# page of results.
+AZURE_QUERY_WINDOW = timedelta(days=1)
+# estimated hours older than this are not re-fetched anymore, Cost Explorer
+# keeps them flagged as estimated until the month's bill is finalized.
+DEFAULT_SETTLE_AFTER = timedelta(days=3)
+
+
+class Cost_Ingestor:
+    def __init__(
+        self,
+        store: Cost_Store,
+        cost_explorer: Cost_Explorer_Wrapper | None = None,
+        cost_management: Cost_Management_Wrapper | None = None,
+        settle_after: timedelta = DEFAULT_SETTLE_AFTER,
+    ):
+        """
+        Pulls billed costs into the local cost store. Each run only requests
+        the hours that are new or still estimated, so reconciliation reports
+        can run repeatedly without re-pulling billing history (Cost Explorer
+        charges per request).
+
+        :param store: the local store the costs are written to.
+        :param cost_explorer: the Cost Explorer wrapper for EC2 instances.
+        :param cost_management: the Cost Management wrapper for Azure resources.
+        :param settle_after: how long after which estimated hours are treated as final.
+        """
+        self.store = store
+        self.cost_explorer = cost_explorer
+        self.cost_management = cost_management
+        self.settle_after = settle_after
+
+    def ingest_aws(
+        self,
+        instance_name: str,
+        end_time: datetime | None = None,
+    ) -> int:
+        """
+        Ingests the hourly cost of an EC2 instance up to end_time.
+
+        :param instance_name: the NAME tag of the EC2 instance.
+        :param end_time: the end of the ingestion window. Defaults to the current hour.
+        :returns: the number of cost records written.
+        """
+        if not self.cost_explorer:
+            return 0
+
+        end_time = (end_time or datetime.now(timezone.utc)).replace(
+            minute=0, second=0, microsecond=0
+        )
+        start_time = self._get_start_time(
+            "AWS", instance_name, end_time, retention=AWS_HOURLY_RETENTION
+        )
+        if start_time >= end_time:
+            return 0
+
+        cost_records = self.cost_explorer.get_hourly_costs(
+            instance_name=instance_name, start_time=start_time, end_time=end_time
+        )
+        return self.store.replace_range(
+            "AWS", instance_name, start_time, end_time, cost_records
+        )
+
+    def ingest_azure(
+        self,
+        resource_groups: list[str] | None = None,
+        end_time: datetime | None = None,
+        max_workers: int = 4,
+    ) -> int:
+        """
+        Ingests the cost of every resource in the resource groups up to
+        end_time, with the resource groups synced in parallel. Costs are
+        stored per resource id, so each VM's actual cost can be read back
+        without querying history again.
+
+        :param resource_groups: the resource groups to sync. Defaults to every
+            resource group of the subscription.
+        :param end_time: the end of the ingestion window. Defaults to the current hour.
+        :param max_workers: the number of resource groups synced concurrently.
+        :returns: the number of cost records written.
+        """
+        if not self.cost_management:
+            return 0
+
+        end_time = (end_time or datetime.now(timezone.utc)).replace(
+            minute=0, second=0, microsecond=0
+        )
+        resource_groups = resource_groups or self.cost_management.list_resource_groups()
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return sum(
+                executor.map(
+                    lambda resource_group: self._ingest_resource_group(
+                        resource_group, end_time
+                    ),
+                    resource_groups,
+                )
+            )
+
+    def _ingest_resource_group(self, resource_group: str, end_time: datetime) -> int:
+        """
+        Syncs one resource group, one query window at a time, committing each
+        window so an interrupted sync resumes where it stopped.
+
+        :param resource_group: the resource group name.
+        :param end_time: the end of the ingestion window.
+        """
+        if not self.cost_management:
+            return 0
+
+        # cost rows are keyed by lowercase resource ids under the resource group.
+        prefix = "/subscriptions/{}/resourcegroups/{}/".format(
+            self.cost_management.subscription_id, resource_group
+        ).lower()
+        start_time = self._get_start_time(
+            "Azure",
+            prefix,
+            end_time,
+            retention=AZURE_INITIAL_LOOKBACK,
+            match_prefix=True,
+        )
+
+        num_records = 0
+        while start_time < end_time:
+            daily = self.cost_management.is_daily(resource_group)
+            if daily:
+                # daily rows are stamped at midnight and cover the whole day,
+                # so windows are whole days or a day would be split across two.
+                start_time = _floor_to_day(start_time)
+                window_end = start_time + timedelta(days=1)
+            else:
+                window_end = min(start_time + AZURE_QUERY_WINDOW, end_time)
+            cost_records = self.cost_management.get_resource_costs(
+                start_time=start_time,
+                end_time=min(window_end, end_time),
+                resource_group_name=resource_group,
+            )
+            if not daily and self.cost_management.is_daily(resource_group):
+                # the scope fell back to daily, the window is queried again as whole days.
+                continue
+            num_records += self.store.replace_range(
+                "Azure",
+                prefix,
+                start_time,
+                window_end,
+                [
+                    record
+                    for record in cost_records
+                    if start_time <= record.hour < window_end
+                ],
+                match_prefix=True,
+            )
+            start_time = window_end
+        return num_records
+
+    def _get_start_time(
+        self,
+        provider: str,
+        resource: str,
+        end_time: datetime,
+        retention: timedelta,
+        match_prefix: bool = False,
+    ) -> datetime:
+        """
+        Resumes at the earliest unsettled or latest stored hour, never earlier
+        than the provider keeps data for.
+
+        :param provider: AWS or Azure.
+        :param resource: the resource the costs are billed to.
+        :param end_time: the end of the ingestion window.
+        :param retention: how far back the provider keeps data at this granularity.
+        :param match_prefix: treat resource as a prefix, e.g. a resource group's id.
+        """
+        earliest_time = end_time - retention + timedelta(hours=1)
+        resume_time = self.store.get_resume_time(
+            provider,
+            resource,
+            settled_before=end_time - self.settle_after,
+            match_prefix=match_prefix,
+        )
+        if resume_time is None:
+            return earliest_time
+        return max(resume_time, earliest_time)
+
+
+def _floor_to_day(time: datetime) -> datetime:
+    return time.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+if __name__ == "__main__":
+    config = get_config()
+    instance_name = config.aws_instance_name
+    subscription_id = config.azure_subscription_id
+    resource_group_name = config.azure_resource_group_name
+    cost_management = (
+        Cost_Management_Wrapper(
+            subscription_id=subscription_id, resource_group_name=resource_group_name
+        )
+        if subscription_id and resource_group_name
+        else None
+    )
+    ingestor = Cost_Ingestor(
+        store=Cost_Store(),
+        cost_explorer=Cost_Explorer_Wrapper(),
+        cost_management=cost_management,
+    )
+    print(ingestor.ingest_aws(instance_name=instance_name))
+    print(ingestor.ingest_azure())
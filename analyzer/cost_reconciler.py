@@ -0,0 +1,371 @@
+import os
+import numpy as np
+from datetime import datetime, timedelta, timezone
+
+from shared.config import get_config
+from AWS.dynamo_db_wrapper import DynamoDB_Wrapper
+from shared.cost_store import Cost_Store
+from shared.log import Log
+from shared.log_store import Log_Store
+from shared.output_writer import Columns, Output_Writer
+
+RECONCILIATION_FIELDS = [
+    "virtual_machine",
+    "period_start",
+    "estimated_cost",
+    "billed_cost",
+    "billed_estimated",
+    "difference",
+    "drift",
+    "status",
+    "corrected_cost",
+]
+TOTAL_FIELDS = ["virtual_machine", "estimated_cost", "billed_cost", "corrected_cost"]
+
+# statuses of a reconciled period.
+MATCHED = "matched"
+DRIFT = "drift"
+# estimated by log_data but not (yet) in the bill.
+UNBILLED = "unbilled"
+# billed while log_data did not log the VM, e.g. boot time before the first window.
+UNLOGGED = "unlogged"
+
+DEFAULT_DRIFT_THRESHOLD = 0.1
+DEFAULT_MIN_DIFFERENCE = 0.01
+
+
+class Cost_Reconciler:
+    def __init__(
+        self,
+        cost_store: Cost_Store,
+        log_store: Log_Store,
+        resources: dict[str, tuple[str, str]],
+        log_db: DynamoDB_Wrapper | None = None,
+        drift_threshold: float = DEFAULT_DRIFT_THRESHOLD,
+        min_difference: float = DEFAULT_MIN_DIFFERENCE,
+    ):
+        """
+        Reconciles the costs Analyzer.log_data estimated in log_table against
+        the billed costs in the cost store. Both sides are read from local
+        stores and aligned per VM and period with array operations, so months
+        of 5-minute windows reconcile without any per-record API calls.
+
+        :param cost_store: the billed costs, filled by Cost_Ingestor.
+        :param log_store: the local copy of log_table.
+        :param resources: the (provider, resource) billed for each log VM label,
+            e.g. {"AWS": ("AWS", instance name), "Azure": ("Azure", vm resource id)}.
+        :param log_db: log_table, synced into the log store before reconciling.
+        :param drift_threshold: the relative difference above which a period is flagged.
+        :param min_difference: differences below this amount are never flagged.
+        """
+        self.cost_store = cost_store
+        self.log_store = log_store
+        self.resources = resources
+        self.log_db = log_db
+        self.drift_threshold = drift_threshold
+        self.min_difference = min_difference
+
+    def sync_logs(self) -> int:
+        """
+        Copies the logs written since the last sync from log_table.
+
+        :returns: the number of logs copied.
+        """
+        if not self.log_db:
+            return 0
+        stored_id = self.log_store.get_latest_id()
+        latest_id = self.log_db.get_latest_id()
+        if latest_id <= stored_id:
+            return 0
+
+        items = self.log_db.get_items(
+            [str(id) for id in range(stored_id + 1, latest_id + 1)]
+        )
+        return self.log_store.add(
+            [
+                Log(
+                    id=int(item["id"]),
+                    start_time=item["start_time"],
+                    end_time=item["end_time"],
+                    virtual_machine=item["virtual_machine"],
+                    num_uploads=int(item["num_uploads"]),
+                    total_uploads=int(item["total_uploads"]),
+                    cost=item["cost"],
+                    total_cost=item["total_cost"],
+                )
+                for item in items
+            ]
+        )
+
+    def reconcile(
+        self,
+        start_time: datetime,
+        end_time: datetime,
+        period: timedelta = timedelta(hours=1),
+    ) -> Columns:
+        """
+        Aligns the estimated and billed cost of every VM per period.
+
+        A log's cost is the VM's hourly spot price, so its estimate is the
+        price times the length of its window, split across the periods the
+        window overlaps. The corrected cost is the billed cost where the bill
+        has it and the estimate otherwise.
+
+        :param start_time: the start of the reconciled range, inclusive.
+        :param end_time: the end of the reconciled range, exclusive.
+        :param period: the alignment granularity, one day for Azure scopes billed daily.
+        :returns: the columns of RECONCILIATION_FIELDS, one row per VM and period.
+        """
+        vm_labels = sorted(self.resources)
+        period_seconds = int(period.total_seconds())
+        start_seconds = int(_to_utc(start_time).timestamp())
+        end_seconds = int(_to_utc(end_time).timestamp())
+
+        # widen by one period so windows straddling start_time are included.
+        logs = self.log_store.query(
+            start_time=start_time - period, end_time=end_time
+        )
+        logs = [log for log in logs if log.virtual_machine in self.resources]
+        estimated_keys, estimated_costs = _allocate_windows(
+            vm_index=np.array(
+                [vm_labels.index(log.virtual_machine) for log in logs], dtype=np.int64
+            ),
+            window_starts=_parse_timestamps([log.start_time for log in logs]),
+            window_ends=_parse_timestamps([log.end_time for log in logs]),
+            hourly_prices=np.array([float(log.cost) for log in logs], dtype=np.float64),
+            period_seconds=period_seconds,
+        )
+
+        billed_vm_index: list[int] = []
+        billed_times: list[int] = []
+        billed_amounts: list[float] = []
+        billed_flags: list[bool] = []
+        for vm_index, vm_label in enumerate(vm_labels):
+            provider, resource = self.resources[vm_label]
+            for record in self.cost_store.query(
+                provider=provider, resource=resource, start_time=start_time, end_time=end_time
+            ):
+                billed_vm_index.append(vm_index)
+                billed_times.append(int(record.hour.timestamp()))
+                billed_amounts.append(record.amount)
+                billed_flags.append(record.estimated)
+        billed_keys = _to_keys(
+            np.array(billed_vm_index, dtype=np.int64),
+            np.array(billed_times, dtype=np.int64) // period_seconds,
+        )
+
+        # the full outer join: every (vm, period) present on either side.
+        estimated_keys, estimated_costs = _clip(
+            estimated_keys, estimated_costs, start_seconds, end_seconds, period_seconds
+        )
+        keys, inverse = np.unique(
+            np.concatenate([estimated_keys, billed_keys]), return_inverse=True
+        )
+        estimated_inverse = inverse[: len(estimated_keys)]
+        billed_inverse = inverse[len(estimated_keys) :]
+
+        # bincount returns integers for empty input, so cast back to float.
+        estimated = np.bincount(
+            estimated_inverse, weights=estimated_costs, minlength=len(keys)
+        ).astype(np.float64)
+        billed = np.bincount(
+            billed_inverse,
+            weights=np.array(billed_amounts, dtype=np.float64),
+            minlength=len(keys),
+        ).astype(np.float64)
+        has_estimate = np.bincount(estimated_inverse, minlength=len(keys)) > 0
+        has_bill = np.bincount(billed_inverse, minlength=len(keys)) > 0
+        billed_estimated = (
+            np.bincount(
+                billed_inverse,
+                weights=np.array(billed_flags, dtype=np.float64),
+                minlength=len(keys),
+            )
+            > 0
+        )
+
+        difference = billed - estimated
+        scale = np.maximum(np.abs(billed), np.abs(estimated))
+        drift = np.divide(
+            difference, scale, out=np.zeros_like(difference), where=scale > 0
+        )
+        drifted = (np.abs(drift) > self.drift_threshold) & (
+            np.abs(difference) >= self.min_difference
+        )
+        status = np.where(
+            ~has_bill,
+            UNBILLED,
+            np.where(~has_estimate, UNLOGGED, np.where(drifted, DRIFT, MATCHED)),
+        )
+
+        vm_index, period_index = _from_keys(keys)
+        return {
+            "virtual_machine": [vm_labels[i] for i in vm_index],
+            "period_start": [
+                datetime.fromtimestamp(int(i) * period_seconds, timezone.utc)
+                for i in period_index
+            ],
+            "estimated_cost": estimated.tolist(),
+            "billed_cost": billed.tolist(),
+            "billed_estimated": billed_estimated.tolist(),
+            "difference": difference.tolist(),
+            "drift": drift.tolist(),
+            "status": status.tolist(),
+            "corrected_cost": np.where(has_bill, billed, estimated).tolist(),
+        }
+
+    def get_totals(self, reconciliation: Columns) -> Columns:
+        """
+        Sums the estimated, billed and corrected cost of every VM.
+
+        :param reconciliation: the output of reconcile.
+        :returns: the columns of TOTAL_FIELDS, one row per VM.
+        """
+        vm_labels, vm_index = np.unique(
+            np.array(reconciliation["virtual_machine"], dtype=str), return_inverse=True
+        )
+        totals: dict[str, list] = {"virtual_machine": vm_labels.tolist()}
+        for field in TOTAL_FIELDS[1:]:
+            totals[field] = np.bincount(
+                vm_index,
+                weights=np.array(reconciliation[field], dtype=np.float64),
+                minlength=len(vm_labels),
+            ).astype(np.float64).tolist()
+        return totals
+
+    def write_report(
+        self,
+        filename: str,
+        start_time: datetime,
+        end_time: datetime,
+        period: timedelta = timedelta(hours=1),
+        format: str = "csv",
+    ) -> Columns:
+        """
+        Syncs log_table, reconciles the range and writes every period to the
+        file, with the per-VM totals next to it (suffixed _totals).
+
+        :param filename: the path of the report.
+        :param start_time: the start of the reconciled range, inclusive.
+        :param end_time: the end of the reconciled range, exclusive.
+        :param period: the alignment granularity.
+        :param format: one of csv, parquet or arrow.
+        :returns: the per-VM totals.
+        """
+        self.sync_logs()
+        reconciliation = self.reconcile(start_time, end_time, period=period)
+        totals = self.get_totals(reconciliation)
+
+        Output_Writer(fieldnames=RECONCILIATION_FIELDS).write(
+            filename, reconciliation, format=format
+        )
+        root, extension = os.path.splitext(filename)
+        Output_Writer(fieldnames=TOTAL_FIELDS).write(
+            f"{root}_totals{extension}", totals, format=format
+        )
+        return totals
+
+
+def _allocate_windows(
+    vm_index: np.ndarray,
+    window_starts: np.ndarray,
+    window_ends: np.ndarray,
+    hourly_prices: np.ndarray,
+    period_seconds: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Splits every log window across the periods it overlaps, costing each
+    piece at the window's hourly price.
+
+    :returns: the (vm, period) key and the estimated cost of every piece.
+    """
+    window_ends = np.maximum(window_ends, window_starts)
+    first_period = window_starts // period_seconds
+    last_period = np.maximum((window_ends - 1) // period_seconds, first_period)
+    num_pieces = last_period - first_period + 1
+
+    # one entry per (window, overlapped period).
+    window = np.repeat(np.arange(len(window_starts)), num_pieces)
+    offsets = np.arange(len(window)) - np.repeat(np.cumsum(num_pieces) - num_pieces, num_pieces)
+    period_index = first_period[window] + offsets
+
+    overlap = np.minimum(window_ends[window], (period_index + 1) * period_seconds) - np.maximum(
+        window_starts[window], period_index * period_seconds
+    )
+    costs = hourly_prices[window] * np.maximum(overlap, 0) / 3600
+    return _to_keys(vm_index[window], period_index), costs
+
+
+def _clip(
+    keys: np.ndarray,
+    costs: np.ndarray,
+    start_seconds: int,
+    end_seconds: int,
+    period_seconds: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    _, period_index = _from_keys(keys)
+    in_range = (period_index >= start_seconds // period_seconds) & (
+        period_index * period_seconds < end_seconds
+    )
+    return keys[in_range], costs[in_range]
+
+
+# periods since the epoch fit well within the low 40 bits of a key.
+_PERIOD_BITS = 40
+
+
+def _to_keys(vm_index: np.ndarray, period_index: np.ndarray) -> np.ndarray:
+    return (vm_index.astype(np.int64) << _PERIOD_BITS) | period_index.astype(np.int64)
+
+
+def _from_keys(keys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    return keys >> _PERIOD_BITS, keys & ((1 << _PERIOD_BITS) - 1)
+
+
+def _parse_timestamps(timestamps: list[str]) -> np.ndarray:
+    """
+    Parses log timestamps (e.g. 2025-04-01T12:00:00Z) to epoch seconds in one pass.
+    """
+    return np.array(
+        [timestamp.rstrip("Z") for timestamp in timestamps], dtype="datetime64[s]"
+    ).astype(np.int64)
+
+
+def _to_utc(timestamp: datetime) -> datetime:
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp
+
+
+if __name__ == "__main__":
+    config = get_config()
+    instance_name = config.aws_instance_name
+    subscription_id = config.azure_subscription_id
+    resource_group_name = config.azure_resource_group_name
+    vm_name = config.azure_vm_name
+    resources = {"AWS": ("AWS", instance_name)}
+    if subscription_id and resource_group_name and vm_name:
+        resources["Azure"] = (
+            "Azure",
+            (
+                "/subscriptions/{}/resourcegroups/{}/"
+                "providers/microsoft.compute/virtualmachines/{}"
+            )
+            .format(subscription_id, resource_group_name, vm_name)
+            .lower(),
+        )
+
+    reconciler = Cost_Reconciler(
+        cost_store=Cost_Store(),
+        log_store=Log_Store(),
+        resources=resources,
+        log_db=DynamoDB_Wrapper(table_name="log_table", partition_key="id"),
+    )
+    end_time = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    print(
+        reconciler.write_report(
+            "cost_reconciliation.csv",
+            start_time=end_time - timedelta(days=14),
+            end_time=end_time,
+        )
+    )
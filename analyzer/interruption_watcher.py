@@ -0,0 +1,164 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+from shared.config import get_config
+from shared.types.interruption_notice import Interruption_Notice
+
+DEFAULT_POLL_INTERVAL = timedelta(seconds=5)
+# a notice is dropped after this many failed polls in a row, e.g. its VM was stopped.
+DEFAULT_MAX_FAILED_POLLS = 12
+
+
+class Interruption_Watcher:
+    def __init__(
+        self,
+        pollers: dict[str, Callable[[], Interruption_Notice | None]],
+        interval: timedelta = DEFAULT_POLL_INTERVAL,
+        max_failed_polls: int = DEFAULT_MAX_FAILED_POLLS,
+    ):
+        """
+        Watches the VMs for spot interruption notices in a background thread.
+        Each VM has an event that is set while it has a notice, so commands
+        waiting on that VM can be abandoned within a poll interval instead of
+        running into their timeout.
+
+        A failed poll keeps the previous state, e.g. the metadata endpoint is
+        briefly unreachable. A notice is cleared by a poll that finds none, by
+        clear once the VM is started again, or by a failed poll once the
+        notice's time has passed or max_failed_polls polls failed in a row,
+        since the metadata endpoint of a reclaimed VM stays unreachable.
+
+        :param pollers: the poll function of each VM, keyed by VM label (e.g. AWS,
+            Azure), returning its notice or None.
+        :param interval: how often every VM is polled.
+        :param max_failed_polls: the failed polls in a row after which a notice is dropped.
+        """
+        self.pollers = pollers
+        self.interval = interval
+        self.max_failed_polls = max_failed_polls
+        self._notices: dict[str, Interruption_Notice] = {}
+        self._events = {vm: threading.Event() for vm in pollers}
+        self._failures = {vm: 0 for vm in pollers}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @classmethod
+    def from_config(
+        cls, azure_vm: str | None = None, interval: timedelta = DEFAULT_POLL_INTERVAL
+    ) -> "Interruption_Watcher":
+        """
+        Watches the EC2 instance and Azure VM at the metadata endpoints of the
+        config. A VM whose endpoint is not configured is not watched.
+
+        :param azure_vm: the name of the Azure VM, the configured one by default.
+        :param interval: how often every VM is polled.
+        """
+        from AWS.spot_interruption_poller import Spot_Interruption_Poller
+        from Azure.scheduled_events_poller import Scheduled_Events_Poller
+
+        config = get_config()
+        pollers: dict[str, Callable[[], Interruption_Notice | None]] = {}
+        if config.aws_metadata_url:
+            pollers["AWS"] = Spot_Interruption_Poller(
+                base_url=config.aws_metadata_url
+            ).poll
+        if config.azure_metadata_url:
+            pollers["Azure"] = Scheduled_Events_Poller(
+                vm_name=azure_vm or config.azure_vm_name,
+                base_url=config.azure_metadata_url,
+            ).poll
+        return cls(pollers=pollers, interval=interval)
+
+    def poll(self) -> list[Interruption_Notice]:
+        """
+        Polls every VM once.
+
+        :returns: the notices that were not known before.
+        """
+        new_notices = []
+        for vm, poll in self.pollers.items():
+            try:
+                notice = poll()
+            except Exception as ex:
+                self._failures[vm] += 1
+                if self._failures[vm] == 1:
+                    print(f"Failed to poll {vm} for interruption notices", ex)
+                self._expire(vm)
+                continue
+            self._failures[vm] = 0
+
+            with self._lock:
+                if notice is None:
+                    self._notices.pop(vm, None)
+                    self._events[vm].clear()
+                    continue
+                if vm not in self._notices:
+                    new_notices.append(notice)
+                    print(f"Interruption notice for {vm}: {notice}")
+                self._notices[vm] = notice
+                self._events[vm].set()
+        return new_notices
+
+    def _expire(self, vm: str):
+        """
+        Drops the notice of a VM that can no longer be polled once it is over.
+        """
+        with self._lock:
+            notice = self._notices.get(vm)
+            if notice is None:
+                return
+            passed = notice.time is not None and notice.time <= datetime.now(timezone.utc)
+            if passed or self._failures[vm] >= self.max_failed_polls:
+                print(f"Interruption notice for {vm} expired: {notice}")
+                self._notices.pop(vm)
+                self._events[vm].clear()
+
+    def get_notice(self, vm: str) -> Interruption_Notice | None:
+        with self._lock:
+            return self._notices.get(vm)
+
+    def get_event(self, vm: str) -> threading.Event | None:
+        """
+        Gets the event set while the VM has a notice, None for unwatched VMs.
+        """
+        return self._events.get(vm)
+
+    def is_interrupted(self, vm: str) -> bool:
+        event = self._events.get(vm)
+        return event is not None and event.is_set()
+
+    def clear(self, vm: str):
+        """
+        Forgets the notice of a VM, e.g. once it was started again after
+        being reclaimed. A notice that is still posted is found again by the
+        next poll.
+        """
+        with self._lock:
+            self._notices.pop(vm, None)
+            if vm in self._events:
+                self._events[vm].clear()
+
+    def start(self):
+        """
+        Starts a daemon thread that polls every VM each interval.
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._poll_loop, name="interruption-watcher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _poll_loop(self):
+        while not self._stop_event.is_set():
+            self.poll()
+            self._stop_event.wait(self.interval.total_seconds())
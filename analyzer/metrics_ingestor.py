@@ -0,0 +1,137 @@
+import boto3
+from datetime import datetime, timedelta, timezone
+
+from shared.config import get_config
+from AWS.cloudwatch_wrapper import Cloudwatch_Wrapper
+from Azure.monitor_wrapper import Monitor_Wrapper
+from shared.metrics_store import Metrics_Store
+from shared.types.metric_point import METRICS
+
+DEFAULT_LOOKBACK = timedelta(days=1)
+DEFAULT_PERIOD = timedelta(minutes=5)
+
+
+class Metrics_Ingestor:
+    def __init__(
+        self,
+        store: Metrics_Store,
+        cloudwatch: Cloudwatch_Wrapper | None = None,
+        monitor: Monitor_Wrapper | None = None,
+        period: timedelta = DEFAULT_PERIOD,
+        lookback: timedelta = DEFAULT_LOOKBACK,
+    ):
+        """
+        Pulls the utilization metrics of the whole fleet into the local metrics
+        store. Each run costs one batched request per provider (per 500 CloudWatch
+        queries or 50 Azure VMs) and only asks for datapoints newer than the
+        ones already stored.
+
+        :param store: the local store the datapoints are written to.
+        :param cloudwatch: the CloudWatch wrapper for EC2 instances.
+        :param monitor: the Azure Monitor wrapper for virtual machines.
+        :param period: the granularity of the datapoints.
+        :param lookback: how far back to start for resources with no stored datapoints.
+        """
+        self.store = store
+        self.cloudwatch = cloudwatch
+        self.monitor = monitor
+        self.period = period
+        self.lookback = lookback
+
+    def ingest(
+        self,
+        instance_ids: list[str] | None = None,
+        vm_names: list[str] | None = None,
+        azure_region: str = "eastus",
+        metrics: list[str] = METRICS,
+        end_time: datetime | None = None,
+    ) -> int:
+        """
+        Ingests the metrics of the EC2 instances and Azure VMs up to end_time.
+
+        :param instance_ids: the EC2 instance ids.
+        :param vm_names: the Azure VM names.
+        :param azure_region: the region of the Azure VMs.
+        :param metrics: the shared metric names to ingest.
+        :param end_time: the end of the ingestion window. Defaults to now.
+        :returns: the number of datapoints written.
+        """
+        end_time = end_time or datetime.now(timezone.utc)
+        num_points = 0
+
+        if instance_ids and self.cloudwatch:
+            start_time = self._get_start_time("AWS", instance_ids, metrics, end_time)
+            num_points += self.store.add(
+                self.cloudwatch.get_metric_data(
+                    instance_ids=instance_ids,
+                    start_time=start_time,
+                    end_time=end_time,
+                    metrics=metrics,
+                    period=int(self.period.total_seconds()),
+                )
+            )
+
+        if vm_names and self.monitor:
+            start_time = self._get_start_time("Azure", vm_names, metrics, end_time)
+            num_points += self.store.add(
+                self.monitor.get_metrics_batch(
+                    vm_names=vm_names,
+                    start_time=start_time,
+                    end_time=end_time,
+                    region=azure_region,
+                    metrics=metrics,
+                    interval=self.period,
+                )
+            )
+
+        return num_points
+
+    def _get_start_time(
+        self,
+        provider: str,
+        resources: list[str],
+        metrics: list[str],
+        end_time: datetime,
+    ) -> datetime:
+        """
+        Starts at the oldest of the resources' watermarks, so one request
+        covers every resource, but never further back than the lookback. A
+        resource's watermark is its latest stored datapoint of any metric,
+        since some metrics are never reported for it (e.g. cpu_credit_balance
+        of non-burstable instances). The latest stored period is fetched
+        again since it may have been partial.
+
+        :param provider: AWS or Azure.
+        :param resources: the instance ids or VM names.
+        :param metrics: the shared metric names.
+        :param end_time: the end of the ingestion window.
+        """
+        watermarks: dict[str, datetime] = {}
+        for (resource, metric), timestamp in self.store.get_latest_timestamps(
+            provider
+        ).items():
+            if metric in metrics and (
+                resource not in watermarks or timestamp > watermarks[resource]
+            ):
+                watermarks[resource] = timestamp
+
+        default_start = end_time - self.lookback
+        start_time = min(
+            (watermarks.get(resource, default_start) for resource in resources),
+            default=default_start,
+        )
+        return max(start_time, default_start)
+
+if __name__ == "__main__":
+    config = get_config()
+    instance_id = config.aws_instance_id
+    subscription_id = config.azure_subscription_id
+    resource_group_name = config.azure_resource_group_name
+    vm_name = config.azure_vm_name
+    if instance_id and subscription_id and resource_group_name and vm_name:
+        ingestor = Metrics_Ingestor(
+            store=Metrics_Store(),
+            cloudwatch=Cloudwatch_Wrapper(boto3.client("cloudwatch")),
+            monitor=Monitor_Wrapper(subscription_id, resource_group_name),
+        )
+        print(ingestor.ingest(instance_ids=[instance_id], vm_names=[vm_name]))
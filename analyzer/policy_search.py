@@ -0,0 +1,417 @@
+import random
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Sequence
+
+from shared.output_writer import Output_Writer
+from shared.timestamps import to_naive_utc
+from shared.types.spot_price import Spot_Price
+
+POLICY_FIELDS = [
+    "rank",
+    "window",
+    "hysteresis",
+    "dwell",
+    "switch_penalty",
+    "cost",
+    "compute_cost",
+    "switches",
+    "pairs_evaluated",
+    "stopped_early",
+]
+# the integer columns, undeclared ones are written as float64.
+POLICY_TYPES = {
+    "rank": "int64",
+    "window": "int64",
+    "dwell": "int64",
+    "pairs_evaluated": "int64",
+}
+DEFAULT_STEP = timedelta(minutes=5)
+AWS = 0
+AZURE = 1
+
+# set in every worker process by _attach_prices.
+_prices: np.ndarray | None = None
+_shared_memory: SharedMemory | None = None
+_step_hours = 0.0
+
+
+class Switching_Policy:
+    def __init__(
+        self,
+        window: int = 1,
+        hysteresis: float = 0.0,
+        dwell: int = 0,
+        switch_penalty: float = 0.0,
+    ):
+        """
+        A price-driven switching policy: run on the cloud whose smoothed spot
+        price is lower, but only switch once the other cloud is cheaper by
+        more than the hysteresis, the current VM has run for the dwell time,
+        and the savings over the dwell time pay back the switch penalty.
+
+        :param window: the number of steps the prices are averaged over.
+        :param hysteresis: the relative price advantage needed to switch, e.g. 0.05.
+        :param dwell: the minimum number of steps between two switches.
+        :param switch_penalty: the cost charged per switch, e.g. the boot time's cost.
+        """
+        self.window = window
+        self.hysteresis = hysteresis
+        self.dwell = dwell
+        self.switch_penalty = switch_penalty
+
+    def to_dict(self) -> dict[str, int | float]:
+        return {
+            "window": self.window,
+            "hysteresis": self.hysteresis,
+            "dwell": self.dwell,
+            "switch_penalty": self.switch_penalty,
+        }
+
+    def __repr__(self):
+        return f"Switching_Policy({self.to_dict()})"
+
+
+def get_grid(
+    windows: Sequence[int],
+    hysteresis: Sequence[float],
+    dwells: Sequence[int],
+    switch_penalties: Sequence[float],
+) -> list[Switching_Policy]:
+    """
+    Gets every combination of the parameter values.
+    """
+    return [
+        Switching_Policy(*values)
+        for values in itertools.product(windows, hysteresis, dwells, switch_penalties)
+    ]
+
+
+def get_random_policies(
+    count: int,
+    windows: tuple[int, int],
+    hysteresis: tuple[float, float],
+    dwells: tuple[int, int],
+    switch_penalties: tuple[float, float],
+    seed: int = 0,
+) -> list[Switching_Policy]:
+    """
+    Samples policies uniformly from the (low, high) range of every parameter.
+    """
+    generator = random.Random(seed)
+    return [
+        Switching_Policy(
+            window=generator.randint(*windows),
+            hysteresis=generator.uniform(*hysteresis),
+            dwell=generator.randint(*dwells),
+            switch_penalty=generator.uniform(*switch_penalties),
+        )
+        for _ in range(count)
+    ]
+
+
+def resample(
+    spot_prices: list[Spot_Price], start_time: datetime, end_time: datetime, step: timedelta
+) -> np.ndarray:
+    """
+    Resamples a spot price series onto a regular grid. Each step holds the
+    latest price at or before it, and steps before the first price hold the
+    first price.
+
+    :returns: the price of every step from start_time up to end_time.
+    """
+    start_time = to_naive_utc(start_time)
+    spot_prices = sorted(spot_prices, key=lambda spot_price: to_naive_utc(spot_price.timestamp))
+    # seconds since start_time.
+    timestamps = np.array(
+        [
+            (to_naive_utc(spot_price.timestamp) - start_time).total_seconds()
+            for spot_price in spot_prices
+        ]
+    )
+    prices = np.array([spot_price.price for spot_price in spot_prices], dtype=np.float64)
+    grid = np.arange(
+        0.0, (to_naive_utc(end_time) - start_time).total_seconds(), step.total_seconds()
+    )
+    indices = np.searchsorted(timestamps, grid, side="right") - 1
+    return prices[np.clip(indices, 0, len(prices) - 1)]
+
+
+def simulate(
+    aws_prices: np.ndarray,
+    azure_prices: np.ndarray,
+    policy: Switching_Policy,
+    step_hours: float,
+) -> tuple[float, float, int]:
+    """
+    Runs the policy over the price series of one instance pair.
+
+    :param aws_prices: the hourly AWS price of every step.
+    :param azure_prices: the hourly Azure price of every step.
+    :param policy: the switching policy.
+    :param step_hours: the length of a step in hours.
+    :returns: the cost including switch penalties, the compute cost and the number of switches.
+    """
+    if len(aws_prices) == 0:
+        return 0.0, 0.0, 0
+    window = max(policy.window, 1)
+    prices = (aws_prices.tolist(), azure_prices.tolist())
+    smoothed = (
+        _rolling_mean(aws_prices, window).tolist(),
+        _rolling_mean(azure_prices, window).tolist(),
+    )
+    threshold = 1 - policy.hysteresis
+    # a switch must save at least the penalty over the next dwell period.
+    min_savings = policy.switch_penalty / (max(policy.dwell, 1) * step_hours)
+
+    current = AWS if smoothed[AWS][0] <= smoothed[AZURE][0] else AZURE
+    last_switch = -policy.dwell
+    switches = 0
+    compute_cost = 0.0
+    for step in range(len(prices[AWS])):
+        other = 1 - current
+        if (
+            step - last_switch >= policy.dwell
+            and smoothed[other][step] < smoothed[current][step] * threshold
+            and smoothed[current][step] - smoothed[other][step] >= min_savings
+        ):
+            current = other
+            last_switch = step
+            switches += 1
+        compute_cost += prices[current][step]
+    compute_cost *= step_hours
+    return compute_cost + switches * policy.switch_penalty, compute_cost, switches
+
+
+class Policy_Search:
+    def __init__(
+        self,
+        prices: np.ndarray,
+        pairs: list[tuple[str, str]],
+        step: timedelta = DEFAULT_STEP,
+        max_workers: int | None = None,
+        rounds: int = 4,
+        dominance_margin: float = 0.05,
+        min_survivors: int = 10,
+    ):
+        """
+        Evaluates switching policies over the price series of many instance
+        pairs on a process pool. The prices are copied once into shared
+        memory, so workers read them without pickling.
+
+        The pairs are evaluated in rounds. After each round, policies that
+        another policy beats by more than dominance_margin in cost with no
+        more switches are stopped, so clearly worse configurations do not
+        use up the remaining rounds.
+
+        :param prices: the resampled prices, shaped (pairs, 2, steps) with AWS first.
+        :param pairs: the (aws_instance, azure_vm) of every row of prices.
+        :param step: the length of a step.
+        :param max_workers: the number of worker processes.
+        :param rounds: the number of rounds the pairs are split into.
+        :param dominance_margin: how much cheaper a policy must be to stop another.
+        :param min_survivors: the cheapest policies that are never stopped.
+        """
+        if prices.ndim != 3 or prices.shape[1] != 2 or prices.shape[0] != len(pairs):
+            raise ValueError("prices must be shaped (pairs, 2, steps)")
+        self.prices = np.ascontiguousarray(prices, dtype=np.float64)
+        self.pairs = pairs
+        self.step = step
+        self.max_workers = max_workers
+        self.rounds = max(min(rounds, len(pairs)), 1)
+        self.dominance_margin = dominance_margin
+        self.min_survivors = min_survivors
+
+    @classmethod
+    def from_series(
+        cls,
+        series: dict[tuple[str, str], tuple[list[Spot_Price], list[Spot_Price]]],
+        start_time: datetime,
+        end_time: datetime,
+        step: timedelta = DEFAULT_STEP,
+        **kwargs: Any,
+    ) -> "Policy_Search":
+        """
+        Resamples the recorded prices of every pair onto one grid. Pairs
+        missing either series are skipped.
+
+        :param series: the (AWS, Azure) spot prices of every (aws_instance, azure_vm).
+        """
+        pairs = [pair for pair, (aws, azure) in series.items() if aws and azure]
+        prices = np.empty(
+            (len(pairs), 2, len(resample(series[pairs[0]][0], start_time, end_time, step)))
+            if pairs
+            else (0, 2, 0)
+        )
+        for row, pair in enumerate(pairs):
+            aws, azure = series[pair]
+            prices[row, AWS] = resample(aws, start_time, end_time, step)
+            prices[row, AZURE] = resample(azure, start_time, end_time, step)
+        return cls(prices, pairs, step=step, **kwargs)
+
+    def run(self, policies: list[Switching_Policy]) -> list[dict[str, Any]]:
+        """
+        Evaluates the policies over every pair.
+
+        :returns: one row per policy ranked by mean cost per pair, policies
+            that ran on every pair first.
+        """
+        num_policies = len(policies)
+        costs = np.zeros(num_policies)
+        compute_costs = np.zeros(num_policies)
+        switches = np.zeros(num_policies)
+        pairs_evaluated = np.zeros(num_policies, dtype=np.int64)
+        alive = np.ones(num_policies, dtype=bool)
+
+        shared_memory = SharedMemory(create=True, size=max(self.prices.nbytes, 1))
+        try:
+            np.ndarray(
+                self.prices.shape, dtype=np.float64, buffer=shared_memory.buf
+            )[:] = self.prices
+            with ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=_attach_prices,
+                initargs=(
+                    shared_memory.name,
+                    self.prices.shape,
+                    self.step.total_seconds() / 3600,
+                ),
+            ) as executor:
+                for round_index, pair_indices in enumerate(
+                    np.array_split(np.arange(len(self.pairs)), self.rounds)
+                ):
+                    indices = np.flatnonzero(alive)
+                    futures = [
+                        executor.submit(_evaluate, policies[index], pair_indices.tolist())
+                        for index in indices
+                    ]
+                    for index, future in zip(indices, futures):
+                        cost, compute_cost, num_switches = future.result()
+                        costs[index] += cost
+                        compute_costs[index] += compute_cost
+                        switches[index] += num_switches
+                        pairs_evaluated[index] += len(pair_indices)
+                    if round_index < self.rounds - 1:
+                        alive[self._get_dominated(indices, costs, switches)] = False
+        finally:
+            shared_memory.close()
+            shared_memory.unlink()
+
+        evaluated = np.maximum(pairs_evaluated, 1)
+        order = sorted(
+            range(num_policies),
+            key=lambda index: (not alive[index], costs[index] / evaluated[index]),
+        )
+        return [
+            {
+                "rank": rank + 1,
+                **policies[index].to_dict(),
+                "cost": float(costs[index] / evaluated[index]),
+                "compute_cost": float(compute_costs[index] / evaluated[index]),
+                "switches": float(switches[index] / evaluated[index]),
+                "pairs_evaluated": int(pairs_evaluated[index]),
+                "stopped_early": not alive[index],
+            }
+            for rank, index in enumerate(order)
+        ]
+
+    def write(self, filename: str, rows: list[dict[str, Any]], format: str = "csv") -> int:
+        """
+        Writes the ranked table.
+
+        :param format: one of csv, parquet or arrow.
+        """
+        return Output_Writer(fieldnames=POLICY_FIELDS, field_types=POLICY_TYPES).write(
+            filename, rows, format=format
+        )
+
+    def _get_dominated(
+        self, indices: np.ndarray, costs: np.ndarray, switches: np.ndarray
+    ) -> np.ndarray:
+        """
+        Finds the policies another one beats by the margin in cost with no
+        more switches. Every policy has run on the same pairs, so totals compare.
+        """
+        by_cost = indices[np.argsort(costs[indices], kind="stable")]
+        protected = set(by_cost[: self.min_survivors].tolist())
+        dominated: list[int] = []
+        # fewest switches among the policies cheap enough to dominate the current one.
+        fewest_switches = np.inf
+        pointer = 0
+        for index in by_cost:
+            while (
+                pointer < len(by_cost)
+                and costs[by_cost[pointer]] * (1 + self.dominance_margin) <= costs[index]
+            ):
+                fewest_switches = min(fewest_switches, switches[by_cost[pointer]])
+                pointer += 1
+            if index not in protected and fewest_switches <= switches[index]:
+                dominated.append(index)
+        return np.array(dominated, dtype=np.int64)
+
+
+def _attach_prices(name: str, shape: tuple[int, ...], step_hours: float):
+    global _prices, _shared_memory, _step_hours
+    # keeps a reference so the buffer outlives this function.
+    _shared_memory = SharedMemory(name=name)
+    _prices = np.ndarray(shape, dtype=np.float64, buffer=_shared_memory.buf)
+    _step_hours = step_hours
+
+
+def _evaluate(policy: Switching_Policy, pair_indices: list[int]) -> tuple[float, float, int]:
+    assert _prices is not None
+    cost = compute_cost = 0.0
+    switches = 0
+    for pair_index in pair_indices:
+        result = simulate(_prices[pair_index, AWS], _prices[pair_index, AZURE], policy, _step_hours)
+        cost += result[0]
+        compute_cost += result[1]
+        switches += result[2]
+    return cost, compute_cost, switches
+
+
+def _rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    # the first window - 1 steps average over the steps seen so far.
+    sums = np.cumsum(np.concatenate(([0.0], values)))
+    ends = np.arange(1, len(values) + 1)
+    starts = np.maximum(ends - window, 0)
+    return (sums[ends] - sums[starts]) / (ends - starts)
+
+
+if __name__ == "__main__":
+    from shared.config import get_config
+    from AWS.ec2_wrapper import EC2_Wrapper
+    from Azure.vm_wrapper import Azure_VM_Wrapper
+
+    config = get_config()
+    subscription_id = config.azure_subscription_id
+    resource_group_name = config.azure_resource_group_name
+    if subscription_id and resource_group_name:
+        ec2 = EC2_Wrapper()
+        azure = Azure_VM_Wrapper(subscription_id, resource_group_name)
+        end_time = datetime.now(timezone.utc)
+        start_time = end_time - timedelta(days=7)
+        series = {
+            (aws_instance, azure_vm): (
+                ec2.get_spot_price_history(aws_instance, start_time, end_time) or [],
+                azure.get_spot_price_history(azure_vm, start_time, end_time) or [],
+            )
+            for aws_instance, azure_vm in [
+                ("m4.large", "Standard_D2_v4"),
+                ("m5.large", "Standard_D2s_v5"),
+            ]
+        }
+        search = Policy_Search.from_series(series, start_time, end_time)
+        rows = search.run(
+            get_grid(
+                windows=[1, 3, 12],
+                hysteresis=[0.0, 0.02, 0.05, 0.1],
+                dwells=[0, 6, 12, 36],
+                switch_penalties=[0.0, 0.01],
+            )
+        )
+        search.write("policy_search.csv", rows)
+        print(rows[:5])
@@ -0,0 +1,208 @@
+import os
+import re
+import json
+import heapq
+import random
+import threading
+from datetime import datetime, timedelta
+from typing import Any
+from botocore.exceptions import ClientError
+
+from AWS.instrumentation import THROTTLE_ERROR_CODES
+from analyzer.web_scraper import WebsiteNotFoundException
+from shared.clock import Clock
+from shared.types.remote_command_exception import RemoteCommandException
+
+NOT_FOUND = "not_found"
+TRANSPORT = "transport"
+THROTTLED = "throttled"
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BASE_DELAY = timedelta(seconds=5)
+DEFAULT_MAX_DELAY = timedelta(minutes=5)
+DEFAULT_DEAD_LETTER_PATH = os.path.join(".cache", "dead_letters.jsonl")
+# e.g. requests' "HTTPError: 429 Client Error: Too Many Requests for url: ...",
+# not a bare 429 that may be part of a curid or line number.
+THROTTLED_PATTERN = re.compile(r"\b429 Client Error\b|\bToo Many Requests\b")
+
+
+def classify_error(error: Exception) -> str:
+    """
+    Classifies why a task failed.
+
+    :param error: the exception the task raised.
+    :returns: not_found if the article does not exist, throttled if a
+        provider rejected the request for its rate, otherwise transport.
+    """
+    if isinstance(error, WebsiteNotFoundException):
+        return NOT_FOUND
+    if isinstance(error, RemoteCommandException):
+        # the last line of a traceback is the exception the command failed with.
+        lines = error.stderr.strip().splitlines()
+        exception_line = lines[-1] if lines else ""
+        if WebsiteNotFoundException.__name__ in exception_line:
+            return NOT_FOUND
+        if THROTTLED_PATTERN.search(exception_line):
+            return THROTTLED
+        return TRANSPORT
+    if isinstance(error, ClientError):
+        if (
+            error.response.get("Error", {}).get("Code") in THROTTLE_ERROR_CODES
+            or error.response.get("ResponseMetadata", {}).get("HTTPStatusCode") == 429
+        ):
+            return THROTTLED
+        return TRANSPORT
+    # e.g. requests' HTTPError (response.status_code) or azure-core's HttpResponseError (status_code).
+    status_code = getattr(error, "status_code", None) or getattr(
+        getattr(error, "response", None), "status_code", None
+    )
+    return THROTTLED if status_code == 429 else TRANSPORT
+
+
+class Dead_Letter:
+    def __init__(self, id: int, reason: str, attempts: int, error: str, time: datetime):
+        self.id = id
+        # not_found, transport or throttled, see classify_error.
+        self.reason = reason
+        self.attempts = attempts
+        # the last error the task failed with.
+        self.error = error
+        self.time = time
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "id": self.id,
+            "reason": self.reason,
+            "attempts": self.attempts,
+            "error": self.error,
+            "time": self.time.isoformat(),
+        }
+
+    def __repr__(self):
+        return f"{self.id}: {self.reason} after {self.attempts} attempts ({self.error})"
+
+
+class Retry_Queue:
+    def __init__(
+        self,
+        clock: Clock | None = None,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        base_delay: timedelta = DEFAULT_BASE_DELAY,
+        max_delay: timedelta = DEFAULT_MAX_DELAY,
+        dead_letter_path: str | None = None,
+        seed: int | None = None,
+    ):
+        """
+        Holds the ids of failed tasks until they are due to be retried, in a
+        heap ordered by due time. The delay doubles with every attempt up to
+        max_delay, with full jitter so ids that failed together do not retry
+        together. The control loop keeps dispatching new ids while earlier
+        ones wait.
+
+        An id that fails max_attempts times is dead-lettered, as is a missing
+        article at once, since retrying it cannot succeed.
+
+        :param clock: the clock due times are read from.
+        :param max_attempts: the number of failed attempts before an id is dead-lettered.
+        :param base_delay: the delay before the first retry, before jitter.
+        :param max_delay: the longest delay, before jitter.
+        :param dead_letter_path: the JSON lines file dead letters are appended
+            to, or None to keep them in memory only.
+        :param seed: seeds the jitter.
+        """
+        self.clock = clock or Clock()
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.dead_letter_path = dead_letter_path
+        self.random = random.Random(seed)
+
+        # (due time on the monotonic clock, id)
+        self._heap: list[tuple[float, int]] = []
+        self.attempts: dict[int, int] = {}
+        self.dead_letters: list[Dead_Letter] = []
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def schedule(self, id: int, error: Exception) -> Dead_Letter | None:
+        """
+        Records a failed attempt and schedules the id for a retry, or dead-letters it.
+
+        :param id: the id of the failed task.
+        :param error: the exception the task raised.
+        :returns: the dead letter, or None if the id will be retried.
+        """
+        reason = classify_error(error)
+        with self._lock:
+            attempts = self.attempts.get(id, 0) + 1
+            if reason == NOT_FOUND or attempts >= self.max_attempts:
+                self.attempts.pop(id, None)
+                dead_letter = Dead_Letter(
+                    id=id,
+                    reason=reason,
+                    attempts=attempts,
+                    error=repr(error),
+                    time=self.clock.now(),
+                )
+                self.dead_letters.append(dead_letter)
+            else:
+                self.attempts[id] = attempts
+                delay = min(
+                    self.base_delay.total_seconds() * 2 ** (attempts - 1),
+                    self.max_delay.total_seconds(),
+                )
+                heapq.heappush(
+                    self._heap,
+                    (self.clock.monotonic() + self.random.uniform(0, delay), id),
+                )
+                self.retries += 1
+                return None
+        if self.dead_letter_path:
+            self._append(dead_letter)
+        return dead_letter
+
+    def requeue(self, id: int):
+        """
+        Makes the id due at once without counting an attempt, e.g. when it
+        was abandoned on an interrupted VM.
+        """
+        with self._lock:
+            heapq.heappush(self._heap, (self.clock.monotonic(), id))
+
+    def take(self, limit: int) -> list[int]:
+        """
+        Takes up to limit ids that are due, the longest overdue first.
+        """
+        now = self.clock.monotonic()
+        ids = []
+        with self._lock:
+            while self._heap and len(ids) < limit and self._heap[0][0] <= now:
+                ids.append(heapq.heappop(self._heap)[1])
+        return ids
+
+    def succeeded(self, id: int):
+        with self._lock:
+            self.attempts.pop(id, None)
+
+    def get_summary(self) -> dict[str, Any]:
+        """
+        :returns: the number of retries scheduled, ids waiting, and dead letters by reason.
+        """
+        with self._lock:
+            dead_letters = {NOT_FOUND: 0, TRANSPORT: 0, THROTTLED: 0}
+            for dead_letter in self.dead_letters:
+                dead_letters[dead_letter.reason] += 1
+            return {
+                "retries": self.retries,
+                "pending": len(self._heap),
+                "dead_letters": dead_letters,
+            }
+
+    def __len__(self):
+        return len(self._heap)
+
+    def _append(self, dead_letter: Dead_Letter):
+        directory = os.path.dirname(self.dead_letter_path or "")
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock, open(self.dead_letter_path or "", "a") as file:
+            file.write(json.dumps(dead_letter.to_dict()) + "\n")
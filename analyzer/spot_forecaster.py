@@ -0,0 +1,217 @@
+import math
+import heapq
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any
+
+from shared.timestamps import to_naive_utc
+from shared.types.spot_price import Spot_Price
+
+DEFAULT_HORIZON = timedelta(minutes=5)
+DEFAULT_STEP = timedelta(minutes=5)
+DEFAULT_HALF_LIFE = timedelta(hours=6)
+DEFAULT_PREWARM_THRESHOLD = 0.5
+# the autocorrelation is kept below 1 so the forecast spread never collapses to zero.
+MAX_PHI = 0.999
+# bounds the work of one observation after a long gap, e.g. a paused loop.
+MAX_CATCHUP_STEPS = 288
+
+
+class Spot_Forecaster:
+    def __init__(
+        self,
+        horizon: timedelta = DEFAULT_HORIZON,
+        step: timedelta = DEFAULT_STEP,
+        half_life: timedelta = DEFAULT_HALF_LIFE,
+    ):
+        """
+        Forecasts whether the cheaper of the two clouds is about to change,
+        so the other VM can be started before the switch instead of after it.
+
+        The spread (AWS price - Azure price) is modelled as an AR(1) process
+        around its EWMA. The mean, variance and lag-1 covariance are EWMAs
+        updated once per step, so each update costs O(1) and no price history
+        is kept. The spread h steps ahead is then normal with mean
+        mean + phi^h * (spread - mean) and variance variance * (1 - phi^(2h)).
+
+        Every prediction is scored once its horizon has passed, so backtests
+        can report the Brier score of the forecasts next to their cost.
+
+        :param horizon: how far ahead flips are forecast, e.g. the boot time
+            of the slower VM or the decision interval if that is longer.
+        :param step: the sampling interval of the AR(1) model.
+        :param half_life: how quickly old spreads stop mattering.
+        """
+        self.horizon = horizon
+        self.step = step
+        self.alpha = 1 - 0.5 ** (step / half_life)
+
+        self.spread: float | None = None
+        self.mean = 0.0
+        self.variance = 0.0
+        self.covariance = 0.0
+        self._previous: float | None = None
+        self._sampled_at: datetime | None = None
+
+        # (target time, probability, whether AWS was cheaper) awaiting their outcome.
+        self._pending: deque[tuple[datetime, float, bool]] = deque()
+        self.predictions = 0
+        self.flips = 0
+        self._squared_error = 0.0
+        self._probability_sum = 0.0
+
+    @property
+    def phi(self) -> float:
+        """
+        The estimated lag-1 autocorrelation of the spread per step.
+        """
+        if self.variance <= 0:
+            return MAX_PHI
+        return min(max(self.covariance / self.variance, 0.0), MAX_PHI)
+
+    def observe(self, time: datetime, aws_price: float, azure_price: float):
+        """
+        Feeds the spot prices in effect at the time. Observations must come
+        in time order, but need not be evenly spaced: the spread in effect
+        is sampled at every step boundary since the previous observation.
+
+        :param time: when the prices were read.
+        :param aws_price: the hourly spot price of the EC2 instance.
+        :param azure_price: the hourly spot price of the Azure VM.
+        """
+        if self.spread is None or self._sampled_at is None:
+            self._update(aws_price - azure_price)
+            self._sampled_at = time
+        else:
+            # the previous spread held until now, so it settles what was predicted up to now.
+            self._resolve(time)
+            steps = int((time - self._sampled_at) / self.step)
+            for _ in range(min(steps, MAX_CATCHUP_STEPS)):
+                self._update(self.spread)
+            if steps > MAX_CATCHUP_STEPS:
+                self._sampled_at = time
+            else:
+                self._sampled_at += steps * self.step
+        self.spread = aws_price - azure_price
+
+    def fit(self, aws_prices: list[Spot_Price], azure_prices: list[Spot_Price]):
+        """
+        Warms the model up on recorded price series, e.g. from
+        get_spot_price_history of EC2_Wrapper and Azure_VM_Wrapper. Both are
+        replayed in time order, starting once each has a price. Timestamps are
+        converted to naive UTC.
+
+        The series need not be sorted, describe_spot_price_history returns
+        the newest prices first with availability zones interleaved.
+
+        :param aws_prices: the spot price history of the EC2 instance.
+        :param azure_prices: the spot price history of the Azure VM.
+        """
+        events = heapq.merge(
+            *(
+                sorted(
+                    (to_naive_utc(price.timestamp), provider, price.price)
+                    for price in prices
+                )
+                for provider, prices in (("AWS", aws_prices), ("Azure", azure_prices))
+            )
+        )
+        latest: dict[str, float] = {}
+        for time, provider, price in events:
+            latest[provider] = price
+            if len(latest) == 2:
+                self.observe(time, latest["AWS"], latest["Azure"])
+
+    def get_flip_probability(self, horizon: timedelta | None = None) -> float | None:
+        """
+        Estimates the probability that the other cloud is cheaper at the end
+        of the horizon, i.e. when a VM started now would be ready.
+
+        :param horizon: how far ahead, the forecaster's horizon by default.
+        :returns: the probability, or None before the first observation.
+        """
+        if self.spread is None:
+            return None
+        steps = (horizon or self.horizon) / self.step
+        decay = self.phi**steps
+        mean = self.mean + decay * (self.spread - self.mean)
+        deviation = math.sqrt(max(self.variance * (1 - decay**2), 0.0))
+
+        aws_cheaper = self.spread <= 0
+        if deviation == 0:
+            return float((mean <= 0) != aws_cheaper)
+        # the probability the spread ends up above zero.
+        probability = 0.5 * math.erfc(-mean / (deviation * math.sqrt(2)))
+        return probability if aws_cheaper else 1 - probability
+
+    def predict(self, time: datetime) -> float | None:
+        """
+        Gets the flip probability over the horizon and records it, so it is
+        scored once an observation past time + horizon arrives.
+
+        :param time: the time of the latest observation.
+        :returns: the probability, or None before the first observation.
+        """
+        probability = self.get_flip_probability()
+        if probability is not None and self.spread is not None:
+            self._pending.append((time + self.horizon, probability, self.spread <= 0))
+        return probability
+
+    @property
+    def brier_score(self) -> float | None:
+        """
+        The mean squared error of the scored predictions, 0 is perfect.
+        """
+        return self._squared_error / self.predictions if self.predictions else None
+
+    def get_accuracy(self) -> dict[str, Any]:
+        """
+        Summarizes the scored predictions. The reference Brier score is the
+        one of always predicting the observed flip rate, a skill above 0
+        means the forecasts beat it.
+
+        :returns: the number of predictions and flips, the Brier score, the
+            reference Brier score and the skill.
+        """
+        accuracy: dict[str, Any] = {
+            "predictions": self.predictions,
+            "flips": self.flips,
+            "mean_probability": (
+                self._probability_sum / self.predictions if self.predictions else None
+            ),
+            "brier_score": self.brier_score,
+            "reference_brier_score": None,
+            "brier_skill": None,
+        }
+        if self.predictions:
+            flip_rate = self.flips / self.predictions
+            reference = flip_rate * (1 - flip_rate)
+            accuracy["reference_brier_score"] = reference
+            if reference > 0 and self.brier_score is not None:
+                accuracy["brier_skill"] = 1 - self.brier_score / reference
+        return accuracy
+
+    def _update(self, spread: float):
+        if self._previous is None:
+            self.mean = spread
+        else:
+            deviation = spread - self.mean
+            self.variance += self.alpha * (deviation**2 - self.variance)
+            self.covariance += self.alpha * (
+                deviation * (self._previous - self.mean) - self.covariance
+            )
+            self.mean += self.alpha * deviation
+        self._previous = spread
+
+    def _resolve(self, time: datetime):
+        if self.spread is None:
+            return
+        aws_cheaper_now = self.spread <= 0
+        while self._pending and self._pending[0][0] < time:
+            _, probability, aws_cheaper = self._pending.popleft()
+            flipped = aws_cheaper_now != aws_cheaper
+            self.predictions += 1
+            self.flips += flipped
+            self._probability_sum += probability
+            self._squared_error += (probability - flipped) ** 2
+
@@ -1,14 +1,17 @@
-import os
-import csv
 import heapq
 import boto3
-from dotenv import load_dotenv
 from datetime import datetime, timedelta
+from typing import Iterable, Iterator
+from shared.config import get_config
 from AWS.ec2_wrapper import EC2_Wrapper
 from Azure.vm_wrapper import Azure_VM_Wrapper
+from shared.output_writer import Output_Writer
+from analyzer.switch_statistics import Switch_Statistics
 
 
-load_dotenv(override=True)
+SPOT_PRICE_LOG_FIELDS = ["vm_type", "timestamp", "price", "aws_price", "azure_price"]
+# the prices are floats, inf until a provider's first price point.
+SPOT_PRICE_LOG_TYPES = {"price": "float64", "aws_price": "float64", "azure_price": "float64"}
 
 
 class Spot_Price_History_Analyzer:
@@ -22,6 +25,40 @@ class Spot_Price_History_Analyzer:
     def compare_costs(
         self, aws_instance: str, azure_vm: str, start_time: datetime, end_time: datetime
     ):
+        spot_price_log: list[dict[str, datetime | str | float]] = []
+        timestamp_of_switches: list[datetime] = []
+        switches = 0
+        curr_vm = ""
+
+        for entry in self.stream_costs(
+            aws_instance=aws_instance,
+            azure_vm=azure_vm,
+            start_time=start_time,
+            end_time=end_time,
+        ):
+            #  track number of switches between VM's
+            if curr_vm != "" and curr_vm != entry["vm_type"]:
+                timestamp_of_switches.append(entry["timestamp"])  # type: ignore
+                switches += 1
+            curr_vm = entry["vm_type"]  # type: ignore
+            spot_price_log.append(entry)
+
+        if spot_price_log:
+            return spot_price_log, switches, timestamp_of_switches
+
+    def stream_costs(
+        self, aws_instance: str, azure_vm: str, start_time: datetime, end_time: datetime
+    ) -> Iterator[dict[str, datetime | str | float]]:
+        """
+        Merges the AWS and Azure spot price histories in timestamp order and
+        yields one log entry per price change with the cheaper VM selected.
+        Entries are produced lazily so they can be streamed to an Output_Writer.
+
+        :param aws_instance: the EC2 instance type.
+        :param azure_vm: the Azure VM type.
+        :param start_time: the start of the price history.
+        :param end_time: the end of the price history.
+        """
         aws_spot_price_history = self.aws.get_spot_price_history(
             vm_type=aws_instance, start_time=start_time, end_time=end_time
         )
@@ -29,59 +66,40 @@ class Spot_Price_History_Analyzer:
             vm_type=azure_vm, start_time=start_time, end_time=end_time, region="eastus"
         )
 
-        print("Azure spot price history", azure_spot_price_history)
-
-        if aws_spot_price_history and azure_spot_price_history:
-            spot_price_histories = [*aws_spot_price_history, *azure_spot_price_history]
-            spot_price_heap = [
-                (spot_price.timestamp, spot_price)
-                for spot_price in spot_price_histories
-            ]
-            heapq.heapify(spot_price_heap)
-            switches = 0
-
-            curr_vm = ""
-            curr_aws_price = float("inf")
-            curr_azure_price = float("inf")
-            curr_price = float("inf")
-            spot_price_log: list[dict[str, datetime | str | float]] = []
-
-            timestamp_of_switches: list[datetime] = []
-
-            while spot_price_heap:
-                _, spot_price = heapq.heappop(spot_price_heap)
-
-                if spot_price.vm_type == aws_instance:
-                    curr_aws_price = spot_price.price
-                else:
-                    curr_azure_price = spot_price.price
-
-                if curr_aws_price < curr_azure_price:
-                    selected_vm = aws_instance
-                    selected_price = curr_aws_price
-                else:
-                    selected_vm = azure_vm
-                    selected_price = curr_azure_price
-
-                #  track number of switches between VM's
-                if curr_vm != "" and curr_vm != selected_vm:
-                    timestamp_of_switches.append(spot_price.timestamp)
-                    switches += 1
-
-                curr_vm = selected_vm
-                curr_price = selected_price
-
-                spot_price_log.append(
-                    {
-                        "vm_type": curr_vm,
-                        "timestamp": spot_price.timestamp,
-                        "price": curr_price,
-                        "aws_price": curr_aws_price,
-                        "azure_price": curr_azure_price
-                    }
-                )
-
-            return spot_price_log, switches, timestamp_of_switches
+        if not aws_spot_price_history or not azure_spot_price_history:
+            return
+
+        spot_price_histories = [*aws_spot_price_history, *azure_spot_price_history]
+        spot_price_heap = [
+            (spot_price.timestamp, spot_price) for spot_price in spot_price_histories
+        ]
+        heapq.heapify(spot_price_heap)
+
+        curr_aws_price = float("inf")
+        curr_azure_price = float("inf")
+
+        while spot_price_heap:
+            _, spot_price = heapq.heappop(spot_price_heap)
+
+            if spot_price.vm_type == aws_instance:
+                curr_aws_price = spot_price.price
+            else:
+                curr_azure_price = spot_price.price
+
+            if curr_aws_price < curr_azure_price:
+                selected_vm = aws_instance
+                selected_price = curr_aws_price
+            else:
+                selected_vm = azure_vm
+                selected_price = curr_azure_price
+
+            yield {
+                "vm_type": selected_vm,
+                "timestamp": spot_price.timestamp,
+                "price": selected_price,
+                "aws_price": curr_aws_price,
+                "azure_price": curr_azure_price,
+            }
 
     # def calculate_aws_cost(
     #     self, aws_instance: str, start_time: datetime, end_time: datetime
@@ -137,52 +155,87 @@ class Spot_Price_History_Analyzer:
     def create_csv(
         self,
         filename: str,
-        spot_price_log: list[dict[str, datetime | str | float]],
+        spot_price_log: Iterable[dict[str, datetime | str | float]],
     ):
-        with open(filename, "w", newline="") as csvfile:
-            writer = csv.DictWriter(
-                csvfile, fieldnames=["vm_type", "timestamp", "price", "aws_price", "azure_price"]
-            )
-            writer.writeheader()
-            writer.writerows(spot_price_log)
+        self.write_spot_price_log(filename, spot_price_log, format="csv")
 
-    def analyze_switch_logs(
+    def write_spot_price_log(
         self,
-        switch_logs: list[dict[str, str | int]],
-        timestamp_of_switches: list[list[datetime]],
-    ) -> dict[str, float | timedelta]:
-        switches = list(
-            log["switches"] for log in switch_logs if isinstance(log["switches"], int)
+        filename: str,
+        spot_price_log: Iterable[dict[str, datetime | str | float]]
+        | dict[str, list[datetime | str | float]],
+        format: str = "csv",
+    ) -> int:
+        """
+        Streams a spot price log to disk without materializing it.
+
+        :param filename: the path of the output file.
+        :param spot_price_log: an iterable of log entries or a columnar mapping.
+        :param format: one of csv, parquet or arrow.
+        :returns: the number of rows written.
+        """
+        writer = Output_Writer(
+            fieldnames=SPOT_PRICE_LOG_FIELDS, field_types=SPOT_PRICE_LOG_TYPES
         )
+        return writer.write(filename, spot_price_log, format=format)
 
-        if len(switch_logs) == 0:
-            return {}
-
-        avg_switches = sum(switches) / len(switch_logs)
-        max_switches = max(switches) if switches else 0
-        min_switches = min(switches) if switches else 0
-
-        avg_timedelta = timedelta(0)
-        total_timestamps = 0
-        total_switch_timedelta = timedelta(0)
+    def write_sweep(
+        self,
+        directory: str,
+        spot_price_logs: dict[
+            tuple[str, str], Iterable[dict[str, datetime | str | float]]
+        ],
+        format: str = "parquet",
+        max_workers: int = 4,
+    ) -> dict[tuple[str, ...], str]:
+        """
+        Writes the spot price logs of a multi-pair sweep, one partition per
+        (aws_instance, azure_vm) pair, with the partitions written in parallel.
+
+        :param directory: the root directory of the partitioned output.
+        :param spot_price_logs: the log of each (aws_instance, azure_vm) pair,
+            e.g. the generators returned by stream_costs.
+        :param format: one of csv, parquet or arrow.
+        :param max_workers: the number of partitions written concurrently.
+        :returns: a mapping of pair to the path of the written file.
+        """
+        writer = Output_Writer(
+            fieldnames=SPOT_PRICE_LOG_FIELDS, field_types=SPOT_PRICE_LOG_TYPES
+        )
+        return writer.write_partitioned(
+            directory,
+            spot_price_logs,
+            partition_by=["aws_instance", "azure_vm"],
+            format=format,
+            max_workers=max_workers,
+        )
 
+    def analyze_switch_logs(
+        self,
+        switch_logs: Iterable[dict[str, str | int]],
+        timestamp_of_switches: Iterable[Iterable[datetime]],
+        statistics: Switch_Statistics | None = None,
+    ) -> dict[str, float | timedelta]:
+        """
+        Summarizes the switches of a sweep, streaming the logs and timestamps
+        through quantile sketches instead of materializing them.
+
+        :param switch_logs: the switch log of each instance pair.
+        :param timestamp_of_switches: the switch timestamps of each instance pair.
+        :param statistics: the statistics to accumulate into, e.g. to merge
+            the partial results of several sweep workers.
+        :returns: the mean, min, max and p50/p90/p99 of the switch counts and
+            of the time between switches, or {} if there are no logs.
+        """
+        if statistics is None:
+            statistics = Switch_Statistics()
+
+        for log in switch_logs:
+            statistics.add_switches(log["switches"])
         for timestamps in timestamp_of_switches:
-            if len(timestamps) > 1:
-                switch_timedelta = timedelta(0)
-                total_timestamps += len(timestamps) - 1
-                for i in range(1, len(timestamps)):
-                    switch_timedelta += abs(timestamps[i] - timestamps[i - 1])
-                total_switch_timedelta += switch_timedelta
-
-        if total_timestamps > 0:
-            avg_timedelta = total_switch_timedelta / total_timestamps
-
-        return {
-            "avg_switches": avg_switches,
-            "max_switches": max_switches,
-            "min_switches": min_switches,
-            "avg_timedelta": avg_timedelta,
-        }
+            statistics.add_timestamps(timestamps)
+
+        return statistics.summary()
 
     def analyze_spot_price_history(self):
         pass
@@ -267,12 +320,13 @@ class Spot_Price_History_Analyzer:
     
 
 if __name__ == "__main__":
-    subscription_id = os.getenv("azure_subscription_id")
-    resource_group_name = os.getenv("azure_resource_group_name")
-    vm_name = os.getenv("azure_vm_name")
-    container_name = os.getenv("azure_container_name")
-    storage_name = os.getenv("azure_storage_name")
-    instance_id = os.getenv("aws_instance_id")
+    config = get_config()
+    subscription_id = config.azure_subscription_id
+    resource_group_name = config.azure_resource_group_name
+    vm_name = config.azure_vm_name
+    container_name = config.azure_container_name
+    storage_name = config.azure_storage_name
+    instance_id = config.aws_instance_id
     if (
         subscription_id
         and resource_group_name
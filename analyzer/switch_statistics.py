@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+from typing import Any, Iterable
+
+from shared.quantile_sketch import Quantile_Sketch, DEFAULT_RELATIVE_ACCURACY
+
+QUANTILES = {"p50": 0.5, "p90": 0.9, "p99": 0.99}
+
+
+class Switch_Statistics:
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        """
+        Accumulates switch counts and the intervals between switches of a
+        sweep one instance pair at a time, so neither the switch logs nor the
+        switch timestamps have to be kept in memory. The percentiles come
+        from quantile sketches, and the statistics of sweep workers combine
+        with merge.
+
+        :param relative_accuracy: the relative error of the percentiles.
+        """
+        self.num_logs = 0
+        self.switches = Quantile_Sketch(relative_accuracy)
+        self.intervals = Quantile_Sketch(relative_accuracy)
+
+    def add_switches(self, switches: int | None):
+        """
+        Adds the switch count of one instance pair.
+
+        :param switches: the number of switches, or None if it is unknown.
+        """
+        self.num_logs += 1
+        if isinstance(switches, int):
+            self.switches.add(switches)
+
+    def add_timestamps(self, timestamps: Iterable[datetime]):
+        """
+        Adds the intervals between consecutive switches of one instance pair.
+
+        :param timestamps: the switch timestamps in the order they happened.
+        """
+        previous: datetime | None = None
+        for timestamp in timestamps:
+            if previous is not None:
+                self.intervals.add(abs(timestamp - previous).total_seconds())
+            previous = timestamp
+
+    def merge(self, other: "Switch_Statistics"):
+        self.num_logs += other.num_logs
+        self.switches.merge(other.switches)
+        self.intervals.merge(other.intervals)
+
+    def summary(self) -> dict[str, float | timedelta]:
+        """
+        Summarizes the switch counts and intervals.
+
+        :returns: the mean, min, max and percentiles of the switch counts,
+            and the mean and percentiles of the intervals, or {} if no
+            switch count was added.
+        """
+        if self.num_logs == 0:
+            return {}
+
+        summary: dict[str, float | timedelta] = {
+            "avg_switches": self.switches.sum / self.num_logs,
+            "max_switches": self.switches.max if self.switches.count else 0,
+            "min_switches": self.switches.min if self.switches.count else 0,
+            "avg_timedelta": timedelta(seconds=self.intervals.mean or 0),
+        }
+        for name, q in QUANTILES.items():
+            summary[f"{name}_switches"] = self.switches.quantile(q) or 0
+        for name, q in QUANTILES.items():
+            summary[f"{name}_timedelta"] = timedelta(
+                seconds=self.intervals.quantile(q) or 0
+            )
+        return summary
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "num_logs": self.num_logs,
+            "switches": self.switches.to_dict(),
+            "intervals": self.intervals.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "Switch_Statistics":
+        statistics = cls()
+        statistics.num_logs = data["num_logs"]
+        statistics.switches = Quantile_Sketch.from_dict(data["switches"])
+        statistics.intervals = Quantile_Sketch.from_dict(data["intervals"])
+        return statistics
@@ -1,6 +1,8 @@
 import sys
 import requests
-from bs4 import BeautifulSoup
+
+# the first paragraph of the page Wikipedia serves for a curid without an article.
+MISSING_ARTICLE_TEXT = "The requested page title is empty or contains only a namespace prefix.\n"
 
 class WebsiteNotFoundException(Exception):
     def __init__(self, message: str):
@@ -23,11 +25,19 @@ class Web_Scraper:
         :params url: the url of the Wikipedia article.
         :returns: a dictionary with the url and the first paragraph
         """
+        # imported here so importing WebsiteNotFoundException stays cheap.
+        from bs4 import BeautifulSoup
+
         try:
             response = requests.get(url, timeout=10)
             soup = BeautifulSoup(response.text, 'html.parser')
             paragraphs = [p.get_text() for p in soup.find_all('p')]
-            if len(paragraphs) < 2 or paragraphs[0] == "The requested page title is empty or contains only a namespace prefix.\n":
+            if paragraphs and paragraphs[0] == MISSING_ARTICLE_TEXT:
+                raise WebsiteNotFoundException(f"Wikipedia article url {url} is not found.")
+            # any other failed request (throttled, forbidden, a proxy error)
+            # is not a missing article, so it is retried.
+            response.raise_for_status()
+            if len(paragraphs) < 2:
                 raise WebsiteNotFoundException(f"Wikipedia article url {url} is not found.")
             # the first element of a valid article is always \n.
             return {"url": url, "content": paragraphs[1]}
@@ -0,0 +1,119 @@
+"""
+Guards the startup time of the entry points with `python -X importtime`.
+
+Each module is imported in a fresh interpreter. The check fails when:
+- its cumulative import time exceeds its budget, or
+- any of the SDKs that should only load on first use gets imported eagerly.
+
+Run it from the repository root:
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --module AWS.ec2_wrapper --repeat 5
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# module -> cumulative import time budget (ms). The budgets leave room for
+# slower machines, the lazy import check below is what catches regressions.
+BUDGETS_MS = {
+    "analyzer.analyzer": 600,
+    "AWS.ec2_wrapper": 400,
+    "Azure.vm_wrapper": 300,
+    "analyzer.cost_reconciler": 600,
+}
+
+# SDKs that are only imported on first use. Importing any of them while
+# importing a module above is a regression.
+LAZY_MODULES = [
+    "Azure.instrumentation",
+    "paramiko",
+    "bs4",
+    "mypy_boto3_",
+    "azure.identity",
+    "azure.mgmt.",
+    "azure.monitor.query",
+    "azure.storage.blob",
+    "pyarrow",
+]
+
+
+def measure(module: str) -> tuple[float, list[str]]:
+    """
+    Imports the module in a fresh interpreter.
+
+    :param module: the dotted module name.
+    :returns: the cumulative import time (ms) and every module it imported.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to import {module}:\n{result.stderr}")
+
+    cumulative_ms = 0.0
+    imported: list[str] = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        name = name.strip()
+        imported.append(name)
+        if name == module:
+            cumulative_ms = int(cumulative) / 1000
+    return cumulative_ms, imported
+
+
+def check(module: str, budget_ms: float, repeat: int) -> bool:
+    """
+    Checks the module against its budget and the lazy imports, printing the result.
+
+    :param module: the dotted module name.
+    :param budget_ms: the cumulative import time budget.
+    :param repeat: the number of runs, the fastest one is reported.
+    :returns: whether the module passed.
+    """
+    runs = [measure(module) for _ in range(repeat)]
+    cumulative_ms = min(cumulative for cumulative, _ in runs)
+    eager_imports = sorted(
+        {
+            name
+            for name in runs[0][1]
+            if any(
+                name == lazy.rstrip(".") or name.startswith(lazy)
+                for lazy in LAZY_MODULES
+            )
+        }
+    )
+
+    passed = cumulative_ms <= budget_ms and not eager_imports
+    print(
+        f"{'ok  ' if passed else 'FAIL'} {module}: {cumulative_ms:.1f} ms "
+        f"(budget {budget_ms:.0f} ms)"
+    )
+    if eager_imports:
+        print(f"     imported eagerly: {', '.join(eager_imports[:10])}")
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--module", action="append", help="only check these modules")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    modules = args.module or list(BUDGETS_MS)
+    results = [
+        check(module, BUDGETS_MS.get(module, float("inf")), args.repeat)
+        for module in modules
+    ]
+    sys.exit(0 if all(results) else 1)
@@ -0,0 +1,248 @@
+import os
+import json
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    import requests
+
+# latency histogram bucket upper bounds in seconds, from fast API calls up to
+# long-running operations such as VM starts.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+DEFAULT_METRICS_PORT = 9464
+DEFAULT_PROMETHEUS_PATH = os.path.join(".cache", "metrics", "cloud_calls.prom")
+DEFAULT_JSON_PATH = os.path.join(".cache", "metrics", "cloud_calls.json")
+
+
+class Call_Stats:
+    def __init__(self, buckets: tuple[float, ...]):
+        """
+        The counters and latency histogram of one (provider, operation).
+        """
+        self.calls = 0
+        self.errors = 0
+        self.throttles = 0
+        self.retries = 0
+        self.latency_sum = 0.0
+        # bucket_counts[i] counts latencies <= buckets[i], the last slot is +Inf.
+        self.bucket_counts = [0] * (len(buckets) + 1)
+
+    def to_dict(self, buckets: tuple[float, ...]) -> dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "throttles": self.throttles,
+            "retries": self.retries,
+            "latency_sum": self.latency_sum,
+            "latency_buckets": {
+                str(bound): count
+                for bound, count in zip(buckets + (float("inf"),), self.bucket_counts)
+            },
+        }
+
+
+class Call_Metrics:
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        """
+        Records the latency, errors, throttles and retries of every outbound
+        cloud call per (provider, operation). Recording is one lock and one
+        bisect, cheap enough to leave on for every call.
+
+        :param buckets: the latency histogram bucket upper bounds in seconds.
+        """
+        self.buckets = buckets
+        self._stats: dict[tuple[str, str], Call_Stats] = {}
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        provider: str,
+        operation: str,
+        latency: float,
+        error: bool = False,
+        throttled: bool = False,
+        retries: int = 0,
+    ):
+        """
+        Records one call.
+
+        :param provider: AWS or Azure.
+        :param operation: the called operation, e.g. ec2.DescribeInstances.
+        :param latency: the duration of the call in seconds, retries included.
+        :param error: whether the call failed.
+        :param throttled: whether the provider throttled the call or any of its attempts.
+        :param retries: the number of retries the SDK made.
+        """
+        bucket = bisect.bisect_left(self.buckets, latency)
+        with self._lock:
+            stats = self._stats.get((provider, operation))
+            if stats is None:
+                stats = Call_Stats(self.buckets)
+                self._stats[(provider, operation)] = stats
+            stats.calls += 1
+            stats.errors += error
+            stats.throttles += throttled
+            stats.retries += retries
+            stats.latency_sum += latency
+            stats.bucket_counts[bucket] += 1
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def to_dict(self) -> dict[str, dict[str, dict[str, Any]]]:
+        """
+        Gets a snapshot of every operation, keyed by provider then operation.
+        """
+        snapshot: dict[str, dict[str, dict[str, Any]]] = {}
+        with self._lock:
+            for (provider, operation), stats in sorted(self._stats.items()):
+                snapshot.setdefault(provider, {})[operation] = stats.to_dict(
+                    self.buckets
+                )
+        return snapshot
+
+    def to_prometheus(self) -> str:
+        """
+        Renders every operation in the Prometheus text exposition format.
+        """
+        with self._lock:
+            items = sorted(
+                (key, stats.to_dict(self.buckets)) for key, stats in self._stats.items()
+            )
+
+        lines: list[str] = []
+        for name, field, help_text in (
+            ("cloud_calls_total", "calls", "Outbound cloud calls."),
+            ("cloud_call_errors_total", "errors", "Outbound cloud calls that failed."),
+            ("cloud_call_throttles_total", "throttles", "Outbound cloud calls that were throttled."),
+            ("cloud_call_retries_total", "retries", "Retries made by the SDKs."),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for (provider, operation), stats in items:
+                lines.append(f"{name}{_labels(provider, operation)} {stats[field]}")
+
+        name = "cloud_call_duration_seconds"
+        lines.append(f"# HELP {name} Latency of outbound cloud calls.")
+        lines.append(f"# TYPE {name} histogram")
+        for (provider, operation), stats in items:
+            cumulative = 0
+            for bound, count in zip(
+                self.buckets + (float("inf"),), stats["latency_buckets"].values()
+            ):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(
+                    f"{name}_bucket{_labels(provider, operation, le=le)} {cumulative}"
+                )
+            lines.append(f"{name}_sum{_labels(provider, operation)} {stats['latency_sum']}")
+            lines.append(f"{name}_count{_labels(provider, operation)} {stats['calls']}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str = DEFAULT_PROMETHEUS_PATH):
+        """
+        Writes the Prometheus text to a file, e.g. for node_exporter's textfile collector.
+        """
+        _write_atomic(path, self.to_prometheus())
+
+    def write_json(self, path: str = DEFAULT_JSON_PATH):
+        _write_atomic(path, json.dumps(self.to_dict(), indent=2))
+
+    def serve(
+        self, port: int = DEFAULT_METRICS_PORT, host: str = "127.0.0.1"
+    ) -> ThreadingHTTPServer:
+        """
+        Serves /metrics (Prometheus text) and /metrics.json from a daemon thread.
+
+        :param port: the port to listen on.
+        :param host: the interface to listen on.
+        :returns: the server, shut it down with server.shutdown().
+        """
+        call_metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body = call_metrics.to_prometheus().encode()
+                    content_type = "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body = json.dumps(call_metrics.to_dict()).encode()
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+# every wrapper records to this registry.
+call_metrics = Call_Metrics()
+
+
+def instrument_session(
+    session: "requests.Session",
+    provider: str,
+    operation: str,
+    metrics: Call_Metrics = call_metrics,
+) -> "requests.Session":
+    """
+    Records every response of a requests session, for the REST APIs called
+    without an SDK. Each request is recorded on its own, so retries made by
+    the caller show up as separate calls.
+
+    :param session: the session to instrument.
+    :param provider: the provider the requests are recorded under.
+    :param operation: the name the requests are recorded under.
+    :param metrics: the registry the requests are recorded to.
+    :returns: the same session.
+    """
+
+    def record(response: "requests.Response", *args, **kwargs):
+        metrics.record(
+            provider,
+            operation,
+            response.elapsed.total_seconds(),
+            error=response.status_code >= 400,
+            throttled=response.status_code == 429,
+        )
+
+    session.hooks["response"].append(record)
+    return session
+
+
+def _labels(provider: str, operation: str, **extra: str) -> str:
+    labels = {"provider": provider, "operation": operation, **extra}
+    return (
+        "{"
+        + ",".join(
+            '{}="{}"'.format(
+                key, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            )
+            for key, value in labels.items()
+        )
+        + "}"
+    )
+
+
+def _write_atomic(path: str, content: str):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as file:
+        file.write(content)
+    os.replace(temp_path, path)
+
@@ -0,0 +1,105 @@
+import time
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable, TypeVar
+
+Item = TypeVar("Item")
+Result = TypeVar("Result")
+
+
+class Clock:
+    """
+    The wall clock, sleeps and concurrency of the control loop. Analyzer reads
+    time only through its clock, so a backtest can swap in Virtual_Clock.
+    """
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+    def to_utc(self, time: datetime) -> datetime:
+        """
+        Converts a time read from this clock to UTC, naive times being local.
+        """
+        return time.astimezone(timezone.utc)
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+    def map(
+        self,
+        function: Callable[[Item], Result],
+        items: Iterable[Item],
+        max_workers: int,
+    ) -> list[Result]:
+        """
+        Runs the function over the items concurrently.
+
+        :param function: the task.
+        :param items: the task inputs.
+        :param max_workers: the number of tasks run at once.
+        :returns: the results in the order of the items.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(function, items))
+
+
+class Virtual_Clock(Clock):
+    def __init__(self, start_time: datetime):
+        """
+        A simulated clock that only advances when something sleeps on it, so
+        a week of the control loop runs as fast as its logic allows.
+
+        map runs the tasks one after another, each starting when the earliest
+        of max_workers simulated workers is free, then advances the clock to
+        when the last one finished. That models the tasks running in parallel
+        while keeping the simulation single threaded and deterministic.
+
+        :param start_time: the simulated time the clock starts at.
+        """
+        self.start_time = start_time
+        self.elapsed = 0.0
+
+    def now(self) -> datetime:
+        return self.start_time + timedelta(seconds=self.elapsed)
+
+    def to_utc(self, time: datetime) -> datetime:
+        # simulated times are naive UTC, e.g. from backtest price points.
+        if time.tzinfo is None:
+            return time.replace(tzinfo=timezone.utc)
+        return time.astimezone(timezone.utc)
+
+    def monotonic(self) -> float:
+        return self.elapsed
+
+    def sleep(self, seconds: float):
+        self.elapsed += max(seconds, 0.0)
+
+    def advance_to(self, timestamp: datetime):
+        """
+        Moves the clock forward to the given time, never backward.
+        """
+        self.elapsed = max(
+            self.elapsed, (timestamp - self.start_time).total_seconds()
+        )
+
+    def map(
+        self,
+        function: Callable[[Item], Result],
+        items: Iterable[Item],
+        max_workers: int,
+    ) -> list[Result]:
+        # the time each worker becomes free, tasks go to the earliest free one.
+        workers = [self.elapsed] * max(max_workers, 1)
+        batch_end = self.elapsed
+        results: list[Result] = []
+        for item in items:
+            self.elapsed = heapq.heappop(workers)
+            results.append(function(item))
+            heapq.heappush(workers, self.elapsed)
+            batch_end = max(batch_end, self.elapsed)
+        self.elapsed = batch_end
+        return results
@@ -0,0 +1,78 @@
+import os
+import threading
+from dotenv import load_dotenv
+
+
+class Config:
+    def __init__(
+        self,
+        aws_instance_id: str | None = None,
+        aws_instance_name: str = "COS IW Free Tier",
+        aws_bucket_name: str = "johnrmrzbucket",
+        azure_subscription_id: str | None = None,
+        azure_resource_group_name: str | None = None,
+        azure_vm_name: str | None = None,
+        azure_storage_name: str | None = None,
+        azure_container_name: str | None = None,
+        cloudnet_subscription_primary_key: str = "",
+        aws_metadata_url: str | None = None,
+        azure_metadata_url: str | None = None,
+    ):
+        """
+        The settings shared by every module, read from the environment and .env.
+
+        :param aws_instance_id: the id of the EC2 instance.
+        :param aws_instance_name: the NAME tag of the EC2 instance.
+        :param aws_bucket_name: the S3 bucket artifacts and segments are uploaded to.
+        :param azure_subscription_id: the subscription id for the virtual machines.
+        :param azure_resource_group_name: the resource group name attached to the subscription.
+        :param azure_vm_name: the name of the Azure virtual machine.
+        :param azure_storage_name: the Azure storage account name.
+        :param azure_container_name: the Azure blob container name.
+        :param cloudnet_subscription_primary_key: the cloudprice.net API key.
+        :param aws_metadata_url: the instance metadata endpoint of the EC2 instance,
+            polled for interruption notices. It is only reachable from the
+            instance, so this is a forward of it (or a stub), None to not watch it.
+        :param azure_metadata_url: the instance metadata endpoint of the Azure VM,
+            polled for Scheduled Events, likewise a forward or None.
+        """
+        self.aws_instance_id = aws_instance_id
+        self.aws_instance_name = aws_instance_name
+        self.aws_bucket_name = aws_bucket_name
+        self.azure_subscription_id = azure_subscription_id
+        self.azure_resource_group_name = azure_resource_group_name
+        self.azure_vm_name = azure_vm_name
+        self.azure_storage_name = azure_storage_name
+        self.azure_container_name = azure_container_name
+        self.cloudnet_subscription_primary_key = cloudnet_subscription_primary_key
+        self.aws_metadata_url = aws_metadata_url
+        self.azure_metadata_url = azure_metadata_url
+
+    @classmethod
+    def from_env(cls) -> "Config":
+        """
+        Reads the config from the environment, with .env taking precedence.
+        """
+        load_dotenv(override=True)
+        defaults = cls()
+        return cls(
+            **{
+                name: os.getenv(name, default)
+                for name, default in vars(defaults).items()
+            }
+        )
+
+
+_config: Config | None = None
+_config_lock = threading.Lock()
+
+
+def get_config() -> Config:
+    """
+    Gets the process-wide config, loading .env the first time only.
+    """
+    global _config
+    with _config_lock:
+        if _config is None:
+            _config = Config.from_env()
+        return _config
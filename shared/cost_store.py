@@ -0,0 +1,209 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+from shared.types.cost_record import Cost_Record
+
+DEFAULT_COST_PATH = os.path.join(".cache", "costs.db")
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+class Cost_Store:
+    def __init__(self, path: str = DEFAULT_COST_PATH):
+        """
+        Stores the billed cost of every provider per hour, resource and usage
+        type in one local SQLite table, so reports never re-query billing APIs
+        for hours that are already final.
+
+        :param path: the SQLite database file.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self.connection:
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS costs (
+                    provider TEXT NOT NULL,
+                    resource TEXT NOT NULL,
+                    usage_type TEXT NOT NULL,
+                    hour TEXT NOT NULL,
+                    amount REAL NOT NULL,
+                    estimated INTEGER NOT NULL,
+                    PRIMARY KEY (provider, resource, usage_type, hour)
+                ) WITHOUT ROWID
+                """
+            )
+
+    def replace_range(
+        self,
+        provider: str,
+        resource: str,
+        start_time: datetime,
+        end_time: datetime,
+        cost_records: list[Cost_Record],
+        match_prefix: bool = False,
+    ) -> int:
+        """
+        Replaces every stored cost of the resource in [start_time, end_time)
+        with the given records, so usage types that disappeared on revision
+        are dropped too.
+
+        :param provider: AWS or Azure.
+        :param resource: the resource the costs are billed to.
+        :param start_time: the start of the re-fetched range, inclusive.
+        :param end_time: the end of the re-fetched range, exclusive.
+        :param cost_records: the costs of the range.
+        :param match_prefix: treat resource as a prefix, e.g. a resource group's id.
+        :returns: the number of records written.
+        """
+        with self._lock, self.connection:
+            self.connection.execute(
+                f"DELETE FROM costs WHERE provider = ? AND {_resource_condition(match_prefix)} "
+                "AND hour >= ? AND hour < ?",
+                (
+                    provider,
+                    _resource_param(resource, match_prefix),
+                    _format_hour(start_time),
+                    _format_hour(end_time),
+                ),
+            )
+            self._insert(cost_records)
+        return len(cost_records)
+
+    def add(self, cost_records: list[Cost_Record]) -> int:
+        """
+        Writes the records, replacing any existing record at the same key.
+
+        :param cost_records: the costs to write.
+        :returns: the number of records written.
+        """
+        with self._lock, self.connection:
+            self._insert(cost_records)
+        return len(cost_records)
+
+    def get_resume_time(
+        self,
+        provider: str,
+        resource: str,
+        settled_before: datetime,
+        match_prefix: bool = False,
+    ) -> datetime | None:
+        """
+        Gets the first hour that still needs to be fetched: the earliest
+        estimated hour after settled_before, or else the latest stored hour
+        (which may not have been complete when it was fetched).
+
+        :param provider: AWS or Azure.
+        :param resource: the resource the costs are billed to.
+        :param settled_before: estimated hours before this time are treated as final.
+        :param match_prefix: treat resource as a prefix, e.g. a resource group's id.
+        :returns: the hour to resume from, or None if nothing is stored.
+        """
+        with self._lock:
+            estimated_hour, latest_hour = self.connection.execute(
+                "SELECT MIN(CASE WHEN estimated = 1 AND hour >= ? THEN hour END), "
+                f"MAX(hour) FROM costs WHERE provider = ? AND {_resource_condition(match_prefix)}",
+                (
+                    _format_hour(settled_before),
+                    provider,
+                    _resource_param(resource, match_prefix),
+                ),
+            ).fetchone()
+        if estimated_hour:
+            return _parse_hour(estimated_hour)
+        if latest_hour:
+            return _parse_hour(latest_hour)
+        return None
+
+    def query(
+        self,
+        provider: str | None = None,
+        resource: str | None = None,
+        start_time: datetime | None = None,
+        end_time: datetime | None = None,
+    ) -> list[Cost_Record]:
+        """
+        Reads the costs matching every given filter, ordered by hour.
+
+        :param provider: AWS or Azure.
+        :param resource: the resource the costs are billed to.
+        :param start_time: the start of the window, inclusive.
+        :param end_time: the end of the window, exclusive.
+        """
+        conditions: list[str] = []
+        params: list[str] = []
+        if provider is not None:
+            conditions.append("provider = ?")
+            params.append(provider)
+        if resource is not None:
+            conditions.append("resource = ?")
+            params.append(resource)
+        if start_time is not None:
+            conditions.append("hour >= ?")
+            params.append(_format_hour(start_time))
+        if end_time is not None:
+            conditions.append("hour < ?")
+            params.append(_format_hour(end_time))
+
+        sql = "SELECT provider, resource, usage_type, hour, amount, estimated FROM costs"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY hour"
+
+        with self._lock:
+            rows = self.connection.execute(sql, params).fetchall()
+        return [
+            Cost_Record(
+                provider=row[0],
+                resource=row[1],
+                usage_type=row[2],
+                hour=_parse_hour(row[3]),
+                amount=row[4],
+                estimated=bool(row[5]),
+            )
+            for row in rows
+        ]
+
+    def close(self):
+        self.connection.close()
+
+    def _insert(self, cost_records: list[Cost_Record]):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO costs VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    record.provider,
+                    record.resource,
+                    record.usage_type,
+                    _format_hour(record.hour),
+                    record.amount,
+                    int(record.estimated),
+                )
+                for record in cost_records
+            ),
+        )
+
+
+def _resource_condition(match_prefix: bool) -> str:
+    return "resource LIKE ? ESCAPE '\\'" if match_prefix else "resource = ?"
+
+
+def _resource_param(resource: str, match_prefix: bool) -> str:
+    if not match_prefix:
+        return resource
+    escaped = resource.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"{escaped}%"
+
+
+def _format_hour(timestamp: datetime) -> str:
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc)
+    return timestamp.strftime(TIMESTAMP_FORMAT)
+
+
+def _parse_hour(timestamp: str) -> datetime:
+    return datetime.strptime(timestamp, TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc)
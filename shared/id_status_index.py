@@ -0,0 +1,150 @@
+import os
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from shared.roaring_bitmap import Roaring_Bitmap
+
+DEFAULT_ID_STATUS_PATH = os.path.join(".cache", "id_status.bin")
+MAGIC = b"IDS1"
+STORED = "stored"
+MISSING = "missing"
+FAILED = "failed"
+STATUSES = (STORED, MISSING, FAILED)
+
+
+class Id_Status_Index:
+    def __init__(self, path: str = DEFAULT_ID_STATUS_PATH, skip_failed: bool = False):
+        """
+        Records which article ids are stored, missing (no such article) or
+        failed (dead-lettered after their retries), one compressed bitmap
+        per status. The control loop consults it before dispatching, so ids
+        whose outcome is known are skipped in bulk instead of costing a
+        remote round trip each.
+
+        The index is loaded from path if it exists. Loading only reads the
+        container descriptors, so it takes milliseconds even for tens of
+        millions of ids.
+
+        :param path: the file the index is loaded from and saved to.
+        :param skip_failed: whether failed ids are skipped as well, by default
+            later runs dispatch them again, see get_ids.
+        """
+        self.path = path
+        self.skip_failed = skip_failed
+        # numpy is imported on first use, so the statuses can be imported cheaply.
+        from shared.roaring_bitmap import Roaring_Bitmap
+
+        self._bitmaps: dict[str, "Roaring_Bitmap"] = {
+            status: Roaring_Bitmap() for status in STATUSES
+        }
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self.load()
+
+    def load(self):
+        from shared.roaring_bitmap import Roaring_Bitmap
+
+        with open(self.path, "rb") as file:
+            data = file.read()
+        if data[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{self.path} is not an id status index")
+        offset = len(MAGIC)
+        bitmaps = {}
+        for status in STATUSES:
+            bitmaps[status], offset = Roaring_Bitmap.from_bytes(data, offset)
+        with self._lock:
+            self._bitmaps = bitmaps
+
+    def save(self):
+        """
+        Writes the index to its path, replacing the previous file atomically.
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            data = MAGIC + b"".join(
+                self._bitmaps[status].to_bytes() for status in STATUSES
+            )
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, self.path)
+
+    def set(self, id: int, status: str):
+        """
+        Records the status of an id, replacing its previous one.
+
+        :param id: the article id.
+        :param status: stored, missing or failed.
+        """
+        if status not in self._bitmaps:
+            raise ValueError(f"Unknown id status {status}")
+        with self._lock:
+            for other_status, bitmap in self._bitmaps.items():
+                if other_status != status:
+                    bitmap.discard(id)
+            self._bitmaps[status].add(id)
+
+    def get(self, id: int) -> str | None:
+        """
+        :returns: the status of the id, or None if it was never recorded.
+        """
+        with self._lock:
+            for status, bitmap in self._bitmaps.items():
+                if id in bitmap:
+                    return status
+        return None
+
+    def is_skipped(self, id: int) -> bool:
+        return self.get(id) in self._get_skipped_statuses()
+
+    def next_unknown(self, id: int) -> int:
+        """
+        Finds the first id at or after the given one that is not skipped.
+        """
+        from shared.roaring_bitmap import MAX_VALUE
+
+        bitmaps = [self._bitmaps[status] for status in self._get_skipped_statuses()]
+        with self._lock:
+            # alternates between the bitmaps until an id is in none of them.
+            while id <= MAX_VALUE:
+                next_id = id
+                for bitmap in bitmaps:
+                    next_id = bitmap.next_absent(next_id)
+                if next_id == id:
+                    return id
+                id = next_id
+        return id
+
+    def take(self, start: int, count: int) -> tuple[list[int], int]:
+        """
+        Takes the next ids to dispatch, skipping those whose outcome is known.
+
+        :param start: the first id to consider.
+        :param count: the number of ids to take.
+        :returns: the ids and the id to continue from after them.
+        """
+        ids = []
+        id = start
+        while len(ids) < count:
+            id = self.next_unknown(id)
+            ids.append(id)
+            id += 1
+        return ids, id
+
+    def get_ids(self, status: str) -> list[int]:
+        """
+        Gets every id with the status in ascending order, e.g. the failed ids
+        a run retries before resuming after the last dispatched id.
+        """
+        with self._lock:
+            return list(self._bitmaps[status])
+
+    def get_counts(self) -> dict[str, int]:
+        with self._lock:
+            return {status: len(bitmap) for status, bitmap in self._bitmaps.items()}
+
+    def _get_skipped_statuses(self) -> tuple[str, ...]:
+        return STATUSES if self.skip_failed else (STORED, MISSING)
@@ -0,0 +1,248 @@
+import os
+import json
+import bisect
+from datetime import datetime, timedelta, timezone
+
+from shared.virtual_machine import Virtual_Machine
+from shared.types.instance_shape import Instance_Shape
+
+MiB_MULTIPLIER = 1024
+DEFAULT_CATALOG_PATH = os.path.join(".cache", "instance_catalog.json")
+DEFAULT_TTL = timedelta(days=1)
+
+
+def get_catalog_path(provider: str) -> str:
+    """
+    The path of a catalog of a single provider's shapes, kept apart from the
+    shared catalog so neither overwrites the other.
+    """
+    return os.path.join(".cache", f"instance_catalog_{provider.lower()}.json")
+
+
+class Instance_Catalog:
+    def __init__(
+        self,
+        providers: list[Virtual_Machine],
+        path: str = DEFAULT_CATALOG_PATH,
+        ttl: timedelta = DEFAULT_TTL,
+        regions: dict[str, list[str]] | None = None,
+    ):
+        """
+        Initializes a local catalog of the instance shapes of every provider.
+        The catalog is persisted to disk and only re-listed from the providers
+        once it is older than the TTL, so queries never page through the
+        provider APIs.
+
+        :param providers: the wrappers used to list instance shapes (EC2_Wrapper, Azure_VM_Wrapper).
+        :param path: the JSON file the catalog is persisted to.
+        :param ttl: how long the catalog is used before it is refreshed.
+        :param regions: the regions to list per provider, e.g. {"AWS": ["us-east-1"]}.
+        """
+        self.providers = providers
+        self.path = path
+        self.ttl = ttl
+        self.regions = regions or {}
+        self.refreshed_at: datetime | None = None
+        self.shapes: list[Instance_Shape] = []
+
+        # (provider, vcpus) -> shapes sorted by memory, with the memory keys
+        # kept separately so range queries are a pair of bisects.
+        self._by_vcpus: dict[tuple[str, int], list[Instance_Shape]] = {}
+        self._memory_keys: dict[tuple[str, int], list[int]] = {}
+        self._by_name: dict[tuple[str, str], Instance_Shape] = {}
+
+        self._load()
+
+    def refresh(self, force: bool = False):
+        """
+        Re-lists the instance shapes from every provider if the catalog is stale.
+
+        :param force: refresh even if the catalog is within its TTL.
+        """
+        if not self.providers or (not force and not self.is_stale()):
+            return
+
+        shapes: list[Instance_Shape] = []
+        for provider in self.providers:
+            shapes.extend(
+                provider.list_instance_shapes(
+                    regions=self.regions.get(provider.provider_name)
+                )
+            )
+
+        self.refreshed_at = datetime.now(timezone.utc)
+        self._build_indexes(shapes)
+        self._save()
+
+    def is_stale(self) -> bool:
+        return (
+            self.refreshed_at is None
+            or datetime.now(timezone.utc) - self.refreshed_at > self.ttl
+        )
+
+    def get(self, provider: str, name: str) -> Instance_Shape | None:
+        """
+        Looks up a single instance shape by name.
+
+        :param provider: AWS or Azure.
+        :param name: the instance type or VM size name.
+        """
+        self.refresh()
+        return self._by_name.get((provider, name))
+
+    def find(
+        self,
+        vcpus: int,
+        memory: float | None = None,
+        min_memory: float | None = None,
+        max_memory: float | None = None,
+        provider: str | None = None,
+        gpus: int | None = None,
+        region: str | None = None,
+        spot_only: bool = True,
+    ) -> list[Instance_Shape]:
+        """
+        Finds the instance shapes with the given vCPUs and memory. Memory can
+        be exact (memory) or a tolerance range (min_memory, max_memory),
+        e.g. find(vcpus=16, min_memory=60, max_memory=70).
+
+        :param vcpus: the amount of vCPUs that each shape must match.
+        :param memory: the exact amount of memory (GiB).
+        :param min_memory: the lower bound of memory (GiB), inclusive.
+        :param max_memory: the upper bound of memory (GiB), inclusive.
+        :param provider: AWS or Azure. Defaults to both.
+        :param gpus: the amount of GPUs that each shape must match.
+        :param region: a region that each shape must be offered in.
+        :param spot_only: only return shapes that support spot instances.
+        :returns: the matching shapes, sorted by memory.
+        """
+        self.refresh()
+
+        if memory is not None:
+            min_memory = max_memory = memory
+        low = int(min_memory * MiB_MULTIPLIER) if min_memory is not None else 0
+        high = (
+            int(max_memory * MiB_MULTIPLIER)
+            if max_memory is not None
+            else float("inf")
+        )
+
+        providers = [provider] if provider else ["AWS", "Azure"]
+        matches: list[Instance_Shape] = []
+        for provider_name in providers:
+            key = (provider_name, vcpus)
+            shapes = self._by_vcpus.get(key, [])
+            memory_keys = self._memory_keys.get(key, [])
+            start = bisect.bisect_left(memory_keys, low)
+            end = bisect.bisect_right(memory_keys, high)
+            for shape in shapes[start:end]:
+                if spot_only and not shape.supports_spot:
+                    continue
+                if gpus is not None and shape.gpus != gpus:
+                    continue
+                if region and region not in shape.regions:
+                    continue
+                matches.append(shape)
+
+        return sorted(matches, key=lambda shape: shape.memory_mib)
+
+    def pair_equivalent_shapes(
+        self,
+        memory_tolerance: float = 0.1,
+        spot_only: bool = True,
+    ) -> list[tuple[Instance_Shape, Instance_Shape]]:
+        """
+        Pairs every EC2 instance type with the Azure VM sizes that have the same
+        vCPUs and GPUs and a memory within the relative tolerance.
+
+        :param memory_tolerance: the allowed relative memory difference, e.g. 0.1 for 10%.
+        :param spot_only: only pair shapes that support spot instances.
+        :returns: (EC2 shape, Azure shape) pairs, closest memory first per EC2 shape.
+        """
+        self.refresh()
+
+        pairs: list[tuple[Instance_Shape, Instance_Shape]] = []
+        for (provider_name, vcpus), aws_shapes in sorted(self._by_vcpus.items()):
+            if provider_name != "AWS":
+                continue
+            for aws_shape in aws_shapes:
+                if spot_only and not aws_shape.supports_spot:
+                    continue
+                azure_shapes = self.find(
+                    vcpus=vcpus,
+                    min_memory=aws_shape.memory_gib * (1 - memory_tolerance),
+                    max_memory=aws_shape.memory_gib * (1 + memory_tolerance),
+                    provider="Azure",
+                    gpus=aws_shape.gpus,
+                    spot_only=spot_only,
+                )
+                azure_shapes.sort(
+                    key=lambda shape: abs(shape.memory_mib - aws_shape.memory_mib)
+                )
+                pairs.extend((aws_shape, azure_shape) for azure_shape in azure_shapes)
+
+        return pairs
+
+    def _build_indexes(self, shapes: list[Instance_Shape]):
+        self.shapes = shapes
+        self._by_vcpus = {}
+        self._by_name = {}
+        for shape in sorted(shapes, key=lambda shape: shape.memory_mib):
+            self._by_vcpus.setdefault((shape.provider, shape.vcpus), []).append(shape)
+            self._by_name[(shape.provider, shape.name)] = shape
+        self._memory_keys = {
+            key: [shape.memory_mib for shape in shapes]
+            for key, shapes in self._by_vcpus.items()
+        }
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as file:
+                data = json.load(file)
+            self.refreshed_at = datetime.fromisoformat(data["refreshed_at"])
+            self._build_indexes(
+                [Instance_Shape.from_dict(shape) for shape in data["shapes"]]
+            )
+        except (OSError, ValueError, KeyError) as ex:
+            print("Failed to load instance catalog", ex)
+            self.refreshed_at = None
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # write to a temporary file first so a crash never leaves a partial catalog.
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(
+                {
+                    "refreshed_at": self.refreshed_at.isoformat()
+                    if self.refreshed_at
+                    else None,
+                    "shapes": [shape.to_dict() for shape in self.shapes],
+                },
+                file,
+            )
+        os.replace(temp_path, self.path)
+
+
+if __name__ == "__main__":
+    from AWS.ec2_wrapper import EC2_Wrapper
+    from Azure.vm_wrapper import Azure_VM_Wrapper
+    from shared.config import get_config
+
+    config = get_config()
+    subscription_id = config.azure_subscription_id
+    resource_group_name = config.azure_resource_group_name
+    if subscription_id and resource_group_name:
+        catalog = Instance_Catalog(
+            providers=[
+                EC2_Wrapper(),
+                Azure_VM_Wrapper(subscription_id, resource_group_name),
+            ]
+        )
+        print(catalog.find(vcpus=16, min_memory=60, max_memory=70))
+        for aws_shape, azure_shape in catalog.pair_equivalent_shapes()[:20]:
+            print(aws_shape.name, "<->", azure_shape.name)
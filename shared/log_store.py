@@ -0,0 +1,130 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from shared.log import Log
+
+DEFAULT_LOG_PATH = os.path.join(".cache", "logs.db")
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+class Log_Store:
+    def __init__(self, path: str = DEFAULT_LOG_PATH):
+        """
+        Keeps a local copy of log_table in SQLite, so reports over months of
+        5-minute windows read from disk instead of DynamoDB. Log ids only grow,
+        so syncing only fetches the ids after the latest stored one.
+
+        :param path: the SQLite database file.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self.connection:
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS logs (
+                    id INTEGER PRIMARY KEY,
+                    start_time TEXT NOT NULL,
+                    end_time TEXT NOT NULL,
+                    virtual_machine TEXT NOT NULL,
+                    num_uploads INTEGER NOT NULL,
+                    total_uploads INTEGER NOT NULL,
+                    cost TEXT NOT NULL,
+                    total_cost TEXT NOT NULL
+                )
+                """
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS logs_start_time ON logs (start_time)"
+            )
+
+    def add(self, logs: list[Log]) -> int:
+        """
+        Writes the logs, replacing any existing log with the same id.
+
+        :param logs: the logs to write.
+        :returns: the number of logs written.
+        """
+        with self._lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO logs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        int(log.id),
+                        log.start_time,
+                        log.end_time,
+                        log.virtual_machine,
+                        int(log.num_uploads),
+                        int(log.total_uploads),
+                        str(log.cost),
+                        str(log.total_cost),
+                    )
+                    for log in logs
+                ),
+            )
+        return len(logs)
+
+    def get_latest_id(self) -> int:
+        with self._lock:
+            (latest_id,) = self.connection.execute("SELECT MAX(id) FROM logs").fetchone()
+        return latest_id or 0
+
+    def query(
+        self,
+        start_time: datetime | None = None,
+        end_time: datetime | None = None,
+        virtual_machine: str | None = None,
+    ) -> list[Log]:
+        """
+        Reads the logs whose window starts in [start_time, end_time), ordered by id.
+
+        :param start_time: the start of the range, inclusive.
+        :param end_time: the end of the range, exclusive.
+        :param virtual_machine: only read the logs of this VM (AWS or Azure).
+        """
+        conditions: list[str] = []
+        params: list[str] = []
+        if start_time is not None:
+            conditions.append("start_time >= ?")
+            params.append(_format_timestamp(start_time))
+        if end_time is not None:
+            conditions.append("start_time < ?")
+            params.append(_format_timestamp(end_time))
+        if virtual_machine is not None:
+            conditions.append("virtual_machine = ?")
+            params.append(virtual_machine)
+
+        sql = "SELECT * FROM logs"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY id"
+
+        with self._lock:
+            rows = self.connection.execute(sql, params).fetchall()
+        return [
+            Log(
+                id=row[0],
+                start_time=row[1],
+                end_time=row[2],
+                virtual_machine=row[3],
+                num_uploads=row[4],
+                total_uploads=row[5],
+                cost=Decimal(row[6]),
+                total_cost=Decimal(row[7]),
+            )
+            for row in rows
+        ]
+
+    def close(self):
+        self.connection.close()
+
+
+def _format_timestamp(timestamp: datetime) -> str:
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc)
+    return timestamp.strftime(TIMESTAMP_FORMAT)
@@ -0,0 +1,143 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+from shared.types.metric_point import Metric_Point
+
+DEFAULT_METRICS_PATH = os.path.join(".cache", "metrics.db")
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+class Metrics_Store:
+    def __init__(self, path: str = DEFAULT_METRICS_PATH):
+        """
+        Stores the metric datapoints of every provider in one local SQLite table,
+        keyed by (provider, resource, metric, timestamp). Re-ingesting a window
+        overwrites its datapoints, so ingestion can overlap safely.
+
+        :param path: the SQLite database file.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self.connection:
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS metrics (
+                    provider TEXT NOT NULL,
+                    resource TEXT NOT NULL,
+                    metric TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    value REAL NOT NULL,
+                    PRIMARY KEY (provider, resource, metric, timestamp)
+                ) WITHOUT ROWID
+                """
+            )
+
+    def add(self, metric_points: list[Metric_Point]) -> int:
+        """
+        Writes the datapoints, replacing any existing datapoint at the same key.
+
+        :param metric_points: the datapoints to write.
+        :returns: the number of datapoints written.
+        """
+        with self._lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO metrics VALUES (?, ?, ?, ?, ?)",
+                (
+                    (
+                        point.provider,
+                        point.resource,
+                        point.metric,
+                        _format_timestamp(point.timestamp),
+                        point.value,
+                    )
+                    for point in metric_points
+                ),
+            )
+        return len(metric_points)
+
+    def get_latest_timestamps(self, provider: str) -> dict[tuple[str, str], datetime]:
+        """
+        Gets the latest stored timestamp of every (resource, metric) of a provider.
+
+        :param provider: AWS or Azure.
+        """
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT resource, metric, MAX(timestamp) FROM metrics "
+                "WHERE provider = ? GROUP BY resource, metric",
+                (provider,),
+            ).fetchall()
+        return {
+            (resource, metric): _parse_timestamp(timestamp)
+            for resource, metric, timestamp in rows
+        }
+
+    def query(
+        self,
+        provider: str | None = None,
+        resource: str | None = None,
+        metric: str | None = None,
+        start_time: datetime | None = None,
+        end_time: datetime | None = None,
+    ) -> list[Metric_Point]:
+        """
+        Reads the datapoints matching every given filter, ordered by time.
+
+        :param provider: AWS or Azure.
+        :param resource: the instance id or VM name.
+        :param metric: the shared metric name.
+        :param start_time: the start of the window, inclusive.
+        :param end_time: the end of the window, inclusive.
+        """
+        conditions: list[str] = []
+        params: list[str] = []
+        for column, value in (
+            ("provider", provider),
+            ("resource", resource),
+            ("metric", metric),
+        ):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if start_time is not None:
+            conditions.append("timestamp >= ?")
+            params.append(_format_timestamp(start_time))
+        if end_time is not None:
+            conditions.append("timestamp <= ?")
+            params.append(_format_timestamp(end_time))
+
+        sql = "SELECT provider, resource, metric, timestamp, value FROM metrics"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY timestamp"
+
+        with self._lock:
+            rows = self.connection.execute(sql, params).fetchall()
+        return [
+            Metric_Point(
+                provider=row[0],
+                resource=row[1],
+                metric=row[2],
+                timestamp=_parse_timestamp(row[3]),
+                value=row[4],
+            )
+            for row in rows
+        ]
+
+    def close(self):
+        self.connection.close()
+
+
+def _format_timestamp(timestamp: datetime) -> str:
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc)
+    return timestamp.strftime(TIMESTAMP_FORMAT)
+
+
+def _parse_timestamp(timestamp: str) -> datetime:
+    return datetime.strptime(timestamp, TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc)
@@ -0,0 +1,342 @@
+import os
+import csv
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterable, Iterator, Mapping, Sequence
+
+Row = Mapping[str, Any]
+Columns = Mapping[str, Sequence[Any]]
+
+# rows are buffered in batches of this size before being handed to Arrow,
+# which bounds the memory used while streaming large sweeps.
+DEFAULT_BATCH_SIZE = 65536
+
+FILE_EXTENSIONS = {"csv": "csv", "parquet": "parquet", "arrow": "arrow"}
+
+# at most this many batches are held back while an undeclared column has only
+# been None, after which such columns are written as NULL_FALLBACK_TYPE.
+MAX_HELD_BATCHES = 4
+NULL_FALLBACK_TYPE = "string"
+
+
+class Output_Writer:
+    def __init__(
+        self,
+        fieldnames: list[str],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        field_types: Mapping[str, str] | None = None,
+    ):
+        """
+        Initializes the output writer. Rows can be passed either as an iterable
+        of dictionaries (streamed, never fully materialized) or as a columnar
+        mapping of column name to a sequence of values.
+
+        :param fieldnames: the ordered list of columns to write.
+        :param batch_size: the number of rows buffered per Arrow record batch.
+        :param field_types: the Arrow type of each column (e.g. float64, string,
+            timestamp[us]) for parquet and arrow output. Columns left out are
+            inferred from the rows.
+        """
+        self.fieldnames = fieldnames
+        self.batch_size = batch_size
+        self.field_types = dict(field_types or {})
+
+    def write(
+        self,
+        filename: str,
+        rows: Iterable[Row] | Columns,
+        format: str = "csv",
+        compression: str = "zstd",
+    ) -> int:
+        """
+        Writes the rows to the file in the requested format.
+
+        :param filename: the path of the file to write.
+        :param rows: an iterable of rows or a columnar mapping.
+        :param format: one of csv, parquet or arrow.
+        :param compression: the codec used for parquet and arrow output.
+        :returns: the number of rows written.
+        """
+        if format == "csv":
+            return self.write_csv(filename, rows)
+        if format == "parquet":
+            return self.write_parquet(filename, rows, compression=compression)
+        if format == "arrow":
+            return self.write_arrow(filename, rows, compression=compression)
+        raise ValueError(f"Unsupported output format {format}")
+
+    def write_csv(self, filename: str, rows: Iterable[Row] | Columns) -> int:
+        """
+        Streams the rows to a CSV file one row at a time.
+
+        :param filename: the path of the CSV file to write.
+        :param rows: an iterable of rows or a columnar mapping.
+        :returns: the number of rows written.
+        """
+        num_rows = 0
+        with open(filename, "w", newline="") as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=self.fieldnames)
+            writer.writeheader()
+            for row in self._iter_rows(rows):
+                writer.writerow(row)
+                num_rows += 1
+        return num_rows
+
+    def write_parquet(
+        self, filename: str, rows: Iterable[Row] | Columns, compression: str = "zstd"
+    ) -> int:
+        """
+        Streams the rows to a compressed Parquet file, one row group per batch.
+
+        :param filename: the path of the Parquet file to write.
+        :param rows: an iterable of rows or a columnar mapping.
+        :param compression: the Parquet compression codec.
+        :returns: the number of rows written.
+        """
+        import pyarrow.parquet as pq
+
+        writer = None
+        num_rows = 0
+        try:
+            for batch in self._iter_record_batches(rows):
+                if writer is None:
+                    writer = pq.ParquetWriter(
+                        filename, batch.schema, compression=compression
+                    )
+                writer.write_batch(batch)
+                num_rows += batch.num_rows
+        finally:
+            if writer is not None:
+                writer.close()
+
+        if writer is None:
+            # no rows, still leave a valid file with the expected columns.
+            pq.write_table(self._empty_table(), filename, compression=compression)
+        return num_rows
+
+    def write_arrow(
+        self, filename: str, rows: Iterable[Row] | Columns, compression: str = "zstd"
+    ) -> int:
+        """
+        Streams the rows to a compressed Arrow IPC (Feather v2) file.
+
+        :param filename: the path of the Arrow file to write.
+        :param rows: an iterable of rows or a columnar mapping.
+        :param compression: the IPC buffer compression codec (zstd or lz4).
+        :returns: the number of rows written.
+        """
+        import pyarrow as pa
+
+        options = pa.ipc.IpcWriteOptions(compression=compression)
+        writer = None
+        num_rows = 0
+        with pa.OSFile(filename, "wb") as sink:
+            try:
+                for batch in self._iter_record_batches(rows):
+                    if writer is None:
+                        writer = pa.ipc.new_file(sink, batch.schema, options=options)
+                    writer.write_batch(batch)
+                    num_rows += batch.num_rows
+                if writer is None:
+                    writer = pa.ipc.new_file(
+                        sink, self._empty_table().schema, options=options
+                    )
+            finally:
+                if writer is not None:
+                    writer.close()
+        return num_rows
+
+    def write_partitioned(
+        self,
+        directory: str,
+        partitions: Mapping[tuple[str, ...], Iterable[Row] | Columns],
+        partition_by: Sequence[str],
+        format: str = "csv",
+        compression: str = "zstd",
+        max_workers: int = 4,
+    ) -> dict[tuple[str, ...], str]:
+        """
+        Writes one file per partition, in parallel, using a hive-style layout
+        such as directory/aws_instance=m4.large/azure_vm=Standard_D2_v4/part-0.csv.
+
+        :param directory: the root directory of the partitioned output.
+        :param partitions: a mapping of partition key to the rows of that partition.
+        :param partition_by: the column name of each element in the partition key.
+        :param format: one of csv, parquet or arrow.
+        :param compression: the codec used for parquet and arrow output.
+        :param max_workers: the number of partitions written concurrently.
+        :returns: a mapping of partition key to the path of the written file.
+        """
+        extension = FILE_EXTENSIONS.get(format)
+        if extension is None:
+            raise ValueError(f"Unsupported output format {format}")
+
+        paths: dict[tuple[str, ...], str] = {}
+        for key in partitions:
+            if len(key) != len(partition_by):
+                raise ValueError(f"Partition key {key} does not match {partition_by}")
+            partition_dir = os.path.join(
+                directory,
+                *(f"{name}={value}" for name, value in zip(partition_by, key)),
+            )
+            os.makedirs(partition_dir, exist_ok=True)
+            paths[key] = os.path.join(partition_dir, f"part-0.{extension}")
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(
+                    self.write, paths[key], rows, format=format, compression=compression
+                )
+                for key, rows in partitions.items()
+            ]
+            for future in futures:
+                # surfaces the first failed partition.
+                future.result()
+
+        return paths
+
+    def _iter_rows(self, rows: Iterable[Row] | Columns) -> Iterator[Row]:
+        """
+        Yields the rows one at a time, transposing columnar input lazily.
+
+        :param rows: an iterable of rows or a columnar mapping.
+        """
+        if isinstance(rows, Mapping):
+            columns = [rows[name] for name in self.fieldnames]
+            for values in zip(*columns):
+                yield dict(zip(self.fieldnames, values))
+        else:
+            yield from rows
+
+    def _iter_record_batches(self, rows: Iterable[Row] | Columns):
+        """
+        Yields Arrow record batches of at most batch_size rows. Columnar input
+        is sliced without being transposed into rows.
+
+        Every batch has the same schema, since Parquet and Arrow files have
+        one. Columns without a declared type are inferred. While such a column
+        has only been None it is typed null, so up to MAX_HELD_BATCHES batches
+        are held back until it has a value. The schema is then fixed with
+        undeclared integer columns widened to float64, so a later float still
+        fits, and columns that stayed None typed NULL_FALLBACK_TYPE. Every
+        batch is cast to it.
+
+        :param rows: an iterable of rows or a columnar mapping.
+        """
+        import pyarrow as pa
+
+        schema = None
+        held: list[pa.RecordBatch] = []
+        for columns in self._iter_column_chunks(rows):
+            batch = self._to_record_batch(columns)
+            if schema is not None:
+                yield _cast(batch, schema)
+                continue
+
+            held.append(batch)
+            unified = pa.unify_schemas(
+                [batch.schema for batch in held], promote_options="permissive"
+            )
+            if len(held) >= MAX_HELD_BATCHES or not any(
+                pa.types.is_null(field.type) for field in unified
+            ):
+                schema = self._fix_schema(unified)
+                yield from (_cast(batch, schema) for batch in held)
+                held = []
+
+        if held:
+            schema = self._fix_schema(
+                pa.unify_schemas(
+                    [batch.schema for batch in held], promote_options="permissive"
+                )
+            )
+            yield from (_cast(batch, schema) for batch in held)
+
+    def _fix_schema(self, schema):
+        """
+        Widens the inferred types of a schema so later batches can be cast to it.
+        """
+        import pyarrow as pa
+
+        fields = []
+        for field in schema:
+            if field.name not in self.field_types:
+                if pa.types.is_null(field.type):
+                    field = field.with_type(pa.type_for_alias(NULL_FALLBACK_TYPE))
+                elif pa.types.is_integer(field.type):
+                    field = field.with_type(pa.float64())
+            fields.append(field)
+        return pa.schema(fields)
+
+    def _iter_column_chunks(self, rows: Iterable[Row] | Columns) -> Iterator[Columns]:
+        """
+        Yields the rows as columns of at most batch_size rows each.
+
+        :param rows: an iterable of rows or a columnar mapping.
+        """
+        if isinstance(rows, Mapping):
+            num_rows = len(rows[self.fieldnames[0]]) if self.fieldnames else 0
+            for offset in range(0, num_rows, self.batch_size):
+                yield {
+                    name: rows[name][offset : offset + self.batch_size]
+                    for name in self.fieldnames
+                }
+            return
+
+        iterator = iter(rows)
+        while True:
+            chunk = list(islice(iterator, self.batch_size))
+            if not chunk:
+                return
+            yield {name: [row.get(name) for row in chunk] for name in self.fieldnames}
+
+    def _to_record_batch(self, columns: Columns):
+        """
+        Converts the columns to a record batch, with the declared types and
+        the others inferred.
+        """
+        import pyarrow as pa
+
+        return pa.RecordBatch.from_arrays(
+            [
+                pa.array(
+                    columns[name],
+                    type=(
+                        pa.type_for_alias(self.field_types[name])
+                        if name in self.field_types
+                        else None
+                    ),
+                )
+                for name in self.fieldnames
+            ],
+            names=self.fieldnames,
+        )
+
+    def _empty_table(self):
+        import pyarrow as pa
+
+        return pa.table(
+            {
+                name: pa.array(
+                    [],
+                    type=(
+                        pa.type_for_alias(self.field_types[name])
+                        if name in self.field_types
+                        else pa.null()
+                    ),
+                )
+                for name in self.fieldnames
+            }
+        )
+
+
+def _cast(batch, schema):
+    """
+    Casts a record batch to a schema whose types it can be promoted to.
+    """
+    import pyarrow as pa
+
+    return pa.RecordBatch.from_arrays(
+        [column.cast(field.type) for column, field in zip(batch.columns, schema)],
+        schema=schema,
+    )
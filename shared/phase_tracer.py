@@ -0,0 +1,135 @@
+import os
+import json
+import math
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from typing import Any, ContextManager, Iterator
+
+DEFAULT_TRACE_PATH = os.path.join(".cache", "traces", "run_simulation.json")
+# at ~150 bytes per event this bounds the buffer to a few dozen MB.
+DEFAULT_MAX_EVENTS = 200_000
+
+
+class Phase_Tracer:
+    def __init__(self, sample_rate: float = 1.0, max_events: int = DEFAULT_MAX_EVENTS):
+        """
+        Records how long each phase of a control loop iteration takes, as a
+        Chrome trace (the JSON format chrome://tracing and ui.perfetto.dev open).
+        Every phase becomes a complete event on the thread that ran it, so
+        tasks running concurrently show up as parallel tracks under the
+        iteration that dispatched them.
+
+        Iterations are sampled deterministically, e.g. a sample_rate of 0.1
+        traces every 10th iteration. Phases of unsampled iterations cost a
+        single attribute check.
+
+        :param sample_rate: the fraction of iterations traced, 0 disables tracing.
+        :param max_events: the number of events kept, older events are dropped first.
+        """
+        self.sample_rate = sample_rate
+        self.max_events = max_events
+        self.iterations = 0
+        self._sampled = False
+        self._events: deque[dict[str, Any]] = deque(maxlen=max_events)
+        self._thread_names: dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._origin_ns = time.perf_counter_ns()
+        self._pid = os.getpid()
+
+    @property
+    def sampled(self) -> bool:
+        """
+        Whether the current iteration is traced.
+        """
+        return self._sampled
+
+    def iteration(self, **args: Any) -> ContextManager[None]:
+        """
+        Marks one iteration of the loop, deciding whether its phases are traced.
+
+        :param args: shown with the iteration event, e.g. the current VM.
+        """
+        index = self.iterations
+        self.iterations += 1
+        # traces iteration i when the running count of sampled iterations
+        # steps up, spreading the samples evenly from the first iteration on.
+        self._sampled = math.floor(index * self.sample_rate) > math.floor(
+            (index - 1) * self.sample_rate
+        )
+        if not self._sampled:
+            return nullcontext()
+        return self._record("iteration", {"iteration": index, **args})
+
+    def phase(self, name: str, **args: Any) -> ContextManager[None]:
+        """
+        Times one phase of the current iteration.
+
+        :param name: the phase, e.g. state_check or remote_exec.
+        :param args: shown with the event, e.g. the VM or article id.
+        """
+        if not self._sampled:
+            return nullcontext()
+        return self._record(name, args)
+
+    @contextmanager
+    def _record(self, name: str, args: dict[str, Any]) -> Iterator[None]:
+        start_ns = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            end_ns = time.perf_counter_ns()
+            thread = threading.current_thread()
+            event = {
+                "name": name,
+                "ph": "X",
+                "ts": (start_ns - self._origin_ns) / 1000,
+                "dur": (end_ns - start_ns) / 1000,
+                "pid": self._pid,
+                "tid": thread.ident,
+                "args": args,
+            }
+            with self._lock:
+                self._events.append(event)
+                self._thread_names.setdefault(thread.ident, thread.name)
+
+    def get_events(self) -> list[dict[str, Any]]:
+        """
+        Gets the recorded events, preceded by the thread name metadata events.
+        """
+        with self._lock:
+            events = list(self._events)
+            thread_names = dict(self._thread_names)
+        metadata = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": self._pid,
+                "tid": tid,
+                "args": {"name": name},
+            }
+            for tid, name in thread_names.items()
+        ]
+        return metadata + events
+
+    def write(self, path: str = DEFAULT_TRACE_PATH):
+        """
+        Writes the trace as a Chrome trace JSON file.
+
+        :param path: the trace file.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(
+                {"traceEvents": self.get_events(), "displayTimeUnit": "ms"}, file
+            )
+        os.replace(temp_path, path)
+
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+            self._thread_names.clear()
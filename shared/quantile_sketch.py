@@ -0,0 +1,135 @@
+import math
+from typing import Any
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+DEFAULT_MAX_BUCKETS = 2048
+
+
+class Quantile_Sketch:
+    def __init__(
+        self,
+        relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+        max_buckets: int = DEFAULT_MAX_BUCKETS,
+    ):
+        """
+        A mergeable quantile sketch for non-negative values, after DDSketch.
+        Values are counted in logarithmic buckets, so every quantile is
+        within relative_accuracy of the exact one while memory only grows
+        with the log of the value range. Two sketches with the same accuracy
+        merge by adding their bucket counts, so partial sketches from
+        worker processes combine without revisiting the values.
+
+        :param relative_accuracy: the relative error of the quantiles, e.g. 0.01.
+        :param max_buckets: the number of buckets kept. Beyond it the lowest
+            buckets are collapsed, which only affects the lowest quantiles.
+        """
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets: dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float, count: int = 1):
+        """
+        Adds a value to the sketch.
+
+        :param value: a non-negative value.
+        :param count: how many times the value occurred.
+        """
+        if value < 0:
+            raise ValueError("Quantile_Sketch only accepts non-negative values")
+        if value == 0:
+            self.zero_count += count
+        else:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self.buckets[index] = self.buckets.get(index, 0) + count
+            if len(self.buckets) > self.max_buckets:
+                self._collapse()
+        self.count += count
+        self.sum += value * count
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: "Quantile_Sketch"):
+        """
+        Adds the values of another sketch with the same relative accuracy.
+        """
+        if other.gamma != self.gamma:
+            raise ValueError("Only sketches with the same relative accuracy can be merged")
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        if len(self.buckets) > self.max_buckets:
+            self._collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float | None:
+        """
+        Estimates the q-quantile, e.g. 0.99 for the 99th percentile.
+
+        :returns: the estimate, or None if the sketch is empty.
+        """
+        if self.count == 0:
+            return None
+        if not 0 <= q <= 1:
+            raise ValueError("q must be between 0 and 1")
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+
+        seen = self.zero_count
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                # the bucket covers (gamma^(index-1), gamma^index], its
+                # midpoint in relative terms is within the accuracy of both ends.
+                value = 2 * self.gamma**index / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float | None:
+        return self.sum / self.count if self.count else None
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        Serializes the sketch, e.g. to store the partial result of a sweep worker.
+        """
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "max_buckets": self.max_buckets,
+            "buckets": {str(index): count for index, count in self.buckets.items()},
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "Quantile_Sketch":
+        sketch = cls(data["relative_accuracy"], data["max_buckets"])
+        sketch.buckets = {int(index): count for index, count in data["buckets"].items()}
+        sketch.zero_count = data["zero_count"]
+        sketch.count = data["count"]
+        sketch.sum = data["sum"]
+        sketch.min = data["min"] if data["min"] is not None else math.inf
+        sketch.max = data["max"] if data["max"] is not None else -math.inf
+        return sketch
+
+    def _collapse(self):
+        # folds the lowest buckets into one, the higher quantiles keep their accuracy.
+        indices = sorted(self.buckets)
+        excess = indices[: len(indices) - self.max_buckets + 1]
+        for index in excess[:-1]:
+            self.buckets[excess[-1]] += self.buckets.pop(index)
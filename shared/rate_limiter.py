@@ -0,0 +1,53 @@
+import time
+import threading
+
+
+class Rate_Limiter:
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        A thread-safe token bucket. Callers block in acquire until a token is
+        available. When the remote API reports that the quota is exhausted,
+        pause stops every caller until the quota window has passed.
+
+        :param rate: the sustained number of requests per second.
+        :param burst: the number of requests that can be sent back to back.
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until a request can be sent.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self._paused_until:
+                    self._tokens = min(
+                        self.burst, self._tokens + (now - self._updated_at) * self.rate
+                    )
+                    self._updated_at = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+                else:
+                    wait = self._paused_until - now
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """
+        Stops all requests for the given number of seconds, e.g. from a
+        Retry-After header, and drains the bucket so requests resume gradually.
+
+        :param seconds: how long to stop sending requests.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._tokens = 0
+            self._updated_at = self._paused_until
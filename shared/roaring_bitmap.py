@@ -0,0 +1,292 @@
+from typing import Iterator
+
+import numpy as np
+
+# the low 16 bits of a value index into its container, the high 16 bits pick the container.
+CONTAINER_BITS = 16
+CONTAINER_SIZE = 1 << CONTAINER_BITS
+LOW_MASK = CONTAINER_SIZE - 1
+MAX_VALUE = (1 << 32) - 1
+# an array container holds at most this many values, beyond it a bitmap is smaller.
+MAX_ARRAY_SIZE = 4096
+BITMAP_WORDS = CONTAINER_SIZE // 64
+
+ARRAY = 0
+BITMAP = 1
+RUN = 2
+
+# the descriptor of each serialized container, its payload length is in uint16s.
+DESCRIPTOR = np.dtype([("key", "<u2"), ("type", "u1"), ("pad", "u1"), ("length", "<u4")])
+ALL_ONES_INT = 0xFFFFFFFFFFFFFFFF
+ALL_ONES = np.uint64(ALL_ONES_INT)
+
+
+class Roaring_Bitmap:
+    def __init__(self):
+        """
+        A compressed set of 32-bit unsigned integers, after Roaring bitmaps.
+        Values are split into containers of 65536 by their high 16 bits. A
+        sparse container is a sorted array of its low 16 bits, a dense one
+        a 8 KiB bitmap, and on disk a container of long runs is stored as
+        (start, length - 1) pairs.
+
+        Deserialized containers stay views of the serialized bytes until
+        they are first used, so loading tens of millions of values only
+        parses the descriptors.
+        """
+        # key -> sorted uint16 array or uint64 bitmap, or (type, payload) until first used.
+        self._containers: dict[int, np.ndarray | tuple[int, np.ndarray]] = {}
+
+    def add(self, value: int) -> bool:
+        """
+        :returns: whether the value was not in the bitmap yet.
+        """
+        key, low = _split(value)
+        container = self._get(key)
+        if container is None:
+            self._containers[key] = np.array([low], dtype=np.uint16)
+            return True
+        if container.dtype == np.uint64:
+            word, bit = low >> 6, np.uint64(1 << (low & 63))
+            if container[word] & bit:
+                return False
+            container[word] |= bit
+            return True
+
+        index = int(np.searchsorted(container, low))
+        if index < len(container) and container[index] == low:
+            return False
+        container = np.insert(container, index, low)
+        self._containers[key] = (
+            _to_bitmap(container) if len(container) > MAX_ARRAY_SIZE else container
+        )
+        return True
+
+    def discard(self, value: int) -> bool:
+        """
+        :returns: whether the value was in the bitmap.
+        """
+        key, low = _split(value)
+        container = self._get(key)
+        if container is None:
+            return False
+        if container.dtype == np.uint64:
+            word, bit = low >> 6, np.uint64(1 << (low & 63))
+            if not container[word] & bit:
+                return False
+            container[word] &= ~bit
+            return True
+
+        index = int(np.searchsorted(container, low))
+        if index == len(container) or container[index] != low:
+            return False
+        if len(container) == 1:
+            del self._containers[key]
+        else:
+            self._containers[key] = np.delete(container, index)
+        return True
+
+    def __contains__(self, value: int) -> bool:
+        key, low = _split(value)
+        container = self._get(key)
+        if container is None:
+            return False
+        if container.dtype == np.uint64:
+            return bool((container[low >> 6] >> np.uint64(low & 63)) & np.uint64(1))
+        index = int(np.searchsorted(container, low))
+        return index < len(container) and container[index] == low
+
+    def __len__(self) -> int:
+        return sum(
+            _cardinality(self._get(key)) for key in list(self._containers)  # type: ignore[arg-type]
+        )
+
+    def __iter__(self) -> Iterator[int]:
+        """
+        Yields the values in ascending order.
+        """
+        for key in sorted(self._containers):
+            container = self._get(key)
+            if container is None:
+                continue
+            lows = (
+                np.flatnonzero(_to_bits(container))
+                if container.dtype == np.uint64
+                else container
+            )
+            base = key << CONTAINER_BITS
+            yield from (base | low for low in lows.tolist())
+
+    def next_absent(self, value: int) -> int:
+        """
+        Finds the smallest value at or after the given one that is not in
+        the bitmap, skipping full containers without visiting their values.
+        """
+        key, low = _split(value)
+        while key < CONTAINER_SIZE:
+            container = self._get(key)
+            if container is None:
+                return (key << CONTAINER_BITS) | low
+            absent = _next_absent(container, low)
+            if absent is not None:
+                return (key << CONTAINER_BITS) | absent
+            key, low = key + 1, 0
+        return MAX_VALUE + 1
+
+    def to_bytes(self) -> bytes:
+        """
+        Serializes the bitmap, each container in whichever of the array,
+        bitmap or run encodings is smallest.
+        """
+        encoded = []
+        for key in sorted(self._containers):
+            container = self._containers[key]
+            # containers never used since they were loaded are written back as they are.
+            container_type, payload = (
+                container if isinstance(container, tuple) else _encode(container)
+            )
+            # a bitmap whose values were all discarded is left out.
+            if len(payload):
+                encoded.append((key, container_type, payload.astype("<u2", copy=False)))
+        descriptors = np.zeros(len(encoded), dtype=DESCRIPTOR)
+        payloads = []
+        for i, (key, container_type, payload) in enumerate(encoded):
+            descriptors[i] = (key, container_type, 0, len(payload))
+            payloads.append(payload)
+        header = np.array([len(encoded)], dtype="<u4").tobytes()
+        return b"".join(
+            [header, descriptors.tobytes()] + [payload.tobytes() for payload in payloads]
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes | memoryview, offset: int = 0) -> tuple["Roaring_Bitmap", int]:
+        """
+        Deserializes a bitmap written by to_bytes.
+
+        :param data: the serialized bytes.
+        :param offset: where the bitmap starts in data.
+        :returns: the bitmap and the offset just after it.
+        """
+        bitmap = cls()
+        (num_containers,) = np.frombuffer(data, dtype="<u4", count=1, offset=offset)
+        offset += 4
+        descriptors = np.frombuffer(
+            data, dtype=DESCRIPTOR, count=int(num_containers), offset=offset
+        )
+        offset += descriptors.nbytes
+        payload = np.frombuffer(
+            data, dtype="<u2", count=int(descriptors["length"].sum()), offset=offset
+        )
+        ends = np.cumsum(descriptors["length"], dtype=np.int64)
+        for key, container_type, start, end in zip(
+            descriptors["key"].tolist(),
+            descriptors["type"].tolist(),
+            (ends - descriptors["length"]).tolist(),
+            ends.tolist(),
+        ):
+            bitmap._containers[key] = (container_type, payload[start:end])
+        return bitmap, offset + payload.nbytes
+
+    def _get(self, key: int) -> np.ndarray | None:
+        container = self._containers.get(key)
+        if isinstance(container, tuple):
+            container = _decode(*container)
+            self._containers[key] = container
+        return container
+
+
+def _split(value: int) -> tuple[int, int]:
+    if not 0 <= value <= MAX_VALUE:
+        raise ValueError(f"Roaring_Bitmap only holds values from 0 to {MAX_VALUE}")
+    return value >> CONTAINER_BITS, value & LOW_MASK
+
+
+def _to_bitmap(values: np.ndarray) -> np.ndarray:
+    bits = np.zeros(CONTAINER_SIZE, dtype=np.uint8)
+    bits[values] = 1
+    return np.packbits(bits, bitorder="little").view(np.uint64)
+
+
+def _to_bits(bitmap: np.ndarray) -> np.ndarray:
+    return np.unpackbits(bitmap.view(np.uint8), bitorder="little")
+
+
+def _cardinality(container: np.ndarray) -> int:
+    if container.dtype == np.uint64:
+        return int(_to_bits(container).sum())
+    return len(container)
+
+
+def _next_absent(container: np.ndarray, low: int) -> int | None:
+    if container.dtype == np.uint64:
+        # the absent values of the word holding low, from low on.
+        word = low >> 6
+        absent = ~int(container[word]) & (ALL_ONES_INT << (low & 63)) & ALL_ONES_INT
+        if not absent:
+            not_full = np.flatnonzero(container[word + 1 :] != ALL_ONES)
+            if not len(not_full):
+                return None
+            word += 1 + int(not_full[0])
+            absent = ~int(container[word]) & ALL_ONES_INT
+        # the index of the lowest set bit.
+        return (word << 6) + (absent & -absent).bit_length() - 1
+
+    index = int(np.searchsorted(container, low))
+    values = container[index:].astype(np.int64)
+    # the values from low on are consecutive up to the first absent one.
+    gaps = np.flatnonzero(values != low + np.arange(len(values)))
+    absent = low + (int(gaps[0]) if len(gaps) else len(values))
+    return absent if absent < CONTAINER_SIZE else None
+
+
+def _encode(container: np.ndarray) -> tuple[int, np.ndarray]:
+    if container.dtype == np.uint64:
+        bits = _to_bits(container).astype(np.int8)
+        values = None
+        cardinality = int(bits.sum())
+    else:
+        bits = None
+        values = container
+        cardinality = len(container)
+
+    if bits is not None:
+        edges = np.diff(np.concatenate(([0], bits, [0])))
+        starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    else:
+        breaks = np.flatnonzero(np.diff(values.astype(np.int64)) != 1) + 1
+        starts = np.concatenate(([0], breaks))
+        ends = np.concatenate((breaks, [len(values)]))
+        starts, ends = values[starts].astype(np.int64), values[ends - 1].astype(np.int64) + 1
+
+    # sizes in uint16s: 2 per run, 1 per array value, 4096 for a bitmap.
+    run_size = 2 * len(starts)
+    array_size = cardinality if cardinality <= MAX_ARRAY_SIZE else None
+    bitmap_size = BITMAP_WORDS * 4
+    if run_size < min(array_size or bitmap_size, bitmap_size):
+        runs = np.empty(run_size, dtype=np.uint16)
+        runs[0::2], runs[1::2] = starts, ends - starts - 1
+        return RUN, runs
+    if array_size is not None:
+        return ARRAY, values if values is not None else np.flatnonzero(bits).astype(np.uint16)
+    return BITMAP, (container if bits is not None else _to_bitmap(values)).view(np.uint16)
+
+
+def _decode(container_type: int, payload: np.ndarray) -> np.ndarray:
+    if container_type == ARRAY:
+        return payload.astype(np.uint16)
+    if container_type == BITMAP:
+        # copied so the container can be changed without touching the read buffer.
+        return payload.view(np.uint64).copy()
+
+    starts = payload[0::2].astype(np.int64)
+    ends = starts + payload[1::2] + 1
+    if int((ends - starts).sum()) <= MAX_ARRAY_SIZE:
+        return np.concatenate(
+            [np.arange(start, end, dtype=np.uint16) for start, end in zip(starts, ends)]
+            or [np.empty(0, dtype=np.uint16)]
+        )
+    edges = np.zeros(CONTAINER_SIZE + 1, dtype=np.int32)
+    np.add.at(edges, starts, 1)
+    np.add.at(edges, ends, -1)
+    bits = (np.cumsum(edges[:CONTAINER_SIZE]) > 0).astype(np.uint8)
+    return np.packbits(bits, bitorder="little").view(np.uint64)
@@ -0,0 +1,11 @@
+from datetime import datetime, timezone
+
+
+def to_naive_utc(time: datetime) -> datetime:
+    """
+    Converts a time to naive UTC so aware and naive price timestamps can be
+    compared. Naive times are taken to be UTC already.
+    """
+    if time.tzinfo is None:
+        return time
+    return time.astimezone(timezone.utc).replace(tzinfo=None)
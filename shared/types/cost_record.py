@@ -0,0 +1,25 @@
+from datetime import datetime
+
+
+class Cost_Record:
+    def __init__(
+        self,
+        provider: str,
+        resource: str,
+        usage_type: str,
+        hour: datetime,
+        amount: float,
+        estimated: bool,
+    ):
+        self.provider = provider
+        # the instance name tag (AWS) or resource id (Azure) the cost is billed to.
+        self.resource = resource
+        self.usage_type = usage_type
+        # the start of the billed hour (or day, where hourly data is unavailable).
+        self.hour = hour
+        self.amount = amount
+        # whether the provider may still revise the amount.
+        self.estimated = estimated
+
+    def __repr__(self):
+        return f"{self.provider} {self.resource} {self.usage_type} at {self.hour}: {self.amount} (estimated: {self.estimated})"
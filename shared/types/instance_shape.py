@@ -0,0 +1,48 @@
+class Instance_Shape:
+    def __init__(
+        self,
+        provider: str,
+        name: str,
+        vcpus: int,
+        memory_mib: int,
+        gpus: int,
+        supports_spot: bool,
+        regions: list[str],
+    ):
+        self.provider = provider
+        self.name = name
+        self.vcpus = vcpus
+        self.memory_mib = memory_mib
+        self.gpus = gpus
+        self.supports_spot = supports_spot
+        self.regions = regions
+
+    @property
+    def memory_gib(self) -> float:
+        return self.memory_mib / 1024
+
+    def to_dict(self) -> dict[str, str | int | bool | list[str]]:
+        return {
+            "provider": self.provider,
+            "name": self.name,
+            "vcpus": self.vcpus,
+            "memory_mib": self.memory_mib,
+            "gpus": self.gpus,
+            "supports_spot": self.supports_spot,
+            "regions": self.regions,
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> "Instance_Shape":
+        return Instance_Shape(
+            provider=data["provider"],
+            name=data["name"],
+            vcpus=data["vcpus"],
+            memory_mib=data["memory_mib"],
+            gpus=data["gpus"],
+            supports_spot=data["supports_spot"],
+            regions=data["regions"],
+        )
+
+    def __repr__(self):
+        return f"{self.provider} {self.name}: {self.vcpus} vCPUs, {self.memory_gib:g} GiB, {self.gpus} GPUs, spot: {self.supports_spot}"
@@ -0,0 +1,34 @@
+from datetime import datetime
+
+
+class Interruption_Notice:
+    def __init__(
+        self,
+        provider: str,
+        action: str,
+        time: datetime | None,
+        resource: str | None = None,
+        event_id: str | None = None,
+    ):
+        self.provider = provider
+        # what the provider will do, e.g. terminate or stop (AWS), Preempt or Terminate (Azure).
+        self.action = action
+        # when the VM is reclaimed, None if the provider did not say.
+        self.time = time
+        self.resource = resource
+        self.event_id = event_id
+
+    def __repr__(self):
+        return f"{self.provider} {self.resource or ''} {self.action} at {self.time}"
+
+
+class VMInterruptedException(Exception):
+    def __init__(self, message: str):
+        """
+        Exception raised when a command is abandoned because its VM
+        received an interruption notice.
+
+        :params message: the error message.
+        """
+        self.message = message
+        super().__init__(self.message)
@@ -0,0 +1,30 @@
+from datetime import datetime
+
+# the provider-neutral metric names shared by CloudWatch and Azure Monitor.
+CPU = "cpu"
+NETWORK_IN = "network_in"
+NETWORK_OUT = "network_out"
+DISK_READ = "disk_read"
+DISK_WRITE = "disk_write"
+CPU_CREDIT_BALANCE = "cpu_credit_balance"
+
+METRICS = [CPU, NETWORK_IN, NETWORK_OUT, DISK_READ, DISK_WRITE, CPU_CREDIT_BALANCE]
+
+
+class Metric_Point:
+    def __init__(
+        self,
+        provider: str,
+        resource: str,
+        metric: str,
+        timestamp: datetime,
+        value: float,
+    ):
+        self.provider = provider
+        self.resource = resource
+        self.metric = metric
+        self.timestamp = timestamp
+        self.value = value
+
+    def __repr__(self):
+        return f"{self.provider} {self.resource} {self.metric}: {self.value} at {self.timestamp}"
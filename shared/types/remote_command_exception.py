@@ -0,0 +1,12 @@
+class RemoteCommandException(Exception):
+    def __init__(self, message: str, stderr: str = ""):
+        """
+        Exception raised for a command that ran on a VM but did not succeed,
+        e.g. the scraper raised WebsiteNotFoundException.
+
+        :params message: the error message.
+        :params stderr: the standard error of the command.
+        """
+        self.message = message
+        self.stderr = stderr
+        super().__init__(self.message)
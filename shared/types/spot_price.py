@@ -1,10 +1,13 @@
 from datetime import datetime
-from mypy_boto3_ec2.literals import InstanceTypeType
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from mypy_boto3_ec2.literals import InstanceTypeType
 
 class Spot_Price():
     def __init__(
             self, 
-            vm_type: str | InstanceTypeType, 
+            vm_type: "str | InstanceTypeType", 
             price: float,
             timestamp: datetime
         ):
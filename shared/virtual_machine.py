@@ -1,13 +1,21 @@
 from abc import ABC, abstractmethod
 from shared.types.spot_price import Spot_Price
-from mypy_boto3_ec2.literals import InstanceTypeType
+from shared.types.instance_shape import Instance_Shape
+from typing import TYPE_CHECKING
 from datetime import datetime
 
+if TYPE_CHECKING:
+    from mypy_boto3_ec2.literals import InstanceTypeType
+
+
 class Virtual_Machine(ABC):
+    # the provider label used in logs and catalogs, e.g. AWS or Azure.
+    provider_name: str
+
     @abstractmethod
     def get_spot_price_history(  
             self,           
-            vm_type: str | InstanceTypeType,
+            vm_type: "str | InstanceTypeType",
             start_time: datetime,
             end_time: datetime,
             region: str | None
@@ -17,8 +25,15 @@ class Virtual_Machine(ABC):
     @abstractmethod
     def get_spot_price(
         self,
-        vm_type: str | InstanceTypeType,
+        vm_type: "str | InstanceTypeType",
         vm_name: str | None,
         region: str | None,
     ) -> Spot_Price | None:
-        pass
\ No newline at end of file
+        pass
+
+    @abstractmethod
+    def list_instance_shapes(
+        self,
+        regions: list[str] | None,
+    ) -> list[Instance_Shape]:
+        pass